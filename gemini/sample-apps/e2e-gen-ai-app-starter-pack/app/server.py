@@ -14,19 +14,27 @@
 # pylint: disable=W0718, C0411
 # ruff: noqa: I001
 
-import json
 import logging
 import os
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Optional
 import uuid
 
 from app.chain import chain
-from app.utils.input_types import Feedback, Input, InputChat, default_serialization
+from app.utils.input_types import Feedback, Input, InputChat
+from app.utils.metrics import (
+    StreamMetrics,
+    StreamRecorder,
+    create_meter_provider,
+    register_exporter_metrics,
+)
 from app.utils.output_types import EndEvent, Event
+from app.utils.serialization import get_event_serializer
+from app.utils.streaming import coalesce_chunks
 from app.utils.tracing import CloudTraceLoggingSpanExporter
 from fastapi import FastAPI
 from fastapi.responses import RedirectResponse, StreamingResponse
 from google.cloud import logging as google_cloud_logging
+from prometheus_client import make_asgi_app
 from traceloop.sdk import Instruments, Traceloop
 
 # Default chain
@@ -54,20 +62,47 @@ app = FastAPI()
 logging_client = google_cloud_logging.Client()
 logger = logging_client.logger(__name__)
 
-# Initialize Traceloop
+# Initialize Traceloop, keeping the exporter to report its statistics
+span_exporter: Optional[CloudTraceLoggingSpanExporter] = None
 try:
+    span_exporter = CloudTraceLoggingSpanExporter()
     Traceloop.init(
         app_name="Sample Chatbot Application",
         disable_batch=False,
-        exporter=CloudTraceLoggingSpanExporter(),
+        exporter=span_exporter,
         instruments={Instruments.VERTEXAI, Instruments.LANGCHAIN},
     )
 except Exception as e:
     logging.error("Failed to initialize Traceloop: %s", e)
 
+# Streaming latency and span exporter metrics, exposed for scraping on /metrics
+meter_provider = create_meter_provider()
+stream_metrics = StreamMetrics(meter_provider)
+if span_exporter is not None:
+    register_exporter_metrics(meter_provider, span_exporter.get_stats)
+app.mount("/metrics", make_asgi_app())
+
+# Serializer of the streamed events ("fast" or "json")
+serialize_event = get_event_serializer(os.environ.get("EVENT_SERIALIZER", "fast"))
+
+# Optional coalescing of model chunks, disabled when the window is 0
+COALESCE_WINDOW_MS = float(os.environ.get("COALESCE_WINDOW_MS", 0))
+COALESCE_MAX_BYTES = int(os.environ.get("COALESCE_MAX_BYTES", 64))
+
+
+async def count_tokens(
+    events: AsyncIterator[Dict[str, Any]], recorder: StreamRecorder
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """Report the model chunks of the source events, before any coalescing."""
+    async for data in events:
+        if data["event"] == "on_chat_model_stream":
+            recorder.token()
+        yield data
+
 
 async def stream_event_response(input_chat: InputChat) -> AsyncGenerator[str, None]:
     """Stream events in response to an input chat."""
+    recorder = stream_metrics.recorder()
     run_id = uuid.uuid4()
     input_dict = input_chat.model_dump()
 
@@ -81,16 +116,28 @@ async def stream_event_response(input_chat: InputChat) -> AsyncGenerator[str, No
         }
     )
 
-    yield json.dumps(
-        Event(event="metadata", data={"run_id": str(run_id)}),
-        default=default_serialization,
-    ) + "\n"
-
-    async for data in chain.astream_events(input_dict, version="v2"):
-        if data["event"] in SUPPORTED_EVENTS:
-            yield json.dumps(data, default=default_serialization) + "\n"
-
-    yield json.dumps(EndEvent(), default=default_serialization) + "\n"
+    try:
+        yield recorder.serialize(
+            Event(event="metadata", data={"run_id": str(run_id)}),
+            serialize_event,
+        )
+
+        events = count_tokens(
+            (
+                data
+                async for data in chain.astream_events(input_dict, version="v2")
+                if data["event"] in SUPPORTED_EVENTS
+            ),
+            recorder,
+        )
+        if COALESCE_WINDOW_MS > 0:
+            events = coalesce_chunks(events, COALESCE_WINDOW_MS, COALESCE_MAX_BYTES)
+        async for data in events:
+            yield recorder.serialize(data, serialize_event)
+
+        yield recorder.serialize(EndEvent(), serialize_event)
+    finally:
+        recorder.finish()
 
 
 # Routes
@@ -0,0 +1,189 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Streaming latency metrics for the /stream_events endpoint.
+
+Every streamed response records its time to first token, the gaps between
+tokens, its total duration, its events per second and the time spent
+serializing events. The histograms are exported with the OpenTelemetry
+Prometheus exporter, so a local collector (or Prometheus) can scrape them,
+together with the upload queue depth and dropped counters of the span
+exporter.
+"""
+
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence
+
+from opentelemetry.exporter.prometheus import PrometheusMetricReader
+from opentelemetry.metrics import CallbackOptions, Observation
+from opentelemetry.sdk.metrics import Histogram, MeterProvider
+from opentelemetry.sdk.metrics.export import MetricReader
+from opentelemetry.sdk.metrics.view import ExplicitBucketHistogramAggregation, View
+
+# Bucket boundaries (in ms, except events per second) of each histogram
+HISTOGRAM_BOUNDARIES: Dict[str, Sequence[float]] = {
+    "stream.time_to_first_token": (100, 250, 500, 1000, 2000, 3000, 5000, 10000, 30000),
+    "stream.duration": (500, 1000, 2000, 3000, 5000, 10000, 20000, 30000, 60000),
+    "stream.inter_token_gap": (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+    "stream.events_per_second": (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+    "stream.serialization_time": (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 50),
+}
+
+# Statistics of CloudTraceLoggingSpanExporter.get_stats() exposed as gauges
+EXPORTER_GAUGES: Dict[str, str] = {
+    "upload_queue_depth": "Large span payloads waiting for upload to Cloud Storage",
+    "dropped_spans": "Spans which could not be written to Cloud Logging",
+    "dropped_payloads": "Large span payloads dropped because the upload queue was full",
+}
+
+
+def create_meter_provider(
+    metric_readers: Optional[Sequence[MetricReader]] = None,
+) -> MeterProvider:
+    """
+    Create a meter provider for the streaming metrics.
+
+    The provider is not registered globally, so it does not interfere with the
+    instrumentation set up by Traceloop.
+
+    :param metric_readers: Readers of the metrics, a PrometheusMetricReader by default
+    :return: The meter provider
+    """
+    views = [
+        View(
+            instrument_type=Histogram,
+            instrument_name=name,
+            aggregation=ExplicitBucketHistogramAggregation(boundaries=boundaries),
+        )
+        for name, boundaries in HISTOGRAM_BOUNDARIES.items()
+    ]
+    if metric_readers is None:
+        metric_readers = [PrometheusMetricReader()]
+    return MeterProvider(metric_readers=metric_readers, views=views)
+
+
+class StreamMetrics:
+    """Histograms describing the latency of streamed responses."""
+
+    def __init__(self, meter_provider: MeterProvider) -> None:
+        """
+        Create the histograms.
+
+        :param meter_provider: Meter provider the histograms are created with
+        """
+        meter = meter_provider.get_meter(__name__)
+        self.time_to_first_token = meter.create_histogram(
+            "stream.time_to_first_token",
+            unit="ms",
+            description="Time from the request to the first streamed token",
+        )
+        self.duration = meter.create_histogram(
+            "stream.duration",
+            unit="ms",
+            description="Time from the request to the end of the stream",
+        )
+        self.inter_token_gap = meter.create_histogram(
+            "stream.inter_token_gap",
+            unit="ms",
+            description="Time between two consecutive streamed tokens",
+        )
+        self.events_per_second = meter.create_histogram(
+            "stream.events_per_second",
+            unit="1/s",
+            description="Streamed events per second of a response",
+        )
+        self.serialization_time = meter.create_histogram(
+            "stream.serialization_time",
+            unit="ms",
+            description="Time spent serializing the events of a response",
+        )
+
+    def recorder(self) -> "StreamRecorder":
+        """Start recording a streamed response."""
+        return StreamRecorder(self)
+
+
+class StreamRecorder:
+    """
+    Records the metrics of a single streamed response.
+
+    The timings start when the recorder is created. Tokens are reported with
+    token(), events are serialized with serialize(), and the per-request
+    histograms are recorded by finish().
+    """
+
+    def __init__(self, stream_metrics: StreamMetrics) -> None:
+        self.stream_metrics = stream_metrics
+        self.start_time = time.perf_counter()
+        self.last_token_time: Optional[float] = None
+        self.num_events = 0
+        self.serialization_ms = 0.0
+
+    def serialize(self, event: Any, serializer: Callable[[Any], str]) -> str:
+        """
+        Serialize an event as a line of NDJSON, timing the serialization.
+
+        :param event: The event to serialize
+        :param serializer: Event serializer, see app/utils/serialization.py
+        :return: The serialized event, terminated by a newline
+        """
+        start = time.perf_counter()
+        line = serializer(event)
+        self.serialization_ms += (time.perf_counter() - start) * 1000
+        self.num_events += 1
+        return line
+
+    def token(self) -> None:
+        """Report that a token has been streamed."""
+        now = time.perf_counter()
+        if self.last_token_time is None:
+            self.stream_metrics.time_to_first_token.record(
+                (now - self.start_time) * 1000
+            )
+        else:
+            self.stream_metrics.inter_token_gap.record(
+                (now - self.last_token_time) * 1000
+            )
+        self.last_token_time = now
+
+    def finish(self) -> None:
+        """Record the duration, event rate and serialization time of the stream."""
+        duration_sec = time.perf_counter() - self.start_time
+        self.stream_metrics.duration.record(duration_sec * 1000)
+        if duration_sec > 0:
+            self.stream_metrics.events_per_second.record(self.num_events / duration_sec)
+        self.stream_metrics.serialization_time.record(self.serialization_ms)
+
+
+def register_exporter_metrics(
+    meter_provider: MeterProvider, get_stats: Callable[[], Dict[str, int]]
+) -> None:
+    """
+    Expose the statistics of the span exporter as observable gauges.
+
+    :param meter_provider: Meter provider the gauges are created with
+    :param get_stats: Returns the statistics, see CloudTraceLoggingSpanExporter
+    """
+    meter = meter_provider.get_meter(__name__)
+
+    def observe(name: str) -> Callable[[CallbackOptions], Iterable[Observation]]:
+        def callback(options: CallbackOptions) -> Iterable[Observation]:
+            return [Observation(get_stats()[name])]
+
+        return callback
+
+    for name, description in EXPORTER_GAUGES.items():
+        meter.create_observable_gauge(
+            f"tracing.{name}", callbacks=[observe(name)], description=description
+        )
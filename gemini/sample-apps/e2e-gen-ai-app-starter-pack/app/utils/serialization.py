@@ -0,0 +1,111 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serializers of the events streamed by /stream_events as NDJSON lines.
+
+Two serializers are available, selected by name in EVENT_SERIALIZERS:
+
+- "json": Encodes the whole event with json.dumps and default_serialization.
+- "fast": Encodes chat model chunks, by far the most frequent events, from a
+  template with only the fields read by the clients (content and
+  additional_kwargs). Other events are encoded with json.dumps, without the
+  tags, metadata and parent_ids fields of astream_events.
+"""
+
+import json
+from json.encoder import encode_basestring_ascii
+from typing import Any, Callable, Dict
+
+from app.utils.input_types import default_serialization
+
+EventSerializer = Callable[[Any], str]
+
+# Fields of astream_events events which are sent to the clients
+EVENT_FIELDS = ("event", "name", "run_id", "data")
+
+CHUNK_PREFIX = '{"event": "on_chat_model_stream", "data": {"chunk": {"content": '
+
+
+def json_serializer(event: Any) -> str:
+    """
+    Serialize an event with json.dumps.
+
+    :param event: The event to serialize
+    :return: The serialized event, terminated by a newline
+    """
+    return json.dumps(event, default=default_serialization) + "\n"
+
+
+def _encode(value: Any) -> str:
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if value == {}:
+        return "{}"
+    return json.dumps(value, default=default_serialization)
+
+
+def _serialize_chunk(chunk: Any) -> str:
+    if isinstance(chunk, dict):
+        content = chunk.get("content", "")
+        additional_kwargs = chunk.get("additional_kwargs") or {}
+    else:
+        content = chunk.content
+        additional_kwargs = chunk.additional_kwargs
+    return (
+        CHUNK_PREFIX
+        + _encode(content)
+        + ', "additional_kwargs": '
+        + _encode(additional_kwargs)
+        + "}}}\n"
+    )
+
+
+def fast_serializer(event: Any) -> str:
+    """
+    Serialize an event, dropping the fields not read by the clients.
+
+    :param event: The event to serialize
+    :return: The serialized event, terminated by a newline
+    """
+    if isinstance(event, dict):
+        data = event.get("data")
+        if (
+            event.get("event") == "on_chat_model_stream"
+            and isinstance(data, dict)
+            and "chunk" in data
+        ):
+            return _serialize_chunk(data["chunk"])
+        event = {k: event[k] for k in EVENT_FIELDS if k in event}
+    return json_serializer(event)
+
+
+EVENT_SERIALIZERS: Dict[str, EventSerializer] = {
+    "json": json_serializer,
+    "fast": fast_serializer,
+}
+
+
+def get_event_serializer(name: str) -> EventSerializer:
+    """
+    Return the event serializer registered under a name.
+
+    :param name: Name of the serializer in EVENT_SERIALIZERS
+    :return: The event serializer
+    """
+    if name not in EVENT_SERIALIZERS:
+        raise ValueError(
+            f"Unknown event serializer {name!r}, "
+            f"expected one of {sorted(EVENT_SERIALIZERS)}"
+        )
+    return EVENT_SERIALIZERS[name]
@@ -0,0 +1,164 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Coalescing of the chat model chunks streamed by /stream_events.
+
+Models stream one event per token, each of which becomes an NDJSON line, a
+write and a re-render of the client. coalesce_chunks merges consecutive
+on_chat_model_stream events into a single event per time or size window.
+The first chunk is always sent immediately, so the time to first token does
+not change.
+"""
+
+import asyncio
+import contextlib
+from typing import Any, AsyncGenerator, AsyncIterable, Dict, Optional
+
+Event = Dict[str, Any]
+
+# Marks the end of the source events in the queue
+_END = object()
+
+
+def _chunk_text(event: Event) -> Optional[str]:
+    """Return the text of a chat model chunk event, None for other events."""
+    if event.get("event") != "on_chat_model_stream":
+        return None
+    data = event.get("data")
+    chunk = data.get("chunk") if isinstance(data, dict) else None
+    if isinstance(chunk, dict):
+        content = chunk.get("content")
+    else:
+        content = getattr(chunk, "content", None)
+    return content if isinstance(content, str) else None
+
+
+def _can_merge(event: Event, other: Event) -> bool:
+    """
+    Only chunks of the same model run (not e.g. of parallel branches) are
+    merged, with + unless both were serialized to dicts.
+    """
+    return event.get("run_id") == other.get("run_id") and isinstance(
+        event["data"]["chunk"], dict
+    ) == isinstance(other["data"]["chunk"], dict)
+
+
+def _merge(event: Event, other: Event) -> Event:
+    chunk, other_chunk = event["data"]["chunk"], other["data"]["chunk"]
+    if isinstance(chunk, dict):
+        merged = {
+            **chunk,
+            "content": chunk["content"] + other_chunk["content"],
+            "additional_kwargs": {
+                **(chunk.get("additional_kwargs") or {}),
+                **(other_chunk.get("additional_kwargs") or {}),
+            },
+        }
+    else:
+        merged = chunk + other_chunk
+    return {**event, "data": {**event["data"], "chunk": merged}}
+
+
+async def _produce(events: AsyncIterable[Event], queue: asyncio.Queue) -> None:
+    try:
+        async for event in events:
+            await queue.put(event)
+    except Exception as e:
+        await queue.put(e)
+    else:
+        await queue.put(_END)
+    finally:
+        # Close the source (e.g. astream_events) when the consumer stops early
+        aclose = getattr(events, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def coalesce_chunks(
+    events: AsyncIterable[Event],
+    window_ms: float = 20.0,
+    max_bytes: int = 64,
+    max_queued_events: int = 256,
+) -> AsyncGenerator[Event, None]:
+    """
+    Merge consecutive chat model chunks of an event stream.
+
+    After the first chunk, which is sent immediately, chunks are buffered and
+    merged until window_ms have passed since the first buffered chunk, or the
+    buffered text reaches max_bytes. Any other event sends the buffered
+    chunks first, so the order of the events is kept.
+
+    The source events are consumed by a single task, so the context of the
+    chain (e.g. its tracing spans) is not split between tasks. At most
+    max_queued_events are read ahead, so a slow client slows down the source
+    instead of the whole generation being buffered in memory.
+
+    :param events: The events to stream, e.g. the output of astream_events
+    :param window_ms: Maximum time a chunk is held back, in milliseconds
+    :param max_bytes: Buffered text size (UTF-8) at which chunks are sent
+    :param max_queued_events: Maximum number of source events read ahead
+    :return: The events, with consecutive chunks merged
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued_events)
+    producer = asyncio.create_task(_produce(events, queue))
+    loop = asyncio.get_running_loop()
+    buffer: Optional[Event] = None
+    buffer_bytes = 0
+    deadline = 0.0
+    first_chunk_sent = False
+    try:
+        while True:
+            if buffer is None:
+                item = await queue.get()
+            else:
+                try:
+                    item = await asyncio.wait_for(
+                        queue.get(), timeout=max(0.0, deadline - loop.time())
+                    )
+                except asyncio.TimeoutError:
+                    yield buffer
+                    buffer = None
+                    continue
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            text = _chunk_text(item)
+            if text is None or not first_chunk_sent:
+                if buffer is not None:
+                    yield buffer
+                    buffer = None
+                first_chunk_sent = first_chunk_sent or text is not None
+                yield item
+                continue
+            if buffer is not None and not _can_merge(buffer, item):
+                yield buffer
+                buffer = None
+            if buffer is None:
+                buffer = item
+                buffer_bytes = len(text.encode())
+                deadline = loop.time() + window_ms / 1000
+            else:
+                buffer = _merge(buffer, item)
+                buffer_bytes += len(text.encode())
+            if buffer_bytes >= max_bytes:
+                yield buffer
+                buffer = None
+        if buffer is not None:
+            yield buffer
+    finally:
+        producer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await producer
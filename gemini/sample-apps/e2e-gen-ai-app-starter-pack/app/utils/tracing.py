@@ -12,9 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import gzip
 import json
 import logging
-from typing import Any, Optional, Sequence
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from google.cloud import logging as google_cloud_logging
 from google.cloud import storage
@@ -22,6 +26,11 @@ from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
 from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace.export import SpanExportResult
 
+# Cloud Logging rejects entries above 256KB
+MAX_LOG_ENTRY_BYTES = 255 * 1024
+# entries.write requests are limited to 10MB, stay well below it
+MAX_LOG_BATCH_BYTES = 4 * 1024 * 1024
+
 
 class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
     """
@@ -30,6 +39,13 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
 
     This class helps bypass the 256 character limit of Cloud Trace for attribute values
     by leveraging Cloud Logging (which has a 256KB limit) and Cloud Storage for larger payloads.
+
+    The spans of an export call are written with as few Cloud Logging batch requests as
+    possible, each holding at most max_batch_bytes of encoded spans.
+    Large payloads are gzip-compressed and uploaded by a background thread from a bounded
+    queue, so exporting never waits for Cloud Storage; payloads are dropped (and counted)
+    when the queue is full. Whether the bucket exists is checked once per
+    bucket_check_ttl_sec instead of on every upload.
     """
 
     def __init__(
@@ -38,6 +54,10 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         storage_client: Optional[storage.Client] = None,
         bucket_name: Optional[str] = None,
         debug: bool = False,
+        max_upload_queue_size: int = 1000,
+        bucket_check_ttl_sec: float = 300.0,
+        compress_payloads: bool = True,
+        max_batch_bytes: int = MAX_LOG_BATCH_BYTES,
         **kwargs: Any,
     ) -> None:
         """
@@ -47,6 +67,10 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         :param storage_client: Google Cloud Storage client
         :param bucket_name: Name of the GCS bucket to store large payloads
         :param debug: Enable debug mode for additional logging
+        :param max_upload_queue_size: Maximum number of large payloads waiting for upload
+        :param bucket_check_ttl_sec: How long the result of the bucket check is cached
+        :param compress_payloads: Store large payloads gzip-compressed
+        :param max_batch_bytes: Maximum encoded size of the spans in one logging request
         :param kwargs: Additional arguments to pass to the parent class
         """
         super().__init__(**kwargs)
@@ -58,6 +82,21 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         self.storage_client = storage_client or storage.Client(project=self.project_id)
         self.bucket_name = bucket_name or f"{self.project_id}-logs-data"
         self.bucket = self.storage_client.bucket(self.bucket_name)
+        self.bucket_check_ttl_sec = bucket_check_ttl_sec
+        self.compress_payloads = compress_payloads
+        self.max_batch_bytes = max_batch_bytes
+        self._bucket_exists: Optional[bool] = None
+        self._bucket_checked_at = 0.0
+        self._upload_queue: "queue.Queue[Tuple[str, str]]" = queue.Queue(
+            maxsize=max_upload_queue_size
+        )
+        self._upload_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.exported_spans = 0
+        self.dropped_spans = 0
+        self.dropped_payloads = 0
+        self.uploaded_payloads = 0
+        self.failed_uploads = 0
 
     def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
         """
@@ -66,6 +105,7 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         :param spans: A sequence of spans to export
         :return: The result of the export operation
         """
+        span_dicts = []
         for span in spans:
             span_context = span.get_span_context()
             trace_id = format(span_context.trace_id, "x")
@@ -81,38 +121,148 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
 
             if self.debug:
                 print(span_dict)
+            span_dicts.append(span_dict)
 
-            # Log the span data to Google Cloud Logging
-            self.logger.log_struct(span_dict, severity="INFO")
+        # Log the span data to Google Cloud Logging, splitting the spans so no
+        # request exceeds the request size limit
+        for chunk in self._split_by_size(span_dicts):
+            self._log_spans(chunk)
 
         # Export spans to Google Cloud Trace using the parent class method
         return super().export(spans)
 
+    def _split_by_size(self, span_dicts: Sequence[dict]) -> List[List[dict]]:
+        """Group spans into chunks of at most max_batch_bytes of encoded JSON."""
+        chunks: List[List[dict]] = []
+        chunk: List[dict] = []
+        chunk_bytes = 0
+        for span_dict in span_dicts:
+            span_bytes = len(json.dumps(span_dict).encode())
+            if chunk and chunk_bytes + span_bytes > self.max_batch_bytes:
+                chunks.append(chunk)
+                chunk, chunk_bytes = [], 0
+            chunk.append(span_dict)
+            chunk_bytes += span_bytes
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _log_spans(self, span_dicts: Sequence[dict]) -> None:
+        """Write spans with one Cloud Logging batch request."""
+        try:
+            batch = self.logger.batch()
+            for span_dict in span_dicts:
+                batch.log_struct(span_dict, severity="INFO")
+            batch.commit()
+            self.exported_spans += len(span_dicts)
+        except Exception as e:
+            self.dropped_spans += len(span_dicts)
+            logging.warning("Failed to log %d spans: %s", len(span_dicts), e)
+
+    def bucket_exists(self) -> bool:
+        """
+        Return whether the payload bucket exists, checking at most once
+        per bucket_check_ttl_sec.
+        """
+        now = time.monotonic()
+        if (
+            self._bucket_exists is None
+            or now - self._bucket_checked_at > self.bucket_check_ttl_sec
+        ):
+            self._bucket_exists = bool(self.bucket.exists())
+            self._bucket_checked_at = now
+            if not self._bucket_exists:
+                logging.warning(
+                    f"Bucket {self.bucket_name} not found. "
+                    "Unable to store span attributes in GCS."
+                )
+        return self._bucket_exists
+
     def store_in_gcs(self, content: str, span_id: str) -> str:
         """
-        Initiate storing large content in Google Cloud Storage/
+        Store large content in Google Cloud Storage.
 
         :param content: The content to store
         :param span_id: The ID of the span
         :return: The  GCS URI of the stored content
         """
-        if not self.storage_client.bucket(self.bucket_name).exists():
-            logging.warning(
-                f"Bucket {self.bucket_name} not found. "
-                "Unable to store span attributes in GCS."
-            )
+        if not self.bucket_exists():
             return "GCS bucket not found"
 
         blob_name = f"spans/{span_id}.json"
         blob = self.bucket.blob(blob_name)
 
-        blob.upload_from_string(content, "application/json")
+        if self.compress_payloads:
+            # Served decompressed to clients without gzip support
+            blob.content_encoding = "gzip"
+            blob.upload_from_string(gzip.compress(content.encode()), "application/json")
+        else:
+            blob.upload_from_string(content, "application/json")
         return f"gs://{self.bucket_name}/{blob_name}"
 
+    def _ensure_upload_thread(self) -> None:
+        with self._lock:
+            if self._upload_thread is None:
+                self._upload_thread = threading.Thread(
+                    target=self._upload_loop, name="span-payload-upload", daemon=True
+                )
+                self._upload_thread.start()
+
+    def _upload_loop(self) -> None:
+        while True:
+            content, span_id = self._upload_queue.get()
+            try:
+                self.store_in_gcs(content, span_id)
+                self.uploaded_payloads += 1
+            except Exception as e:
+                self.failed_uploads += 1
+                logging.warning("Failed to store span %s in GCS: %s", span_id, e)
+            finally:
+                self._upload_queue.task_done()
+
+    def enqueue_upload(self, content: str, span_id: str) -> bool:
+        """
+        Queue content for upload by the background thread.
+        Returns False if it was dropped because the queue is full.
+        """
+        self._ensure_upload_thread()
+        try:
+            self._upload_queue.put_nowait((content, span_id))
+        except queue.Full:
+            self.dropped_payloads += 1
+            return False
+        return True
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return the queue depth and the exported/dropped counters."""
+        return {
+            "upload_queue_depth": self._upload_queue.qsize(),
+            "exported_spans": self.exported_spans,
+            "dropped_spans": self.dropped_spans,
+            "dropped_payloads": self.dropped_payloads,
+            "uploaded_payloads": self.uploaded_payloads,
+            "failed_uploads": self.failed_uploads,
+        }
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        """Wait until the queued payloads are uploaded."""
+        deadline = time.monotonic() + timeout_millis / 1000
+        while self._upload_queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def shutdown(self) -> None:
+        """Upload the queued payloads before shutting down."""
+        self.force_flush()
+        super().shutdown()
+
     def _process_large_attributes(self, span_dict: dict, span_id: str) -> dict:
         """
         Process large attribute values by storing them in GCS if they exceed the size
-        limit of Google Cloud Logging.
+        limit of Google Cloud Logging. The upload happens in the background, the span
+        references the URI the payload will be stored at.
 
         :param span_dict: The span data dictionary
         :param trace_id: The trace ID
@@ -120,7 +270,7 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         :return: The updated span dictionary
         """
         attributes = span_dict["attributes"]
-        if len(json.dumps(attributes).encode()) > 255 * 1024:  # 250 KB
+        if len(json.dumps(attributes).encode()) > MAX_LOG_ENTRY_BYTES:
             # Separate large payload from other attributes
             attributes_payload = {
                 k: v
@@ -134,7 +284,12 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
             }
 
             # Store large payload in GCS
-            gcs_uri = self.store_in_gcs(json.dumps(attributes_payload), span_id)
+            if not self.bucket_exists():
+                gcs_uri = "GCS bucket not found"
+            elif self.enqueue_upload(json.dumps(attributes_payload), span_id):
+                gcs_uri = f"gs://{self.bucket_name}/spans/{span_id}.json"
+            else:
+                gcs_uri = "Payload dropped, upload queue full"
             attributes_retain["uri_payload"] = gcs_uri
             attributes_retain["url_payload"] = (
                 f"https://storage.mtls.cloud.google.com/"
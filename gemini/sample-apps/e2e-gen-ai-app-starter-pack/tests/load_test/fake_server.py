@@ -0,0 +1,76 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=W0622, C0413
+
+"""Hermetic server for load testing.
+
+Serves the FastAPI app of app/server.py with a fake chain instead of the model,
+without tracing and without Google Cloud credentials, so the serving and
+streaming capacity of the application can be load tested on a laptop:
+
+    uvicorn tests.load_test.fake_server:app --host 0.0.0.0 --port 8000
+
+The fake chain is configured with environment variables:
+
+- FAKE_CHAIN_TTFT_MS: Delay before the first token (default 300)
+- FAKE_CHAIN_TOKENS: Number of streamed tokens (default 100)
+- FAKE_CHAIN_TOKEN_INTERVAL_MS: Delay between two tokens (default 20)
+"""
+
+import asyncio
+import os
+from typing import Any, AsyncIterator, Dict
+from unittest.mock import patch
+
+from google.auth.credentials import AnonymousCredentials
+from langchain_core.messages import AIMessageChunk
+
+os.environ.setdefault("TRACELOOP_TRACING_ENABLED", "false")
+
+# The app creates Google Cloud clients when it is imported, which never get to
+# send a request here
+with patch(
+    "google.auth.default", return_value=(AnonymousCredentials(), "fake-project")
+):
+    from app import server
+
+from app.utils.decorators import custom_chain  # noqa: E402
+from app.utils.output_types import (  # noqa: E402
+    ChatModelStreamData,
+    OnChatModelStreamEvent,
+)
+
+TTFT_MS = float(os.environ.get("FAKE_CHAIN_TTFT_MS", 300))
+NUM_TOKENS = int(os.environ.get("FAKE_CHAIN_TOKENS", 100))
+TOKEN_INTERVAL_MS = float(os.environ.get("FAKE_CHAIN_TOKEN_INTERVAL_MS", 20))
+
+
+@custom_chain
+async def fake_chain(
+    input: Dict[str, Any], **kwargs: Any
+) -> AsyncIterator[OnChatModelStreamEvent]:
+    """Stream NUM_TOKENS chunks, with the latencies of a model."""
+    await asyncio.sleep(TTFT_MS / 1000)
+    for i in range(NUM_TOKENS):
+        if i:
+            await asyncio.sleep(TOKEN_INTERVAL_MS / 1000)
+        yield OnChatModelStreamEvent(
+            data=ChatModelStreamData(
+                chunk=AIMessageChunk(content=f"token{i} ", id="fake-run")
+            )
+        )
+
+
+server.chain = fake_chain  # type: ignore[assignment]
+app = server.app
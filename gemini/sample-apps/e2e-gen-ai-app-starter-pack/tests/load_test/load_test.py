@@ -16,6 +16,7 @@
 import json
 import os
 import time
+from typing import Any, Dict, List, Optional
 
 from locust import HttpUser, between, task
 
@@ -44,7 +45,7 @@ class ChatStreamUser(HttpUser):
             }
         }
 
-        start_time = time.time()
+        start_time = time.perf_counter()
 
         with self.client.post(
             "/stream_events",
@@ -56,13 +57,22 @@ class ChatStreamUser(HttpUser):
         ) as response:
             if response.status_code == 200:
                 events = []
-                for line in response.iter_lines():
+                event_times = []
+                first_token_time = None
+                # chunk_size=None yields the lines as soon as they are received
+                for line in response.iter_lines(chunk_size=None):
                     if line:
                         events.append(json.loads(line))
+                        event_times.append(time.perf_counter())
+                        if (
+                            first_token_time is None
+                            and events[-1]["event"] == "on_chat_model_stream"
+                        ):
+                            first_token_time = event_times[-1]
                         if events[-1]["event"] == "end":
                             break
 
-                end_time = time.time()
+                end_time = time.perf_counter()
                 total_time = end_time - start_time
 
                 if (
@@ -79,7 +89,54 @@ class ChatStreamUser(HttpUser):
                         response=response,
                         context={},
                     )
+                    self.report_stream_metrics(
+                        events, event_times, start_time, first_token_time
+                    )
                 else:
                     response.failure("Unexpected response structure")
             else:
                 response.failure(f"Unexpected status code: {response.status_code}")
+
+    def report_stream_metrics(
+        self,
+        events: List[Dict[str, Any]],
+        event_times: List[float],
+        start_time: float,
+        first_token_time: Optional[float],
+    ) -> None:
+        """
+        Reports the token metrics of a stream as custom locust requests:
+        the time to first token, the tokens (streamed chunks) per second after
+        the first token, and the largest gap between two events after the first
+        token. The tokens per second are reported in the response time column.
+        """
+        if first_token_time is None:
+            return
+        num_tokens = sum(event["event"] == "on_chat_model_stream" for event in events)
+        self.fire_stream_metric(
+            "time to first token", (first_token_time - start_time) * 1000, num_tokens
+        )
+
+        first_token_index = event_times.index(first_token_time)
+        stream_times = event_times[first_token_index:]
+        gaps = [
+            later - earlier for earlier, later in zip(stream_times, stream_times[1:])
+        ]
+        if gaps:
+            self.fire_stream_metric("max inter-event gap", max(gaps) * 1000, num_tokens)
+        streaming_time = event_times[-1] - first_token_time
+        if num_tokens > 1 and streaming_time > 0:
+            self.fire_stream_metric(
+                "tokens per second", (num_tokens - 1) / streaming_time, num_tokens
+            )
+
+    def fire_stream_metric(self, name: str, value: float, num_tokens: int) -> None:
+        """Reports a value as a custom locust request."""
+        self.environment.events.request.fire(
+            request_type="STREAM",
+            name=f"/stream_events {name}",
+            response_time=value,
+            response_length=num_tokens,
+            exception=None,
+            context={},
+        )
@@ -174,3 +174,85 @@ async def test_stream_chat_events() -> None:
         assert events[2]["event"] == "on_chat_model_stream"
         assert events[2]["data"]["content"] == "Additional response"
         assert events[3]["event"] == "end"
+
+
+@pytest.mark.asyncio
+async def test_stream_chat_events_metrics() -> None:
+    """
+    Test that streamed responses are recorded in the metrics endpoint.
+    """
+    from app.server import app
+
+    input_data = {
+        "input": {
+            "user_id": "test-user",
+            "session_id": "test-session",
+            "messages": [{"type": "human", "content": "Hello, AI!"}],
+        }
+    }
+    mock_events = [
+        {"event": "on_chat_model_stream", "data": {"content": "Mocked response"}},
+    ]
+
+    with patch("app.server.chain") as mock_chain:
+        mock_chain.astream_events.return_value = AsyncIterator(mock_events)
+
+        with patch("app.server.Traceloop.set_association_properties"):
+            async with AsyncClient(app=app, base_url="http://test") as ac:
+                await ac.post("/stream_events", json=input_data)
+                response = await ac.get("/metrics/")
+
+    assert response.status_code == 200
+    for name in [
+        "stream_time_to_first_token",
+        "stream_duration",
+        "stream_events_per_second",
+        "stream_serialization_time",
+    ]:
+        assert name in response.text
+
+
+@pytest.mark.asyncio
+async def test_stream_chat_events_coalescing() -> None:
+    """
+    Test that model chunks are coalesced when a coalescing window is set,
+    while the first chunk is streamed on its own, and that the tokens are
+    still counted before coalescing.
+    """
+    from app.server import app
+    from app.utils.metrics import StreamRecorder
+    from langchain_core.messages import AIMessageChunk
+
+    input_data = {
+        "input": {
+            "user_id": "test-user",
+            "session_id": "test-session",
+            "messages": [{"type": "human", "content": "Hello, AI!"}],
+        }
+    }
+    mock_events = [
+        {"event": "on_chat_model_stream", "data": {"chunk": AIMessageChunk(content=c)}}
+        for c in ["Hello", ", ", "world", "!"]
+    ]
+
+    with patch("app.server.chain") as mock_chain, patch(
+        "app.server.COALESCE_WINDOW_MS", 1000
+    ):
+        mock_chain.astream_events.return_value = AsyncIterator(mock_events)
+
+        with patch("app.server.Traceloop.set_association_properties"), patch.object(
+            StreamRecorder, "token", autospec=True
+        ) as mock_token:
+            async with AsyncClient(app=app, base_url="http://test") as ac:
+                response = await ac.post("/stream_events", json=input_data)
+
+    events = [json.loads(event) for event in response.iter_lines()]
+    assert [event["event"] for event in events] == [
+        "metadata",
+        "on_chat_model_stream",
+        "on_chat_model_stream",
+        "end",
+    ]
+    assert mock_token.call_count == 4
+    assert events[1]["data"]["chunk"]["content"] == "Hello"
+    assert events[2]["data"]["chunk"]["content"] == ", world!"
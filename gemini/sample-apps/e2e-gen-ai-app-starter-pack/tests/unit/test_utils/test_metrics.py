@@ -0,0 +1,98 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# pylint: disable=W0621
+
+from typing import Any, Dict
+from unittest.mock import patch
+
+from app.utils.metrics import (
+    StreamMetrics,
+    create_meter_provider,
+    register_exporter_metrics,
+)
+from app.utils.serialization import json_serializer
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+import pytest
+
+
+@pytest.fixture
+def metric_reader() -> InMemoryMetricReader:
+    """Create an in-memory metric reader."""
+    return InMemoryMetricReader()
+
+
+@pytest.fixture
+def stream_metrics(metric_reader: InMemoryMetricReader) -> StreamMetrics:
+    """Create StreamMetrics reporting to the in-memory reader."""
+    return StreamMetrics(create_meter_provider(metric_readers=[metric_reader]))
+
+
+def collect_histograms(metric_reader: InMemoryMetricReader) -> Dict[str, Any]:
+    """Return the data point of each histogram by metric name."""
+    histograms = {}
+    metrics_data = metric_reader.get_metrics_data()
+    assert metrics_data is not None
+    for resource_metrics in metrics_data.resource_metrics:
+        for scope_metrics in resource_metrics.scope_metrics:
+            for metric in scope_metrics.metrics:
+                histograms[metric.name] = metric.data.data_points[0]
+    return histograms
+
+
+def test_stream_recorder(
+    stream_metrics: StreamMetrics, metric_reader: InMemoryMetricReader
+) -> None:
+    """Test the histograms recorded for a stream of three tokens."""
+    times = iter([0.0, 0.5, 0.5, 0.5, 0.6, 0.6, 0.6, 0.8, 0.8, 0.8, 1.0])
+    with patch("app.utils.metrics.time.perf_counter", side_effect=lambda: next(times)):
+        recorder = stream_metrics.recorder()
+        for _ in range(3):
+            recorder.token()
+            line = recorder.serialize({"event": "chunk"}, json_serializer)
+        recorder.finish()
+
+    assert line == '{"event": "chunk"}\n'
+    histograms = collect_histograms(metric_reader)
+    assert histograms["stream.time_to_first_token"].sum == pytest.approx(500)
+    assert histograms["stream.inter_token_gap"].count == 2
+    assert histograms["stream.inter_token_gap"].sum == pytest.approx(300)
+    assert histograms["stream.duration"].sum == pytest.approx(1000)
+    assert histograms["stream.events_per_second"].sum == pytest.approx(3)
+    assert histograms["stream.serialization_time"].count == 1
+
+
+def test_histogram_boundaries(
+    stream_metrics: StreamMetrics, metric_reader: InMemoryMetricReader
+) -> None:
+    """Test that the serialization time uses sub-millisecond buckets."""
+    recorder = stream_metrics.recorder()
+    recorder.serialize({"event": "end"}, json_serializer)
+    recorder.finish()
+
+    histograms = collect_histograms(metric_reader)
+    assert histograms["stream.serialization_time"].explicit_bounds[0] == 0.01
+    assert "stream.time_to_first_token" not in histograms
+
+
+def test_exporter_metrics(metric_reader: InMemoryMetricReader) -> None:
+    """Test that the span exporter statistics are exposed as gauges."""
+    stats = {"upload_queue_depth": 3, "dropped_spans": 2, "dropped_payloads": 1}
+    register_exporter_metrics(
+        create_meter_provider(metric_readers=[metric_reader]), lambda: stats
+    )
+
+    gauges = collect_histograms(metric_reader)
+    assert gauges["tracing.upload_queue_depth"].value == 3
+    assert gauges["tracing.dropped_spans"].value == 2
+    assert gauges["tracing.dropped_payloads"].value == 1
@@ -0,0 +1,98 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from typing import Any, Dict
+
+from app.utils.output_types import (
+    ChatModelStreamData,
+    EndEvent,
+    OnChatModelStreamEvent,
+)
+from app.utils.serialization import (
+    fast_serializer,
+    get_event_serializer,
+    json_serializer,
+)
+from langchain_core.messages import AIMessageChunk
+import pytest
+
+
+def make_chunk_event(chunk: Any) -> Dict[str, Any]:
+    """Create an on_chat_model_stream event like astream_events v2."""
+    return {
+        "event": "on_chat_model_stream",
+        "name": "ChatVertexAI",
+        "run_id": "run-1",
+        "tags": ["seq:step:2"],
+        "metadata": {"ls_provider": "google_vertexai", "ls_model_type": "chat"},
+        "parent_ids": ["parent-1"],
+        "data": {"chunk": chunk},
+    }
+
+
+@pytest.mark.parametrize(
+    "chunk",
+    [
+        AIMessageChunk(content='Café "au" lait\n', id="run-1"),
+        AIMessageChunk(content="Hi", additional_kwargs={"function_call": None}),
+        OnChatModelStreamEvent(
+            data=ChatModelStreamData(chunk=AIMessageChunk(content="Hi"))
+        ).model_dump()["data"]["chunk"],
+    ],
+)
+def test_fast_serializer_chunk(chunk: Any) -> None:
+    """Test that chunks keep the fields read by the clients."""
+    event = make_chunk_event(chunk)
+    line = fast_serializer(event)
+    expected = json.loads(json_serializer(event))
+
+    assert line.endswith("\n") and line.count("\n") == 1
+    assert json.loads(line) == {
+        "event": "on_chat_model_stream",
+        "data": {
+            "chunk": {
+                "content": expected["data"]["chunk"]["content"],
+                "additional_kwargs": expected["data"]["chunk"]["additional_kwargs"],
+            }
+        },
+    }
+
+
+def test_fast_serializer_other_events() -> None:
+    """Test that other events are serialized without the unused fields."""
+    event = {
+        "event": "on_retriever_end",
+        "name": "Retriever",
+        "run_id": "run-2",
+        "tags": [],
+        "metadata": {},
+        "parent_ids": [],
+        "data": {"input": {"query": "pasta"}, "output": []},
+    }
+
+    assert json.loads(fast_serializer(event)) == {
+        "event": "on_retriever_end",
+        "name": "Retriever",
+        "run_id": "run-2",
+        "data": {"input": {"query": "pasta"}, "output": []},
+    }
+    assert fast_serializer(EndEvent()) == json_serializer(EndEvent())
+
+
+def test_get_event_serializer() -> None:
+    """Test looking up serializers by name."""
+    assert get_event_serializer("json") is json_serializer
+    with pytest.raises(ValueError):
+        get_event_serializer("unknown")
@@ -0,0 +1,171 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from app.utils.streaming import coalesce_chunks
+from langchain_core.messages import AIMessageChunk
+import pytest
+
+
+def chunk_event(content: str) -> Dict[str, Any]:
+    """Create an on_chat_model_stream event."""
+    return {
+        "event": "on_chat_model_stream",
+        "run_id": "run-1",
+        "data": {"chunk": AIMessageChunk(content=content)},
+    }
+
+
+async def delayed_events(
+    events: List[Tuple[float, Dict[str, Any]]],
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield each event after its delay in seconds."""
+    for delay, event in events:
+        await asyncio.sleep(delay)
+        yield event
+
+
+def contents(events: List[Dict[str, Any]]) -> List[Any]:
+    """Return the chunk contents, or the event type of other events."""
+    return [
+        (
+            event["data"]["chunk"].content
+            if event["event"] == "on_chat_model_stream"
+            else event["event"]
+        )
+        for event in events
+    ]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_chunks_by_size() -> None:
+    """Test that the first chunk is sent alone and later ones up to max_bytes."""
+    source = delayed_events([(0, chunk_event(c)) for c in ["a", "bb", "cc", "d", "e"]])
+
+    events = [e async for e in coalesce_chunks(source, window_ms=1000, max_bytes=4)]
+
+    assert contents(events) == ["a", "bbcc", "de"]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_chunks_by_time() -> None:
+    """Test that buffered chunks are sent when the window expires."""
+    source = delayed_events(
+        [(0, chunk_event("a")), (0, chunk_event("b")), (0.2, chunk_event("c"))]
+    )
+    received = []
+
+    async for event in coalesce_chunks(source, window_ms=20, max_bytes=64):
+        received.append((asyncio.get_running_loop().time(), event))
+
+    assert contents([event for _, event in received]) == ["a", "b", "c"]
+    # "b" is not held back until "c" arrives
+    assert received[2][0] - received[1][0] > 0.1
+
+
+@pytest.mark.asyncio
+async def test_coalesce_chunks_keeps_event_order() -> None:
+    """Test that other events flush the buffered chunks first."""
+    source = delayed_events(
+        [
+            (0, chunk_event("a")),
+            (0, chunk_event("b")),
+            (0, chunk_event("c")),
+            (0, {"event": "on_tool_start", "data": {}}),
+            (0, chunk_event("d")),
+        ]
+    )
+
+    events = [e async for e in coalesce_chunks(source, window_ms=1000, max_bytes=64)]
+
+    assert contents(events) == ["a", "bc", "on_tool_start", "d"]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_serialized_chunks() -> None:
+    """Test merging chunks which were serialized to dicts."""
+    source = delayed_events(
+        [
+            (0, {"event": "on_chat_model_stream", "data": {"chunk": {"content": c}}})
+            for c in ["a", "b", "c"]
+        ]
+    )
+
+    events = [e async for e in coalesce_chunks(source, window_ms=1000, max_bytes=64)]
+
+    assert [e["data"]["chunk"]["content"] for e in events] == ["a", "bc"]
+    assert events[1]["data"]["chunk"]["additional_kwargs"] == {}
+
+
+@pytest.mark.asyncio
+async def test_coalesce_chunks_propagates_errors() -> None:
+    """Test that errors of the source are raised to the consumer."""
+
+    async def failing_events() -> AsyncIterator[Dict[str, Any]]:
+        yield chunk_event("a")
+        raise ValueError("model error")
+
+    with pytest.raises(ValueError, match="model error"):
+        async for _ in coalesce_chunks(failing_events()):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_coalesce_chunks_keeps_runs_apart() -> None:
+    """Test that chunks of interleaved model runs are not merged together."""
+
+    def run_chunk(run_id: str, content: str) -> Dict[str, Any]:
+        return {**chunk_event(content), "run_id": run_id}
+
+    source = delayed_events(
+        [
+            (0, run_chunk("run-1", "a")),
+            (0, run_chunk("run-1", "b")),
+            (0, run_chunk("run-1", "c")),
+            (0, run_chunk("run-2", "x")),
+            (0, run_chunk("run-2", "y")),
+            (0, run_chunk("run-1", "d")),
+        ]
+    )
+
+    events = [e async for e in coalesce_chunks(source, window_ms=1000, max_bytes=64)]
+
+    assert contents(events) == ["a", "bc", "xy", "d"]
+    assert [e["run_id"] for e in events] == ["run-1", "run-1", "run-2", "run-1"]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_chunks_reads_ahead_boundedly_and_closes_source() -> None:
+    """Test that the read-ahead is bounded and stopping early closes the source."""
+    produced = 0
+    closed = asyncio.Event()
+
+    async def source() -> AsyncIterator[Dict[str, Any]]:
+        nonlocal produced
+        try:
+            for _ in range(100):
+                produced += 1
+                yield {"event": "on_tool_start", "data": {}}
+        finally:
+            closed.set()
+
+    stream = coalesce_chunks(source(), max_queued_events=4)
+    await stream.__anext__()
+    await asyncio.sleep(0.05)
+    assert produced <= 7
+
+    await stream.aclose()
+    assert closed.is_set()
@@ -13,6 +13,9 @@
 # limitations under the License.
 # pylint: disable=W0621, W0613, W0212
 
+import gzip
+import json
+import threading
 from typing import Any, Generator
 from unittest.mock import Mock, patch
 
@@ -136,7 +139,111 @@ def test_export(
 
     mock_process_large_attributes.return_value = {"processed": "data"}
 
+    exporter.export([mock_span, mock_span])
+
+    assert mock_process_large_attributes.call_count == 2
+    batch = exporter.logger.batch.return_value
+    assert batch.log_struct.call_count == 2
+    batch.commit.assert_called_once()
+    assert exporter.get_stats()["exported_spans"] == 2
+
+
+def test_export_counts_dropped_spans(exporter: CloudTraceLoggingSpanExporter) -> None:
+    """Spans whose log batch fails are counted as dropped."""
+    mock_span = Mock(spec=ReadableSpan)
+    mock_span.get_span_context.return_value.trace_id = 123
+    mock_span.get_span_context.return_value.span_id = 456
+    mock_span.to_json.return_value = '{"attributes": {}}'
+    exporter.logger.batch.return_value.commit.side_effect = RuntimeError("quota")
+
     exporter.export([mock_span])
 
-    mock_process_large_attributes.assert_called_once()
-    exporter.logger.log_struct.assert_called_once()
+    assert exporter.get_stats()["dropped_spans"] == 1
+
+
+def test_bucket_check_is_cached(exporter: CloudTraceLoggingSpanExporter) -> None:
+    """The bucket is checked once, not on every upload."""
+    exporter.store_in_gcs("a", "span-1")
+    exporter.store_in_gcs("b", "span-2")
+    exporter.bucket.exists.assert_called_once()
+
+
+def test_large_payload_uploaded_in_background(
+    exporter: CloudTraceLoggingSpanExporter,
+) -> None:
+    """Large payloads are compressed and uploaded by the background thread."""
+    span_dict = {"attributes": {"key1": "a" * (300 * 1024)}}
+    result = exporter._process_large_attributes(span_dict, "span-id")
+    assert result["attributes"]["uri_payload"] == "gs://test-bucket/spans/span-id.json"
+
+    assert exporter.force_flush(timeout_millis=5000)
+    blob = exporter.bucket.blob.return_value
+    content = blob.upload_from_string.call_args[0][0]
+    assert json.loads(gzip.decompress(content)) == {"key1": "a" * (300 * 1024)}
+    assert blob.content_encoding == "gzip"
+    assert exporter.get_stats()["uploaded_payloads"] == 1
+
+
+def test_large_payload_dropped_when_queue_full(
+    mock_logging_client: Mock,
+    mock_storage_client: Mock,
+    patch_auth: Any,
+    patch_clients: Any,
+) -> None:
+    """Payloads are dropped instead of blocking the export when the queue is full."""
+    exporter = CloudTraceLoggingSpanExporter(
+        project_id="test-project",
+        logging_client=mock_logging_client,
+        storage_client=mock_storage_client,
+        bucket_name="test-bucket",
+        max_upload_queue_size=1,
+    )
+    uploading = threading.Event()
+    release = threading.Event()
+
+    def slow_upload(*args: Any) -> None:
+        uploading.set()
+        release.wait(5)
+
+    exporter.bucket.blob.return_value.upload_from_string.side_effect = slow_upload
+    large = {"attributes": {"key1": "a" * (300 * 1024)}}
+    exporter._process_large_attributes(dict(large), "span-1")
+    assert uploading.wait(5)
+    exporter._process_large_attributes(dict(large), "span-2")  # queued
+    result = exporter._process_large_attributes(dict(large), "span-3")
+    release.set()
+
+    assert result["attributes"]["uri_payload"] == "Payload dropped, upload queue full"
+    assert exporter.get_stats()["dropped_payloads"] == 1
+
+
+def test_export_splits_batches_by_size(
+    mock_logging_client: Mock,
+    mock_storage_client: Mock,
+    patch_auth: Any,
+    patch_clients: Any,
+) -> None:
+    """Spans are committed in chunks below max_batch_bytes, failing independently."""
+    exporter = CloudTraceLoggingSpanExporter(
+        project_id="test-project",
+        logging_client=mock_logging_client,
+        storage_client=mock_storage_client,
+        bucket_name="test-bucket",
+        max_batch_bytes=250 * 1024,
+    )
+    mock_span = Mock(spec=ReadableSpan)
+    mock_span.get_span_context.return_value.trace_id = 123
+    mock_span.get_span_context.return_value.span_id = 456
+    mock_span.to_json.return_value = json.dumps(
+        {"attributes": {"key": "a" * (100 * 1024)}}
+    )
+    batches = [Mock(), Mock(), Mock()]
+    batches[1].commit.side_effect = RuntimeError("request too large")
+    exporter.logger.batch.side_effect = batches
+
+    exporter.export([mock_span] * 5)
+
+    assert [b.log_struct.call_count for b in batches] == [2, 2, 1]
+    assert all(b.commit.call_count == 1 for b in batches)
+    assert exporter.get_stats()["exported_spans"] == 3
+    assert exporter.get_stats()["dropped_spans"] == 2
@@ -1,7 +1,15 @@
 import logging
 
-from backend.app.shared_state import index_manager, prompts
-from shared_state import IndexManager, Prompts
+from backend.app.eval_jobs import EvalJobManager
+from backend.app.response_eval_worker import ResponseEvalWorker
+from backend.app.shared_state import (
+    eval_job_manager,
+    index_manager,
+    prompts,
+    response_eval_worker,
+)
+from backend.rag.index_manager import IndexManager
+from backend.rag.prompts import Prompts
 
 logger = logging.getLogger(__name__)
 
@@ -15,3 +23,11 @@ def get_index_manager() -> IndexManager:
 
 def get_prompts() -> Prompts:
     return prompts
+
+
+def get_eval_job_manager() -> EvalJobManager:
+    return eval_job_manager
+
+
+def get_response_eval_worker() -> ResponseEvalWorker:
+    return response_eval_worker
@@ -0,0 +1,133 @@
+"""Background job model for batch evaluations"""
+
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+import logging
+import threading
+import uuid
+
+from backend.rag.eval_runner import EvalCancelledError
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+@dataclass
+class EvalJob:
+    job_id: str
+    status: str = QUEUED
+    stage: str | None = None
+    rows_done: int = 0
+    rows_total: int | None = None
+    result: dict | None = None
+    error: str | None = None
+    # Rows left out of the result after all retries, by row index
+    failed_rows: dict[int, str] = field(default_factory=dict)
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    future: Future | None = None
+
+    def report_progress(self, rows_done: int, rows_total: int) -> None:
+        self.rows_done = rows_done
+        self.rows_total = rows_total
+
+    def to_dict(self, include_result: bool = False) -> dict:
+        job = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": {"rows_done": self.rows_done, "rows_total": self.rows_total},
+            "failed_rows": {
+                "count": len(self.failed_rows),
+                "row_idxs": sorted(self.failed_rows),
+            },
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if include_result:
+            job["result"] = self.result
+        return job
+
+
+class EvalJobManager:
+    """
+    Runs submitted evaluations on a pool of max_concurrent_jobs worker
+    threads, so requests only submit a job and poll it. Queued jobs are
+    cancelled immediately, running jobs stop once their in-flight
+    questions finish (their results stay checkpointed for a resubmission).
+    Only the max_finished_jobs most recent finished jobs are kept.
+    """
+
+    def __init__(self, max_concurrent_jobs: int = 2, max_finished_jobs: int = 100):
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_jobs, thread_name_prefix="eval-job"
+        )
+        self._jobs: OrderedDict[str, EvalJob] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[[EvalJob], dict]) -> EvalJob:
+        """Queue fn(job), which returns the job's result"""
+        job = EvalJob(job_id=str(uuid.uuid4()))
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._evict_finished_jobs()
+        job.future = self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: EvalJob, fn: Callable[[EvalJob], dict]) -> None:
+        if job.cancel_event.is_set():
+            job.status = CANCELLED
+            job.finished_at = datetime.now()
+            return
+        job.status = RUNNING
+        job.started_at = datetime.now()
+        try:
+            job.result = fn(job)
+            job.status = COMPLETED
+        except EvalCancelledError:
+            job.status = CANCELLED
+        except Exception as e:
+            logger.exception(f"Evaluation job {job.job_id} failed")
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = datetime.now()
+
+    def _evict_finished_jobs(self) -> None:
+        finished = [j for j in self._jobs.values() if j.status in FINISHED_STATES]
+        for job in finished[: max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job.job_id]
+
+    def get(self, job_id: str) -> EvalJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> list[EvalJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> EvalJob | None:
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            # The job had not started yet
+            job.status = CANCELLED
+            job.finished_at = datetime.now()
+        return job
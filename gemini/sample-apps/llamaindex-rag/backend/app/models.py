@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class IndexUpdate(BaseModel):
@@ -21,6 +21,8 @@ class RAGConfig(BaseModel):
     similarity_top_k: int = 5
     retrieval_strategy: str = "auto_merging"
     use_hyde: bool = True
+    hyde_num_hypotheses: int = Field(default=1, ge=1, le=8)
+    hyde_latency_budget_sec: float | None = Field(default=None, gt=0)
     use_refine: bool = True
     use_node_rerank: bool = True
     use_react: bool = True
@@ -31,6 +33,7 @@ class RAGConfig(BaseModel):
 class RAGRequest(RAGConfig):
     query: str = "What were Google's Q1 Earnings?"
     evaluate_response: bool
+    evaluate_in_background: bool = False
     eval_model_name: str | None = "gemini-1.5-flash"
     embedding_model_name: str | None = "text-embedding-004"
 
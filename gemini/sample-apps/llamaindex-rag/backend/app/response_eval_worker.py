@@ -0,0 +1,159 @@
+"""Background, micro-batched ragas evaluation of /query_rag responses"""
+
+from collections.abc import Callable
+from datetime import datetime
+import logging
+import queue
+import threading
+import time
+
+from datasets import Dataset
+from langchain_google_vertexai import ChatVertexAI, VertexAIEmbeddings
+import pandas as pd
+from ragas import evaluate
+from ragas.metrics import answer_relevancy, context_relevancy, faithfulness
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_METRICS = {
+    "answer_relevancy": answer_relevancy,
+    "faithfulness": faithfulness,
+    "context_relevancy": context_relevancy,
+}
+
+
+def score_with_ragas(
+    records: list[dict], eval_model_name: str, embedding_model_name: str
+) -> list[dict]:
+    """Score question/answer/contexts records with one ragas evaluate call"""
+    eval_df = pd.DataFrame(
+        {
+            "question": [r["question"] for r in records],
+            "answer": [r["answer"] for r in records],
+            "contexts": [r["contexts"] for r in records],
+        }
+    )
+    result = evaluate(
+        Dataset.from_pandas(eval_df),
+        metrics=list(RESPONSE_METRICS.values()),
+        llm=ChatVertexAI(model_name=eval_model_name),
+        embeddings=VertexAIEmbeddings(model_name=embedding_model_name),
+    )
+    return result.to_pandas()[list(RESPONSE_METRICS)].fillna(0).to_dict("records")
+
+
+class ResponseEvalWorker:
+    """
+    Scores queued responses on a background thread, so /query_rag can
+    return before its response is evaluated. Queued records are collected
+    into micro-batches of up to batch_size records (waiting at most
+    max_wait_sec for a batch to fill), each batch is scored with one call
+    per evaluation model, and the scored rows of a batch are written with
+    one write_fn call (e.g. a BigQuery load job). When max_queue_size
+    records are waiting, new records are dropped instead of slowing down
+    requests.
+    """
+
+    def __init__(
+        self,
+        write_fn: Callable[[pd.DataFrame], None] | None = None,
+        score_fn: Callable[[list[dict], str, str], list[dict]] = score_with_ragas,
+        batch_size: int = 16,
+        max_wait_sec: float = 5.0,
+        max_queue_size: int = 1000,
+    ):
+        self.write_fn = write_fn
+        self.score_fn = score_fn
+        self.batch_size = batch_size
+        self.max_wait_sec = max_wait_sec
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.evaluated = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name="response-eval", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, record: dict) -> bool:
+        """
+        Queue a record with question, answer, contexts, eval_model_name and
+        embedding_model_name (other keys are written along with the scores).
+        Returns False if the record was dropped because the queue is full.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            logger.info("Response evaluation queue is full, dropping evaluation")
+            return False
+        return True
+
+    def _next_batch(self) -> list[dict]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_sec
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _process(self, batch: list[dict]) -> None:
+        groups: dict[tuple[str, str], list[dict]] = {}
+        for record in batch:
+            key = (record["eval_model_name"], record["embedding_model_name"])
+            groups.setdefault(key, []).append(record)
+        rows = []
+        for (eval_model_name, embedding_model_name), records in groups.items():
+            try:
+                scores = self.score_fn(records, eval_model_name, embedding_model_name)
+            except Exception as e:
+                logger.info(f"Failed to evaluate {len(records)} responses: {e}")
+                self.failed += len(records)
+                continue
+            rows.extend(record | score for record, score in zip(records, scores))
+        self.batches += 1
+        if not rows:
+            return
+        self.evaluated += len(rows)
+        if self.write_fn:
+            batch_df = pd.DataFrame(rows)
+            batch_df["evaluated_at"] = datetime.now()
+            try:
+                self.write_fn(batch_df)
+            except Exception as e:
+                logger.info(f"Failed to write {len(rows)} response evaluations: {e}")
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._next_batch()
+            try:
+                self._process(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def join(self) -> None:
+        """Block until every queued record has been processed"""
+        self._queue.join()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "evaluated": self.evaluated,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
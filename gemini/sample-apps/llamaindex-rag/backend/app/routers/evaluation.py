@@ -1,13 +1,30 @@
+import asyncio
 from datetime import datetime
+import hashlib
 import logging
+import os
+import tempfile
 import uuid
 
-from backend.app.dependencies import get_index_manager, get_prompts
+from backend.app.dependencies import (
+    get_eval_job_manager,
+    get_index_manager,
+    get_prompts,
+)
+from backend.app.eval_jobs import EvalJob
 from backend.app.models import EvalRequest
-from backend.rag.evaluate import LLMEvaluator
+from backend.app.shared_state import (
+    EVAL_BATCH_SIZE,
+    EVAL_CHECKPOINT_DIR,
+    EVAL_MAX_CONCURRENCY,
+    EVAL_MAX_RETRIES,
+    EVAL_STREAM_RESULTS_TO_BQ,
+)
+from backend.rag.eval_runner import EvalCancelledError, EvalRunner
+from backend.rag.evaluate import LLMEvaluator, write_results_to_bq
 from common.utils import download_blob
 from datasets import Dataset
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from langchain_google_vertexai import ChatVertexAI, VertexAIEmbeddings
 import pandas as pd
 from ragas import evaluate
@@ -35,12 +52,19 @@ ragas_metrics_dict = {
 }
 
 
-@router.post("/eval_batch")
-def eval_batch(
+def run_eval_batch(
     eval_batch_request: EvalRequest,
-    index_manager=Depends(get_index_manager),
-    prompts=Depends(get_prompts),
+    index_manager,
+    prompts,
+    job: EvalJob,
+    loop: asyncio.AbstractEventLoop | None = None,
 ) -> dict:
+    """
+    Evaluate the dataset of eval_batch_request, reporting progress on job.
+    Questions are answered on loop (the server's event loop), since pooled
+    query engines hold async clients bound to it.
+    """
+    job.stage = "loading_dataset"
     query_engine = index_manager.get_query_engine(
         prompts=prompts,
         llm_name=eval_batch_request.llm_name,
@@ -48,6 +72,8 @@ def eval_batch(
         similarity_top_k=eval_batch_request.similarity_top_k,
         retrieval_strategy=eval_batch_request.retrieval_strategy,
         use_hyde=eval_batch_request.use_hyde,
+        hyde_num_hypotheses=eval_batch_request.hyde_num_hypotheses,
+        hyde_latency_budget_sec=eval_batch_request.hyde_latency_budget_sec,
         use_refine=eval_batch_request.use_refine,
         use_node_rerank=eval_batch_request.use_node_rerank,
         qa_followup=eval_batch_request.qa_followup,
@@ -59,8 +85,13 @@ def eval_batch(
     )
     logger.info(bucket_name)
     logger.info(file_name)
-    download_blob(bucket_name, file_name, "ground_truth.csv")
-    eval_df = pd.read_csv("./ground_truth.csv")
+    # One file per job, as several jobs may run at the same time
+    local_file_name = os.path.join(
+        tempfile.gettempdir(), f"ground_truth_{job.job_id}.csv"
+    )
+    download_blob(bucket_name, file_name, local_file_name)
+    eval_df = pd.read_csv(local_file_name)
+    os.remove(local_file_name)
     eval_df = eval_df[["question", "ground_truth"]]
     eval_df = eval_df.astype({"question": str, "ground_truth": str})
     logging.info(eval_df.dtypes)
@@ -72,16 +103,63 @@ def eval_batch(
         temperature=eval_batch_request.temperature,
     )
 
+    eval_uuid = str(uuid.uuid4())
+    run_columns = {
+        "date_time": datetime.now(),
+        "eval_uuid": eval_uuid,
+        "retrieval_strategy": eval_batch_request.retrieval_strategy,
+        "eval_model_name": eval_batch_request.eval_model_name,
+        "similarity_top_k": eval_batch_request.similarity_top_k,
+        "llm_model_name": eval_batch_request.llm_name,
+    }
+
+    def write_batch_to_bq(batch: pd.DataFrame):
+        write_results_to_bq(
+            batch.assign(**run_columns),
+            table_id=eval_batch_request.bq_eval_results_table_id,
+        )
+
+    # Re-running an interrupted evaluation with the same request and prompts
+    # resumes from its checkpoint
+    checkpoint_key = hashlib.sha256(
+        (eval_batch_request.model_dump_json() + str(prompts.to_dict())).encode()
+    ).hexdigest()[:16]
+    eval_runner = EvalRunner(
+        llm_evaluator,
+        max_concurrency=EVAL_MAX_CONCURRENCY,
+        max_retries=EVAL_MAX_RETRIES,
+        checkpoint_dir=os.path.join(EVAL_CHECKPOINT_DIR, checkpoint_key),
+        batch_size=EVAL_BATCH_SIZE,
+        batch_writer=write_batch_to_bq if EVAL_STREAM_RESULTS_TO_BQ else None,
+        progress_callback=job.report_progress,
+        cancel_event=job.cancel_event,
+    )
+
+    job.stage = "answering_questions"
     if eval_batch_request.use_react:
         react_agent = index_manager.get_react_agent(
+            query_engine=query_engine,
             prompts=prompts,
             llm_name=eval_batch_request.llm_name,
             temperature=eval_batch_request.temperature,
         )
-        eval_df = llm_evaluator.evaluate(react_agent.achat, eval_df)
+        eval_df = eval_runner.run(react_agent.achat, eval_df, loop=loop)
     else:
-        eval_df = llm_evaluator.evaluate(query_engine.aquery, eval_df)
+        eval_df = eval_runner.run(query_engine.aquery, eval_df, loop=loop)
+    # Rows which failed after all retries are not part of eval_df, they are
+    # reported with the job so a partial evaluation can be told apart
+    job.failed_rows = dict(eval_runner.failed_rows)
+    if job.failed_rows:
+        logger.warning(
+            f"{len(job.failed_rows)} questions failed after all retries: "
+            f"{sorted(job.failed_rows)}"
+        )
+    eval_df["question_idx"] = eval_df.index
+    eval_df = eval_df.reset_index(drop=True)
+    if job.cancel_event.is_set():
+        raise EvalCancelledError("Evaluation was cancelled")
 
+    job.stage = "ragas_metrics"
     vertexai_llm = ChatVertexAI(model_name=eval_batch_request.eval_model_name)
     vertexai_embeddings = VertexAIEmbeddings(
         model_name=eval_batch_request.embedding_model_name
@@ -96,19 +174,59 @@ def eval_batch(
     )
     ragas_results_df = result.to_pandas()[eval_batch_request.ragas_metrics].fillna(0)
 
-    eval_uuid = str(uuid.uuid4())
-    eval_df["date_time"] = datetime.now()
-    eval_df["eval_uuid"] = eval_uuid
-    eval_df["retrieval_strategy"] = eval_batch_request.retrieval_strategy
-    eval_df["eval_model_name"] = eval_batch_request.eval_model_name
-    eval_df["similarity_top_k"] = eval_batch_request.similarity_top_k
-    eval_df["llm_model_name"] = eval_batch_request.llm_name
-    eval_df["question_idx"] = eval_df.index
+    eval_df = eval_df.assign(**run_columns)
 
     eval_df = pd.concat([eval_df, ragas_results_df], axis=1)
     logging.info(eval_df.to_dict(orient="list"))
 
     # Uncomment the following line if you want to write results to BigQuery
+    # (or set eval_stream_results_to_bq to stream the per-question results)
     # write_results_to_bq(eval_df, table_id=eval_batch_request.bq_eval_results_table_id)
     logging.info(f"EVAL ID: {eval_uuid}")
+    if not eval_runner.failed_rows:
+        eval_runner.clear_checkpoint()
+    job.stage = None
     return eval_df.to_dict(orient="list")
+
+
+@router.post("/eval_batch")
+async def eval_batch(
+    eval_batch_request: EvalRequest,
+    index_manager=Depends(get_index_manager),
+    prompts=Depends(get_prompts),
+    eval_job_manager=Depends(get_eval_job_manager),
+) -> dict:
+    """Submit a batch evaluation job; poll /eval_batch/{job_id} for its results"""
+    loop = asyncio.get_running_loop()
+    job = eval_job_manager.submit(
+        lambda job: run_eval_batch(
+            eval_batch_request, index_manager, prompts, job, loop=loop
+        )
+    )
+    logger.info(f"Submitted evaluation job {job.job_id}")
+    return job.to_dict()
+
+
+@router.get("/eval_batch")
+def list_eval_batch_jobs(eval_job_manager=Depends(get_eval_job_manager)) -> list:
+    return [job.to_dict() for job in eval_job_manager.list_jobs()]
+
+
+@router.get("/eval_batch/{job_id}")
+def get_eval_batch_job(
+    job_id: str, eval_job_manager=Depends(get_eval_job_manager)
+) -> dict:
+    job = eval_job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job.to_dict(include_result=True)
+
+
+@router.post("/eval_batch/{job_id}/cancel")
+def cancel_eval_batch_job(
+    job_id: str, eval_job_manager=Depends(get_eval_job_manager)
+) -> dict:
+    job = eval_job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job.to_dict()
@@ -115,6 +115,11 @@ async def get_current_index_info(index_manager=Depends(get_index_manager)) -> di
     return index_manager.get_current_index_info()
 
 
+@router.get("/vector_search_cache_stats")
+async def vector_search_cache_stats(index_manager=Depends(get_index_manager)) -> dict:
+    return index_manager.get_vector_search_cache_stats()
+
+
 @router.post("/update_index")
 async def update_index(
     index_update: IndexUpdate, index_manager=Depends(get_index_manager)
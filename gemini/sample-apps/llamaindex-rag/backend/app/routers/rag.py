@@ -1,13 +1,17 @@
+import asyncio
+from datetime import datetime
 import logging
+import uuid
 
-from backend.app.dependencies import get_index_manager, get_prompts
+from backend.app.dependencies import (
+    get_index_manager,
+    get_prompts,
+    get_response_eval_worker,
+)
 from backend.app.models import RAGRequest
-from datasets import Dataset
+from backend.app.response_eval_worker import score_with_ragas
+from backend.rag.request_metrics import get_request_metrics, start_request_metrics
 from fastapi import APIRouter, Depends
-from langchain_google_vertexai import ChatVertexAI, VertexAIEmbeddings
-import pandas as pd
-from ragas import evaluate
-from ragas.metrics import answer_relevancy, context_relevancy, faithfulness
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -18,7 +22,9 @@ async def query_rag(
     rag_request: RAGRequest,
     index_manager=Depends(get_index_manager),
     prompts=Depends(get_prompts),
+    response_eval_worker=Depends(get_response_eval_worker),
 ) -> dict:
+    start_request_metrics()
     query_engine = index_manager.get_query_engine(
         prompts=prompts,
         llm_name=rag_request.llm_name,
@@ -26,6 +32,8 @@ async def query_rag(
         similarity_top_k=rag_request.similarity_top_k,
         retrieval_strategy=rag_request.retrieval_strategy,
         use_hyde=rag_request.use_hyde,
+        hyde_num_hypotheses=rag_request.hyde_num_hypotheses,
+        hyde_latency_budget_sec=rag_request.hyde_latency_budget_sec,
         use_refine=rag_request.use_refine,
         use_node_rerank=rag_request.use_node_rerank,
         qa_followup=rag_request.qa_followup,
@@ -33,6 +41,7 @@ async def query_rag(
     )
     if rag_request.use_react:
         react_agent = index_manager.get_react_agent(
+            query_engine=query_engine,
             prompts=prompts,
             llm_name=rag_request.llm_name,
             temperature=rag_request.temperature,
@@ -40,40 +49,64 @@ async def query_rag(
         response = await react_agent.achat(rag_request.query)
     else:
         response = await query_engine.aquery(rag_request.query)
+    metadata = {"latency_ms": get_request_metrics()}
 
     if rag_request.evaluate_response:
         retrieved_contexts = [r.node.text for r in response.source_nodes]
-        eval_df = pd.DataFrame(
-            {
-                "question": rag_request.query,
-                "answer": [response.response],
-                "contexts": [retrieved_contexts],
-            }
-        )
-        eval_df_ds = Dataset.from_pandas(eval_df)
+        record = {
+            "question": rag_request.query,
+            "answer": response.response,
+            "contexts": retrieved_contexts,
+            "eval_model_name": rag_request.eval_model_name,
+            "embedding_model_name": rag_request.embedding_model_name,
+        }
 
-        vertexai_llm = ChatVertexAI(model_name=rag_request.eval_model_name)
-        vertexai_embeddings = VertexAIEmbeddings(
-            model_name=rag_request.embedding_model_name
-        )
+        if rag_request.evaluate_in_background:
+            # Answer now, the scores are written to BigQuery by the worker
+            evaluation_id = str(uuid.uuid4())
+            queued = response_eval_worker.submit(
+                record
+                | {
+                    "evaluation_id": evaluation_id,
+                    "date_time": datetime.now(),
+                    "llm_model_name": rag_request.llm_name,
+                    "retrieval_strategy": rag_request.retrieval_strategy,
+                }
+            )
+            return {
+                "response": response.response,
+                "metadata": metadata,
+                "evaluation_id": evaluation_id,
+                "evaluation_status": "queued" if queued else "dropped",
+            }
 
-        metrics = [answer_relevancy, faithfulness, context_relevancy]
-        result = evaluate(
-            eval_df_ds,
-            metrics=metrics,
-            llm=vertexai_llm,
-            embeddings=vertexai_embeddings,
-        )
+        # Scoring blocks on LLM calls, keep it off the event loop
         result_dict = (
-            result.to_pandas()[
-                ["answer_relevancy", "faithfulness", "context_relevancy"]
-            ]
-            .fillna(0)
-            .iloc[0]
-            .to_dict()
-        )
+            await asyncio.to_thread(
+                score_with_ragas,
+                [record],
+                rag_request.eval_model_name,
+                rag_request.embedding_model_name,
+            )
+        )[0]
         retrieved_context_dict = {"retrieved_chunks": response.source_nodes}
         logger.info(result_dict)
-        return {"response": response.response} | result_dict | retrieved_context_dict
+        return (
+            {"response": response.response, "metadata": metadata}
+            | result_dict
+            | retrieved_context_dict
+        )
     else:
-        return {"response": response.response}
+        return {"response": response.response, "metadata": metadata}
+
+
+@router.get("/response_eval_stats")
+async def response_eval_stats(
+    response_eval_worker=Depends(get_response_eval_worker),
+) -> dict:
+    return response_eval_worker.stats()
+
+
+@router.get("/query_engine_pool_stats")
+async def query_engine_pool_stats(index_manager=Depends(get_index_manager)) -> dict:
+    return index_manager.get_query_engine_pool_stats()
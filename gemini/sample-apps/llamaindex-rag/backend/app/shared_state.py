@@ -1,3 +1,8 @@
+import functools
+
+from backend.app.eval_jobs import EvalJobManager
+from backend.app.response_eval_worker import ResponseEvalWorker
+from backend.rag.evaluate import write_results_to_bq
 from backend.rag.index_manager import IndexManager
 from backend.rag.prompts import Prompts
 from common.utils import load_config
@@ -18,6 +23,23 @@ QA_ENDPOINT_NAME = config.get("qa_endpoint_name")
 FIRESTORE_DB_NAME = config.get("firestore_db_name")
 FIRESTORE_NAMESPACE = config.get("firestore_namespace")
 BUCKET_NAME = config.get("docstore_bucket_name")
+QUERY_ENGINE_POOL_SIZE = config.get("query_engine_pool_size", 8)
+BM25_INDEX_DIR = config.get("bm25_index_dir", "/tmp/bm25_indexes")
+DOCSTORE_CACHE_SIZE = config.get("docstore_cache_size", 1024)
+QA_FOLLOWUP_CONCURRENT = config.get("qa_followup_concurrent", True)
+BASE_RETRIEVER_TIMEOUT = config.get("base_retriever_timeout")
+QA_RETRIEVER_TIMEOUT = config.get("qa_retriever_timeout")
+EVAL_MAX_CONCURRENCY = config.get("eval_max_concurrency", 8)
+EVAL_MAX_RETRIES = config.get("eval_max_retries", 2)
+EVAL_CHECKPOINT_DIR = config.get("eval_checkpoint_dir", "/tmp/eval_checkpoints")
+EVAL_BATCH_SIZE = config.get("eval_batch_size", 25)
+EVAL_STREAM_RESULTS_TO_BQ = config.get("eval_stream_results_to_bq", False)
+EVAL_MAX_CONCURRENT_JOBS = config.get("eval_max_concurrent_jobs", 2)
+RESPONSE_EVAL_BQ_TABLE_ID = config.get(
+    "response_eval_bq_table_id", "eval_results.response_eval_table"
+)
+RESPONSE_EVAL_BATCH_SIZE = config.get("response_eval_batch_size", 16)
+RESPONSE_EVAL_MAX_WAIT_SEC = config.get("response_eval_max_wait_sec", 5)
 
 # Initialize State of Prompts and Indexes
 
@@ -33,4 +55,17 @@ index_manager = IndexManager(
     firestore_db_name=FIRESTORE_DB_NAME,
     firestore_namespace=FIRESTORE_NAMESPACE,
     vs_bucket_name=BUCKET_NAME,
+    query_engine_pool_size=QUERY_ENGINE_POOL_SIZE,
+    bm25_index_dir=BM25_INDEX_DIR,
+    docstore_cache_size=DOCSTORE_CACHE_SIZE,
+    qa_followup_concurrent=QA_FOLLOWUP_CONCURRENT,
+    base_retriever_timeout=BASE_RETRIEVER_TIMEOUT,
+    qa_retriever_timeout=QA_RETRIEVER_TIMEOUT,
+)
+
+eval_job_manager = EvalJobManager(max_concurrent_jobs=EVAL_MAX_CONCURRENT_JOBS)
+response_eval_worker = ResponseEvalWorker(
+    write_fn=functools.partial(write_results_to_bq, table_id=RESPONSE_EVAL_BQ_TABLE_ID),
+    batch_size=RESPONSE_EVAL_BATCH_SIZE,
+    max_wait_sec=RESPONSE_EVAL_MAX_WAIT_SEC,
 )
@@ -0,0 +1,64 @@
+"""Micro-benchmark of clean_text throughput in MB/s"""
+
+import argparse
+import contextlib
+import io
+import random
+import re
+import time
+
+from common.utils import clean_text
+
+
+def reference_clean_text(text):
+    """The original character-by-character implementation"""
+    text = re.sub(r"\s+", " ", text).strip()
+    return "".join(char for char in text if char.isprintable() or char.isspace())
+
+
+def make_page(rng: random.Random, size: int, noise: float) -> str:
+    """Text resembling a parsed PDF page, with some control characters"""
+    words = "the revenue of alphabet grew by 12% in fiscal year 2023 ©".split()
+    chars = []
+    while len(chars) < size:
+        chars.extend(rng.choice(words))
+        chars.append(rng.choice("  \n\t"))
+        if rng.random() < noise:
+            chars.append(rng.choice("\x00\x0c\x1b​﻿"))
+    return "".join(chars[:size])
+
+
+def throughput_mb_s(fn, pages: list[str], repeat: int) -> float:
+    total_bytes = sum(len(page.encode()) for page in pages) * repeat
+    # clean_text prints the length of every page it cleans
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for page in pages:
+                fn(page)
+        elapsed = time.perf_counter() - start
+    return total_bytes / elapsed / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for noise in (0.0, 0.01, 0.1):
+        pages = [make_page(rng, args.page_size, noise) for _ in range(args.pages)]
+        for page in pages:
+            assert clean_text(page) == reference_clean_text(page)
+        reference = throughput_mb_s(reference_clean_text, pages, args.repeat)
+        optimized = throughput_mb_s(clean_text, pages, args.repeat)
+        print(
+            f"noise={noise}: reference {reference:.1f} MB/s, "
+            f"clean_text {optimized:.1f} MB/s ({optimized / reference:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Deterministic, offline stand-ins for the LLMs, embeddings and indexes"""
+
+import asyncio
+from collections.abc import Sequence
+import math
+import random
+import re
+import tempfile
+import time
+from typing import Any
+import zlib
+
+from backend.rag.index_manager import IndexManager
+from llama_index.core import Document, StorageContext, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.llms import (
+    CompletionResponse,
+    CompletionResponseGen,
+    CustomLLM,
+    LLMMetadata,
+)
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.node_parser import HierarchicalNodeParser, get_leaf_nodes
+from llama_index.core.schema import NodeRelationship, TextNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+
+VOCABULARY = (
+    "revenue income margin cloud advertising search youtube subscriptions "
+    "hardware devices capital expenditure operating expenses cash flow "
+    "buyback dividend quarter fiscal year growth headcount depreciation "
+    "tax rate segment services bets other backlog deferred liabilities"
+).split()
+RERANK_ANSWER = "Doc: 1, Relevance: 9\nDoc: 2, Relevance: 7\nDoc: 3, Relevance: 4"
+
+
+class FakeLLM(CustomLLM):
+    """LLM which answers every prompt with a fixed response after latency_sec"""
+
+    response: str = Field(
+        default="The revenue grew by 12% in the quarter.",
+        description="The completion returned for every prompt",
+    )
+    latency_sec: float = Field(default=0.0, description="Simulated model latency")
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            model_name="fake-llm", context_window=32768, num_output=256
+        )
+
+    @llm_completion_callback()
+    def complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        time.sleep(self.latency_sec)
+        return CompletionResponse(text=self.response)
+
+    @llm_completion_callback()
+    async def acomplete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        await asyncio.sleep(self.latency_sec)
+        return CompletionResponse(text=self.response)
+
+    @llm_completion_callback()
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        time.sleep(self.latency_sec)
+        yield CompletionResponse(text=self.response, delta=self.response)
+
+
+class HashEmbedding(BaseEmbedding):
+    """Normalized bag-of-words embedding with hashed (crc32) dimensions"""
+
+    embed_dim: int = Field(default=256, description="Embedding dimension")
+    latency_sec: float = Field(default=0.0, description="Simulated model latency")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.embed_dim
+        for token in re.findall(r"\w+", text.lower()):
+            vector[zlib.crc32(token.encode()) % self.embed_dim] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        time.sleep(self.latency_sec)
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        await asyncio.sleep(self.latency_sec)
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        time.sleep(self.latency_sec)
+        return self._embed(text)
+
+    async def _aget_text_embedding(self, text: str) -> list[float]:
+        await asyncio.sleep(self.latency_sec)
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        # One simulated round trip per batch, like the Vertex AI embeddings
+        time.sleep(self.latency_sec)
+        return [self._embed(text) for text in texts]
+
+
+def make_corpus(num_docs: int, words_per_doc: int, seed: int = 0) -> list[Document]:
+    """Synthetic filings made of sentences over VOCABULARY"""
+    rng = random.Random(seed)
+    docs = []
+    for i in range(num_docs):
+        sentences = []
+        num_words = 0
+        while num_words < words_per_doc:
+            words = rng.choices(VOCABULARY, k=rng.randint(8, 20))
+            sentences.append(
+                f"In {2015 + i % 10} the {' '.join(words)} was "
+                f"{rng.randint(1, 999)} million."
+            )
+            num_words += len(words) + 5
+        docs.append(
+            Document(
+                text=" ".join(sentences), metadata={"source": f"filing_{i}.pdf"}
+            )
+        )
+    return docs
+
+
+def make_queries(num_queries: int, seed: int = 1) -> list[str]:
+    rng = random.Random(seed)
+    return [
+        f"What was the {' '.join(rng.choices(VOCABULARY, k=3))} "
+        f"in {rng.randint(2015, 2024)}?"
+        for _ in range(num_queries)
+    ]
+
+
+def build_in_memory_indexes(
+    docs: Sequence[Document], embed_model: BaseEmbedding
+) -> tuple[VectorStoreIndex, VectorStoreIndex]:
+    """
+    Build the base (hierarchical leaf chunks) and QA (one question per leaf)
+    indexes over a single in-memory docstore, as the indexing pipeline does
+    with a Firestore namespace.
+    """
+    nodes = HierarchicalNodeParser.from_defaults(
+        chunk_sizes=[1024, 256, 64]
+    ).get_nodes_from_documents(docs)
+    leaf_nodes = get_leaf_nodes(nodes)
+    docstore = SimpleDocumentStore()
+    docstore.add_documents(nodes)
+    base_index = VectorStoreIndex(
+        leaf_nodes,
+        storage_context=StorageContext.from_defaults(docstore=docstore),
+        embed_model=embed_model,
+    )
+    question_nodes = []
+    for node in leaf_nodes:
+        question = TextNode(text=f"What does {node.text[:80]} say?")
+        question.relationships[NodeRelationship.SOURCE] = node.as_related_node_info()
+        question_nodes.append(question)
+    qa_index = VectorStoreIndex(
+        question_nodes,
+        storage_context=StorageContext.from_defaults(docstore=docstore),
+        embed_model=embed_model,
+    )
+    return base_index, qa_index
+
+
+class InMemoryIndexManager(IndexManager):
+    """
+    IndexManager over in-memory indexes of a synthetic corpus, with FakeLLM
+    and HashEmbedding instead of Vertex AI. Everything above the models and
+    the vector store (query engine pool, retrievers, BM25, postprocessors)
+    is the production code.
+    """
+
+    def __init__(
+        self,
+        num_docs: int = 50,
+        words_per_doc: int = 1500,
+        llm_latency_sec: float = 0.0,
+        embed_latency_sec: float = 0.0,
+        query_engine_pool_size: int = 16,
+        seed: int = 0,
+    ):
+        self.llm_latency_sec = llm_latency_sec
+        embed_model = HashEmbedding(latency_sec=embed_latency_sec)
+        base_index, qa_index = build_in_memory_indexes(
+            make_corpus(num_docs, words_per_doc, seed=seed), embed_model
+        )
+        self._in_memory_indexes = {"base": base_index, "qa": qa_index}
+        super().__init__(
+            project_id="benchmark",
+            location="local",
+            base_index_name="base",
+            base_endpoint_name="base",
+            qa_index_name="qa",
+            qa_endpoint_name="qa",
+            embeddings_model_name="hash-embedding",
+            firestore_db_name=None,
+            firestore_namespace=None,
+            vs_bucket_name="",
+            query_engine_pool_size=query_engine_pool_size,
+            bm25_index_dir=tempfile.mkdtemp(prefix="bm25_benchmark_"),
+            embed_model=embed_model,
+        )
+
+    def get_vector_index(
+        self,
+        index_name: str,
+        endpoint_name: str,
+        firestore_db_name: str | None,
+        firestore_namespace: str | None,
+    ) -> VectorStoreIndex:
+        return self._in_memory_indexes[index_name]
+
+    def get_vertex_llm(
+        self, llm_name: str, temperature: float, system_prompt: str
+    ) -> FakeLLM:
+        return FakeLLM(latency_sec=self.llm_latency_sec)
+
+    def get_reranker_llm(self, temperature: float, system_prompt: str) -> FakeLLM:
+        return FakeLLM(response=RERANK_ANSWER, latency_sec=self.llm_latency_sec)
@@ -0,0 +1,243 @@
+"""
+Latency (p50/p95/p99) and throughput of /query_rag per RAGConfig combination,
+measured offline against fake models and in-memory indexes
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+import sys
+import time
+import types
+
+from backend.app.eval_jobs import EvalJobManager
+from backend.app.response_eval_worker import ResponseEvalWorker
+from backend.benchmarks.fakes import InMemoryIndexManager, make_queries
+from backend.rag.index_manager import IndexManager
+from backend.rag.prompts import Prompts
+from fastapi import FastAPI
+import httpx
+
+FLAGS = {"hyde": "use_hyde", "rerank": "use_node_rerank", "hybrid": "hybrid_retrieval"}
+# Modules imported against the shared_state stub of create_app
+STUBBED_MODULES = (
+    "backend.app.shared_state",
+    "backend.app.dependencies",
+    "backend.app.routers.rag",
+)
+
+
+def create_app(index_manager: IndexManager, prompts: Prompts) -> FastAPI:
+    """The /query_rag router of the backend, served from index_manager"""
+    stubbed = "backend.app.shared_state" not in sys.modules
+    if stubbed:
+        # shared_state connects to Vertex AI and Firestore when it is
+        # imported, so the routers are imported against in-memory state
+        shared_state = types.ModuleType("backend.app.shared_state")
+        shared_state.index_manager = index_manager
+        shared_state.prompts = prompts
+        shared_state.eval_job_manager = EvalJobManager(max_concurrent_jobs=1)
+        shared_state.response_eval_worker = ResponseEvalWorker()
+        sys.modules["backend.app.shared_state"] = shared_state
+    try:
+        from backend.app import dependencies
+        from backend.app.routers import rag
+    finally:
+        if stubbed:
+            # Forget the stub and the modules bound to it, so later imports
+            # (e.g. of other tests) get the real shared_state
+            for name in STUBBED_MODULES:
+                sys.modules.pop(name, None)
+
+    app = FastAPI()
+    app.include_router(rag.router)
+    app.dependency_overrides[dependencies.get_index_manager] = lambda: index_manager
+    app.dependency_overrides[dependencies.get_prompts] = lambda: prompts
+    return app
+
+
+def rag_configs(retrieval_strategy: str, qa_followup: bool) -> dict[str, dict]:
+    """Every combination of FLAGS, keyed by a label such as "hyde+hybrid" """
+    configs = {}
+    for values in itertools.product((False, True), repeat=len(FLAGS)):
+        enabled = [name for name, value in zip(FLAGS, values) if value]
+        configs["+".join(enabled) or "baseline"] = {
+            "retrieval_strategy": retrieval_strategy,
+            "qa_followup": qa_followup,
+            "use_react": False,
+            "evaluate_response": False,
+            **{FLAGS[name]: value for name, value in zip(FLAGS, values)},
+        }
+    return configs
+
+
+def summarize(
+    latencies_ms: list[float],
+    stage_ms: dict[str, list[float]],
+    errors: int,
+    elapsed_sec: float,
+) -> dict:
+    if len(latencies_ms) < 2:
+        raise ValueError(
+            f"Only {len(latencies_ms)} requests succeeded ({errors} failed)"
+        )
+    quantiles = statistics.quantiles(latencies_ms, n=100, method="inclusive")
+    return {
+        "requests": len(latencies_ms),
+        "errors": errors,
+        "p50_ms": round(quantiles[49], 2),
+        "p95_ms": round(quantiles[94], 2),
+        "p99_ms": round(quantiles[98], 2),
+        "rps": round(len(latencies_ms) / elapsed_sec, 1),
+        "stage_p50_ms": {
+            stage: round(statistics.median(values), 2)
+            for stage, values in sorted(stage_ms.items())
+        },
+    }
+
+
+async def benchmark_config(
+    client: httpx.AsyncClient,
+    payload: dict,
+    queries: list[str],
+    num_requests: int,
+    concurrency: int,
+    warmup: int,
+) -> dict:
+    """
+    Send num_requests queries with at most concurrency requests in flight,
+    after warmup requests which build (and pool) the query engine
+    """
+    for query in queries[:warmup]:
+        await client.post("/query_rag", json=payload | {"query": query})
+    latencies_ms: list[float] = []
+    stage_ms: dict[str, list[float]] = {}
+    errors = 0
+    todo = iter(range(num_requests))
+
+    async def worker():
+        nonlocal errors
+        for i in todo:
+            query = queries[i % len(queries)]
+            start = time.perf_counter()
+            response = await client.post("/query_rag", json=payload | {"query": query})
+            latency_ms = (time.perf_counter() - start) * 1000
+            if response.status_code != 200:
+                errors += 1
+                continue
+            latencies_ms.append(latency_ms)
+            for stage, value in response.json()["metadata"]["latency_ms"].items():
+                if isinstance(value, int | float):
+                    stage_ms.setdefault(stage, []).append(value)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarize(latencies_ms, stage_ms, errors, time.perf_counter() - start)
+
+
+async def run_benchmark(
+    app: FastAPI,
+    configs: dict[str, dict],
+    queries: list[str],
+    num_requests: int = 200,
+    concurrency: int = 8,
+    warmup: int = 5,
+) -> dict[str, dict]:
+    # In-process ASGI transport: no sockets, server errors become 500s
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    results = {}
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://benchmark", timeout=None
+    ) as client:
+        for label, payload in configs.items():
+            results[label] = await benchmark_config(
+                client, payload, queries, num_requests, concurrency, warmup
+            )
+    return results
+
+
+def find_regressions(
+    results: dict[str, dict], baseline: dict[str, dict], max_regression: float
+) -> list[str]:
+    """Configs whose p95 latency grew by more than max_regression (a fraction)"""
+    regressions = []
+    for label, result in results.items():
+        if label not in baseline:
+            continue
+        before, after = baseline[label]["p95_ms"], result["p95_ms"]
+        if after > before * (1 + max_regression):
+            regressions.append(f"{label}: p95 {before:.1f} ms -> {after:.1f} ms")
+    return regressions
+
+
+def print_table(results: dict[str, dict]) -> None:
+    print(
+        f"{'config':<20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+        f"{'req/s':>8} {'errors':>7}"
+    )
+    for label, result in results.items():
+        print(
+            f"{label:<20} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} "
+            f"{result['p99_ms']:>9.1f} {result['rps']:>8.1f} {result['errors']:>7}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument(
+        "--retrieval-strategy",
+        default="auto_merging",
+        choices=["auto_merging", "parent", "baseline"],
+    )
+    parser.add_argument("--no-qa-followup", action="store_true")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON of a previous run")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.2,
+        help="Fail if a p95 grew by more than this fraction over --baseline",
+    )
+    args = parser.parse_args()
+
+    prompts = Prompts()
+    index_manager = InMemoryIndexManager(
+        num_docs=args.docs,
+        llm_latency_sec=args.llm_latency_ms / 1000,
+        embed_latency_sec=args.embed_latency_ms / 1000,
+    )
+    results = asyncio.run(
+        run_benchmark(
+            create_app(index_manager, prompts),
+            rag_configs(args.retrieval_strategy, not args.no_qa_followup),
+            make_queries(100),
+            num_requests=args.requests,
+            concurrency=args.concurrency,
+            warmup=args.warmup,
+        )
+    )
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(
+                results, json.load(f), args.max_regression
+            )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
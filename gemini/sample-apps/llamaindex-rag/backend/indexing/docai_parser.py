@@ -1,3 +1,6 @@
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 import json
 import logging
 import time
@@ -58,20 +61,20 @@ class DocAIParser:
             A tuple containing a list of parsed documents and a list of
             DocAIParsingResults.
         """
+        results: list[DocAIParsingResults] = []
         try:
-            operations = self._start_batch_process(
-                blobs, chunk_size, include_ancestor_headings
-            )
-            print(f"Number of operations started: {len(operations)}")
-            self._wait_for_operations(operations, timeout_sec, check_in_interval_sec)
-            print("Operations completed successfully")
-
-            for i, operation in enumerate(operations):
-                print(f"Operation {i + 1} metadata: {operation.metadata}")
-
-            results = self._get_results(operations)
-            print(f"Number of results: {len(results)}")
-            parsed_docs = self._parse_from_results(results)
+            parsed_docs = [
+                doc
+                for shard_docs in self.stream_parse(
+                    blobs,
+                    chunk_size=chunk_size,
+                    include_ancestor_headings=include_ancestor_headings,
+                    timeout_sec=timeout_sec,
+                    check_in_interval_sec=check_in_interval_sec,
+                    results=results,
+                )
+                for doc in shard_docs
+            ]
             print(f"Number of parsed documents: {len(parsed_docs)}")
             return parsed_docs, results
         except Exception as e:
@@ -82,6 +85,96 @@ class DocAIParser:
             # instead of raising an exception
             return [], []
 
+    def stream_parse(
+        self,
+        blobs: list[Blob],
+        chunk_size: int = 500,
+        include_ancestor_headings: bool = True,
+        timeout_sec: int = 3600,
+        check_in_interval_sec: int = 60,
+        blobs_per_operation: int = 20,
+        max_download_workers: int = 8,
+        results: list["DocAIParsingResults"] | None = None,  # noqa: F821
+    ) -> Iterator[list[Document]]:
+        """
+        Parses blobs with one Document AI batch operation per
+        blobs_per_operation blobs and yields the documents of each output
+        shard as soon as it is downloaded. Shards of an operation are
+        downloaded (max_download_workers at a time) as soon as that operation
+        completes, and at most 2 * max_download_workers parsed shards are held
+        in memory, so callers can chunk and embed while parsing continues.
+
+        Args:
+            blobs: List of GCS Blobs to parse.
+            chunk_size: Chunk size for Document AI processing.
+            include_ancestor_headings: Whether to include ancestor headings.
+            timeout_sec: Timeout in seconds for all operations.
+            check_in_interval_sec: Maximum interval between operation polls.
+            blobs_per_operation: Number of blobs per batch operation.
+            max_download_workers: Number of shards downloaded concurrently.
+            results: Optional list the DocAIParsingResults are appended to.
+
+        Yields:
+            The list of documents parsed from each output shard.
+        """
+        operations = []
+        for idx in range(0, len(blobs), blobs_per_operation):
+            operations.extend(
+                self._start_batch_process(
+                    blobs[idx : idx + blobs_per_operation],
+                    chunk_size,
+                    include_ancestor_headings,
+                )
+            )
+        print(f"Number of operations started: {len(operations)}")
+
+        storage_client = storage.Client()
+        pending_operations = list(operations)
+        pending_shards: deque = deque()
+        in_flight: set[Future] = set()
+        max_in_flight = 2 * max_download_workers
+        deadline = time.monotonic() + timeout_sec
+        poll_interval = 1.0
+
+        with ThreadPoolExecutor(max_workers=max_download_workers) as executor:
+            while pending_operations or pending_shards or in_flight:
+                for operation in [op for op in pending_operations if op.done()]:
+                    pending_operations.remove(operation)
+                    if operation.exception():
+                        raise KeyError(f"Operation failed: {operation.exception()}")
+                    print(f"Operation completed, metadata: {operation.metadata}")
+                    for result in self._get_results([operation]):
+                        if results is not None:
+                            results.append(result)
+                        pending_shards.extend(
+                            (shard, result.source_path)
+                            for shard in self._list_result_shards(
+                                storage_client, result
+                            )
+                        )
+                    poll_interval = 1.0
+
+                while pending_shards and len(in_flight) < max_in_flight:
+                    shard, source_path = pending_shards.popleft()
+                    in_flight.add(
+                        executor.submit(self._parse_shard, shard, source_path)
+                    )
+
+                done = {future for future in in_flight if future.done()}
+                for future in done:
+                    in_flight.remove(future)
+                    yield future.result()
+                if done:
+                    continue
+
+                if pending_operations and time.monotonic() > deadline:
+                    raise TimeoutError("Timeout exceeded!")
+                if in_flight:
+                    wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                elif pending_operations:
+                    time.sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, check_in_interval_sec)
+
     def _start_batch_process(
         self, blobs: list[Blob], chunk_size: int, include_ancestor_headings: bool
     ):
@@ -127,19 +220,6 @@ class DocAIParser:
             print(f"Error starting batch process: {str(e)}")
             raise
 
-    def _wait_for_operations(self, operations, timeout_sec, check_in_interval_sec):
-        time_elapsed = 0
-        while any(not operation.done() for operation in operations):
-            time.sleep(check_in_interval_sec)
-            time_elapsed += check_in_interval_sec
-            if time_elapsed > timeout_sec:
-                raise TimeoutError("Timeout exceeded!")
-
-        # Check for errors in completed operations
-        for operation in operations:
-            if operation.exception():
-                raise KeyError(f"Operation failed: {operation.exception()}")
-
     def _get_results(self, operations) -> list["DocAIParsingResults"]:  # noqa: F821
         results = []
         for operation in operations:
@@ -156,65 +236,64 @@ class DocAIParser:
                 print(f"Warning: Unexpected metadata structure: {metadata}")
         return results
 
-    def _parse_from_results(self, results: list["DocAIParsingResults"]):  # noqa: F821
-        documents = []
-        storage_client = storage.Client()
+    @staticmethod
+    def _list_result_shards(
+        storage_client, result: "DocAIParsingResults"  # noqa: F821
+    ) -> list:
+        """List the JSON output shards of a single parsed document"""
+        print(
+            f"Processing result: source_path={result.source_path}, "
+            f"parsed_path={result.parsed_path}"
+        )
+        if not result.parsed_path:
+            print(
+                "Warning: Empty parsed_path for source "
+                f"{result.source_path}. Skipping."
+            )
+            return []
 
-        for result in results:
+        try:
+            bucket_name, prefix = result.parsed_path.replace("gs://", "").split("/", 1)
+        except ValueError:
             print(
-                f"Processing result: source_path={result.source_path}, "
-                f"parsed_path={result.parsed_path}"
+                f"Error: Invalid parsed_path format for {result.source_path}. Skipping."
             )
-            if not result.parsed_path:
-                print(
-                    "Warning: Empty parsed_path for source "
-                    f"{result.source_path}. Skipping."
-                )
-                continue
+            return []
 
-            try:
-                bucket_name, prefix = result.parsed_path.replace("gs://", "").split(
-                    "/", 1
-                )
-            except ValueError:
+        bucket = storage_client.bucket(bucket_name)
+        blobs = [
+            blob
+            for blob in bucket.list_blobs(prefix=prefix)
+            if blob.name.endswith(".json")
+        ]
+        print(f"Found {len(blobs)} JSON blobs in {result.parsed_path}")
+        return blobs
+
+    @staticmethod
+    def _parse_shard(blob, source_path: str) -> list[Document]:
+        """Download and parse a single output shard into documents"""
+        print(f"Processing JSON blob: {blob.name}")
+        documents = []
+        try:
+            doc_data = json.loads(blob.download_as_bytes())
+            chunked_document = doc_data.get("chunkedDocument", {})
+            if "chunks" in chunked_document:
+                for chunk in chunked_document["chunks"]:
+                    doc = Document(
+                        text=chunk["content"],
+                        metadata={
+                            "chunk_id": chunk["chunkId"],
+                            "source": source_path,
+                        },
+                    )
+                    documents.append(doc)
+            else:
                 print(
-                    f"Error: Invalid parsed_path format for {result.source_path}. Skipping."
+                    "Warning: Expected 'chunkedDocument' "
+                    f"structure not found in {blob.name}"
                 )
-                continue
-
-            bucket = storage_client.bucket(bucket_name)
-            blobs = list(bucket.list_blobs(prefix=prefix))
-            print(f"Found {len(blobs)} blobs in {result.parsed_path}")
-
-            for blob in blobs:
-                if blob.name.endswith(".json"):
-                    print(f"Processing JSON blob: {blob.name}")
-                    try:
-                        content = blob.download_as_text()
-                        doc_data = json.loads(content)
-
-                        if (
-                            "chunkedDocument" in doc_data
-                            and "chunks" in doc_data["chunkedDocument"]
-                        ):
-                            for chunk in doc_data["chunkedDocument"]["chunks"]:
-                                doc = Document(
-                                    text=chunk["content"],
-                                    metadata={
-                                        "chunk_id": chunk["chunkId"],
-                                        "source": result.source_path,
-                                    },
-                                )
-                                documents.append(doc)
-                        else:
-                            print(
-                                "Warning: Expected 'chunkedDocument' "
-                                f"structure not found in {blob.name}"
-                            )
-                    except Exception as e:
-                        print(f"Error processing blob {blob.name}: {str(e)}")
-
-        print(f"Total documents created: {len(documents)}")
+        except Exception as e:
+            print(f"Error processing blob {blob.name}: {str(e)}")
         return documents
 
 
@@ -0,0 +1,156 @@
+"""Local manifest of indexed source files for incremental indexing"""
+
+from collections.abc import Sequence
+import hashlib
+import json
+import logging
+import os
+
+from common.utils import Blob
+from llama_index.core.schema import BaseNode, NodeRelationship, RelatedNodeInfo
+
+logging.basicConfig(level=logging.INFO)  # Set the desired logging level
+logger = logging.getLogger(__name__)
+
+
+def assign_content_ids(nodes: Sequence[BaseNode]) -> dict[str, str]:
+    """
+    Replace the (random) ids of documents and nodes with ids derived from
+    their source file and content, so unchanged chunks keep their id across
+    runs and do not have to be re-embedded. Relationships between the given
+    nodes are rewritten to the new ids. Returns the old -> new id mapping.
+    """
+    id_map: dict[str, str] = {}
+    seen: dict[str, int] = {}
+    for node in nodes:
+        digest = hashlib.sha256(
+            f"{node.metadata.get('source', '')}\n{node.get_content()}".encode()
+        ).hexdigest()
+        # Identical text may appear at several levels of the hierarchy
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        id_map[node.node_id] = f"{digest[:32]}-{occurrence}"
+
+    def remap(info: RelatedNodeInfo) -> RelatedNodeInfo:
+        if info.node_id in id_map:
+            info.node_id = id_map[info.node_id]
+        return info
+
+    for node in nodes:
+        node.id_ = id_map[node.node_id]
+        for relationship, related in node.relationships.items():
+            if isinstance(related, list):
+                node.relationships[relationship] = [remap(r) for r in related]
+            else:
+                node.relationships[relationship] = remap(related)
+    return id_map
+
+
+def group_ids_by_source(
+    nodes: Sequence[BaseNode], doc_sources: dict[str, str]
+) -> dict[str, list[str]]:
+    """Group node ids by the GCS path of the file they were parsed from"""
+    groups: dict[str, list[str]] = {}
+    for node in nodes:
+        source = node.metadata.get("source") if node.metadata else None
+        if source is None:
+            source_info = node.relationships.get(NodeRelationship.SOURCE)
+            source = doc_sources.get(source_info.node_id) if source_info else None
+        if source is None:
+            logger.info(f"Could not determine source file of node {node.node_id}")
+            continue
+        groups.setdefault(source, []).append(node.node_id)
+    return groups
+
+
+class IndexManifest:
+    """
+    JSON manifest recording, per indexed source file, the MD5 hash of the
+    file and the ids it produced in the docstore, the base vector index and
+    the QA vector index (keyed by source document id). Comparing it against
+    a bucket listing tells which files need to be re-parsed and which
+    datapoints to upsert or delete. The manifest also records the indexes
+    it describes, so it is never applied to an index it did not build.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.target: dict | None = None
+        self.files: dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+            self.files = manifest["files"]
+            self.target = manifest.get("target")
+
+    def check_target(self, target: dict, index_is_empty: bool) -> None:
+        """
+        Raise if the manifest does not describe the given indexes: either it
+        was written for other indexes, or it is empty while the index already
+        holds datapoints (e.g. from a full run) which it cannot track.
+        """
+        if self.files and self.target != target:
+            raise ValueError(
+                f"Index manifest {self.path} was written for {self.target}, "
+                f"not {target}"
+            )
+        if not self.files and not index_is_empty:
+            raise ValueError(
+                f"Index manifest {self.path} is empty but the vector index "
+                "already contains datapoints; run incremental indexing "
+                "against an empty index"
+            )
+        self.target = target
+
+    def diff(self, blobs: Sequence[Blob]) -> tuple[list[Blob], list[str]]:
+        """Return (new or changed blobs, paths of files no longer in the bucket)"""
+        changed = [
+            blob
+            for blob in blobs
+            if blob.md5_hash is None
+            or self.files.get(blob.path, {}).get("md5") != blob.md5_hash
+        ]
+        current_paths = {blob.path for blob in blobs}
+        removed = [path for path in self.files if path not in current_paths]
+        return changed, removed
+
+    def get(self, path: str) -> dict:
+        return self.files.get(
+            path, {"md5": None, "stored_ids": [], "embedded_ids": [], "qa_ids": {}}
+        )
+
+    def update(
+        self,
+        path: str,
+        md5_hash: str | None,
+        stored_ids: list[str],
+        embedded_ids: list[str],
+        qa_ids: dict[str, list[str]],
+    ) -> None:
+        self.files[path] = {
+            "md5": md5_hash,
+            "stored_ids": stored_ids,
+            "embedded_ids": embedded_ids,
+            "qa_ids": qa_ids,
+        }
+
+    def remove(self, path: str) -> None:
+        self.files.pop(path, None)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"target": self.target, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+
+
+def invalidate_manifest(path: str) -> None:
+    """
+    Delete the manifest before a full run, whose datapoints and docstore
+    entries it does not record, so a later incremental run refuses to
+    update the index instead of duplicating them.
+    """
+    if os.path.exists(path):
+        logger.info(f"Full indexing run, invalidating index manifest {path}")
+        os.remove(path)
@@ -0,0 +1,154 @@
+"""Bounded, rate-limited and checkpointed extraction of hypothetical questions"""
+
+import asyncio
+from collections.abc import Sequence
+import hashlib
+import json
+import logging
+import os
+
+from backend.indexing.prompts import QA_EXTRACTION_PROMPT, QA_PARSER_PROMPT
+from backend.rag.rate_limiter import TokenRateLimiter, estimate_tokens
+from llama_index.core import Document
+from llama_index.core.extractors import QuestionsAnsweredExtractor
+from llama_index.core.program import LLMTextCompletionProgram
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo
+from pydantic import BaseModel
+from tqdm import tqdm
+
+logging.basicConfig(level=logging.INFO)  # Set the desired logging level
+logger = logging.getLogger(__name__)
+
+
+class QuesionsAnswered(BaseModel):
+    """List of Questions Answered by Document"""
+
+    questions_list: list[str]
+
+
+def checkpoint_key(doc: Document) -> str:
+    """Key identifying a document by source and content, stable across runs"""
+    return hashlib.sha256(
+        f"{doc.metadata.get('source', '')}\n{doc.get_content()}".encode()
+    ).hexdigest()
+
+
+class QAExtractionStage:
+    """
+    Generates the questions answered by each document with at most
+    max_concurrency documents in flight and an optional tokens_per_minute
+    quota. The questions of every finished document are appended to a
+    local JSONL checkpoint, so an interrupted run only processes the
+    documents which have no checkpointed result yet. Documents whose
+    extraction fails are logged and retried on the next run.
+    """
+
+    def __init__(
+        self,
+        llm,
+        checkpoint_path: str | None = None,
+        max_concurrency: int = 8,
+        tokens_per_minute: int | None = None,
+        num_questions: int = 5,
+        output_token_estimate: int = 256,
+    ):
+        self.llm = llm
+        self.checkpoint_path = checkpoint_path
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = TokenRateLimiter(tokens_per_minute)
+        self.num_questions = num_questions
+        self.output_token_estimate = output_token_estimate
+        self.extractor = QuestionsAnsweredExtractor(
+            llm, questions=num_questions, prompt_template=QA_EXTRACTION_PROMPT
+        )
+        self.program = LLMTextCompletionProgram.from_defaults(
+            output_cls=QuesionsAnswered,
+            prompt_template_str=QA_PARSER_PROMPT,
+            verbose=True,
+        )
+
+    def load_checkpoint(self) -> dict[str, list[str]]:
+        """Return the checkpointed questions keyed by checkpoint_key"""
+        completed: dict[str, list[str]] = {}
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return completed
+        with open(self.checkpoint_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A run killed mid-write leaves a truncated last line
+                    continue
+                completed[record["key"]] = record["questions"]
+        return completed
+
+    async def _extract(self, doc: Document) -> list[str]:
+        await self.rate_limiter.acquire(
+            estimate_tokens(doc.get_content()) + self.output_token_estimate
+        )
+        metadata = await self.extractor._aextract_questions_from_node(doc)
+        await self.rate_limiter.acquire(
+            estimate_tokens(str(metadata)) + self.output_token_estimate
+        )
+        parsed = await self.program.acall(questions_list=metadata)
+        return parsed.questions_list
+
+    async def arun(self, li_docs: Sequence[Document]) -> list[Document]:
+        """Return one question Document per extracted question"""
+        completed = self.load_checkpoint()
+        keys = [checkpoint_key(doc) for doc in li_docs]
+        todo = [
+            (doc, key) for doc, key in zip(li_docs, keys) if key not in completed
+        ]
+        logger.info(
+            f"QA extraction: {len(li_docs) - len(todo)} documents checkpointed, "
+            f"{len(todo)} to process"
+        )
+
+        checkpoint_file = None
+        if self.checkpoint_path:
+            os.makedirs(
+                os.path.dirname(os.path.abspath(self.checkpoint_path)), exist_ok=True
+            )
+            checkpoint_file = open(self.checkpoint_path, "a")
+        queue = iter(todo)
+        progress = tqdm(total=len(todo), desc="Extracting questions")
+
+        async def worker():
+            for doc, key in queue:
+                try:
+                    questions = await self._extract(doc)
+                except Exception as e:
+                    logger.info(f"Unparsable questions exception {e}")
+                    progress.update()
+                    continue
+                completed[key] = questions
+                if checkpoint_file:
+                    checkpoint_file.write(
+                        json.dumps({"key": key, "questions": questions}) + "\n"
+                    )
+                    checkpoint_file.flush()
+                progress.update()
+
+        try:
+            await asyncio.gather(
+                *[worker() for _ in range(min(self.max_concurrency, len(todo)))]
+            )
+        finally:
+            progress.close()
+            if checkpoint_file:
+                checkpoint_file.close()
+
+        q_docs = []
+        for doc, key in zip(li_docs, keys):
+            for q in completed.get(key, []):
+                logger.info(f"Question extracted: {q}")
+                q_doc = Document(text=q)
+                q_doc.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
+                    node_id=doc.doc_id
+                )
+                q_docs.append(q_doc)
+        return q_docs
+
+    def run(self, li_docs: Sequence[Document]) -> list[Document]:
+        return asyncio.run(self.arun(li_docs))
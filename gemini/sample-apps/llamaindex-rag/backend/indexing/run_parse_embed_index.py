@@ -1,15 +1,24 @@
 """Master script for parsing, embedding
 and indexing data living in a GCS bucket"""
 
-import asyncio
+import argparse
 import logging
 import os
 
 from backend.indexing.docai_parser import DocAIParser
-from backend.indexing.prompts import QA_EXTRACTION_PROMPT, QA_PARSER_PROMPT
-from backend.indexing.vector_search_utils import (
+from backend.indexing.index_manifest import (
+    IndexManifest,
+    assign_content_ids,
+    group_ids_by_source,
+    invalidate_manifest,
+)
+from backend.indexing.qa_extraction import QAExtractionStage
+from backend.indexing.vector_search_utils import (  # noqa: E501
+    get_existing_index_and_endpoint,
     get_or_create_existing_index,
-)  # noqa: E501
+    get_vectors_count,
+)
+from backend.rag.bm25_index import PersistentBM25Index
 from common.utils import (
     create_pdf_blob_list,
     download_bucket_with_transfer_manager,
@@ -17,16 +26,12 @@ from common.utils import (
 )
 from google.cloud import aiplatform
 from llama_index.core import Document, Settings, StorageContext, VectorStoreIndex
-from llama_index.core.extractors import QuestionsAnsweredExtractor
 from llama_index.core.node_parser import HierarchicalNodeParser, SentenceSplitter
-from llama_index.core.program import LLMTextCompletionProgram
 from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
 from llama_index.embeddings.vertex import VertexTextEmbedding
 from llama_index.llms.vertex import Vertex
 from llama_index.storage.docstore.firestore import FirestoreDocumentStore
 from llama_index.vector_stores.vertexaivectorsearch import VertexAIVectorStore
-from pydantic import BaseModel
-from tqdm.asyncio import tqdm_asyncio
 import yaml
 
 logging.basicConfig(level=logging.INFO)  # Set the desired logging level
@@ -69,15 +74,26 @@ FIRESTORE_DB_NAME = config.get("firestore_db_name")
 FIRESTORE_NAMESPACE = config.get("firestore_namespace")
 QA_INDEX_NAME = config.get("qa_index_name")
 QA_ENDPOINT_NAME = config.get("qa_endpoint_name")
-
-
-class QuesionsAnswered(BaseModel):
-    """List of Questions Answered by Document"""
-
-    questions_list: list[str]
-
-
-def create_qa_index(li_docs, docstore, embed_model, llm):
+BM25_INDEX_DIR = config.get("bm25_index_dir", "/tmp/bm25_indexes")
+INDEX_MANIFEST_PATH = config.get("index_manifest_path", "/tmp/index_manifest.json")
+QA_EXTRACTION_CONCURRENCY = config.get("qa_extraction_concurrency", 8)
+QA_EXTRACTION_TOKENS_PER_MINUTE = config.get("qa_extraction_tokens_per_minute")
+QA_CHECKPOINT_PATH = config.get("qa_checkpoint_path", "/tmp/qa_checkpoint.jsonl")
+DOCAI_BLOBS_PER_OPERATION = config.get("docai_blobs_per_operation", 20)
+DOCAI_DOWNLOAD_WORKERS = config.get("docai_download_workers", 8)
+
+
+def extract_qa_docs(li_docs, llm):
+    """generates hypothetical questions answered by each document"""
+    return QAExtractionStage(
+        llm,
+        checkpoint_path=QA_CHECKPOINT_PATH,
+        max_concurrency=QA_EXTRACTION_CONCURRENCY,
+        tokens_per_minute=QA_EXTRACTION_TOKENS_PER_MINUTE,
+    ).run(li_docs)
+
+
+def create_qa_index(li_docs, docstore, embed_model, llm, bm25_index=None):
     """creates index of hypothetical questions"""
     qa_index, qa_endpoint = get_or_create_existing_index(
         QA_INDEX_NAME, QA_ENDPOINT_NAME, APPROXIMATE_NEIGHBORS_COUNT
@@ -89,48 +105,10 @@ def create_qa_index(li_docs, docstore, embed_model, llm):
         endpoint_id=qa_endpoint.name,
         gcs_bucket_name=DOCSTORE_BUCKET_NAME,
     )
-    qa_extractor = QuestionsAnsweredExtractor(
-        llm, questions=5, prompt_template=QA_EXTRACTION_PROMPT
-    )
-
-    async def extract_batch(li_docs):
-        return await tqdm_asyncio.gather(
-            *[qa_extractor._aextract_questions_from_node(doc) for doc in li_docs]
-        )
-
-    loop = asyncio.get_event_loop()
-    metadata_list = loop.run_until_complete(extract_batch(li_docs))
-
-    program = LLMTextCompletionProgram.from_defaults(
-        output_cls=QuesionsAnswered,
-        prompt_template_str=QA_PARSER_PROMPT,
-        verbose=True,
-    )
-
-    async def parse_batch(metadata_list):
-        return await asyncio.gather(
-            *[program.acall(questions_list=x) for x in metadata_list],
-            return_exceptions=True,
-        )
-
-    parsed_questions = loop.run_until_complete(parse_batch(metadata_list))
-
-    loop.close()
-
-    q_docs = []
-    for doc, questions in zip(li_docs, parsed_questions):
-        if isinstance(questions, Exception):
-            logger.info(f"Unparsable questions exception {questions}")
-            continue
-        else:
-            for q in questions.questions_list:
-                logger.info(f"Question extracted: {q}")
-                q_doc = Document(text=q)
-                q_doc.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
-                    node_id=doc.doc_id
-                )
-                q_docs.append(q_doc)
+    q_docs = extract_qa_docs(li_docs, llm)
     docstore.add_documents(li_docs)
+    if bm25_index:
+        bm25_index.add_nodes(li_docs)
     storage_context = StorageContext.from_defaults(
         docstore=docstore, vector_store=qa_vector_store
     )
@@ -140,9 +118,11 @@ def create_qa_index(li_docs, docstore, embed_model, llm):
         embed_model=embed_model,
         llm=llm,
     )
+    return q_docs
 
 
-def create_hierarchical_index(li_docs, docstore, vector_store, embed_model, llm):
+def build_hierarchical_nodes(li_docs):
+    """returns all hierarchical nodes and the leaf nodes to embed"""
     # Let hierarchical node parser take care of granular chunking
     node_parser = HierarchicalNodeParser.from_defaults(chunk_sizes=CHUNK_SIZES)
     nodes = node_parser.get_nodes_from_documents(li_docs)
@@ -151,7 +131,16 @@ def create_hierarchical_index(li_docs, docstore, vector_store, embed_model, llm)
     num_leaf_nodes = len(leaf_nodes)
     num_nodes = len(nodes)
     logger.info(f"There are {num_leaf_nodes} leaf_nodes and {num_nodes} total nodes")
+    return nodes, leaf_nodes
+
+
+def create_hierarchical_index(
+    li_docs, docstore, vector_store, embed_model, llm, bm25_index=None
+):
+    nodes, leaf_nodes = build_hierarchical_nodes(li_docs)
     docstore.add_documents(nodes)
+    if bm25_index:
+        bm25_index.add_nodes(nodes)
     storage_context = StorageContext.from_defaults(
         docstore=docstore, vector_store=vector_store
     )
@@ -163,7 +152,8 @@ def create_hierarchical_index(li_docs, docstore, vector_store, embed_model, llm)
     )
 
 
-def create_flat_index(li_docs, docstore, vector_store, embed_model, llm):
+def build_flat_nodes(li_docs):
+    """returns linked chunk nodes to embed for the flat indexing method"""
     sentence_splitter = SentenceSplitter(chunk_size=CHUNK_OVERLAP)
     # Chunk into granular chunks manually
     node_chunk_list = []
@@ -188,16 +178,24 @@ def create_flat_index(li_docs, docstore, vector_store, embed_model, llm):
         node_chunk_list.extend(nodes)
 
     nodes = node_chunk_list
+    for node in nodes:
+        node.metadata.pop("excluded_embed_metadata_keys", None)
+        node.metadata.pop("excluded_llm_metadata_keys", None)
+    return nodes
+
+
+def create_flat_index(
+    li_docs, docstore, vector_store, embed_model, llm, bm25_index=None
+):
+    nodes = build_flat_nodes(li_docs)
     logger.info("embedding...")
     docstore.add_documents(li_docs)
+    if bm25_index:
+        bm25_index.add_nodes(li_docs)
     storage_context = StorageContext.from_defaults(
         docstore=docstore, vector_store=vector_store
     )
 
-    for node in nodes:
-        node.metadata.pop("excluded_embed_metadata_keys", None)
-        node.metadata.pop("excluded_llm_metadata_keys", None)
-
     # Creating an index automatically embeds and creates the
     # vector db collection
     VectorStoreIndex(
@@ -208,8 +206,159 @@ def create_flat_index(li_docs, docstore, vector_store, embed_model, llm):
     )
 
 
-def main():
+def index_incrementally(
+    changed_blobs,
+    removed_paths,
+    manifest,
+    parser,
+    docstore,
+    vs_index,
+    vector_store,
+    embed_model,
+    llm,
+    bm25_index=None,
+):
+    """
+    Re-parses only new or changed files and upserts or deletes only the
+    datapoints, docstore entries and BM25 entries they affect.
+    Node ids are derived from content, so chunks of a changed file whose
+    text did not change keep their id and are not re-embedded.
+    """
+    parsed_docs = []
+    if changed_blobs:
+        parsed_docs, _ = parser.batch_parse(
+            changed_blobs, chunk_size=CHUNK_SIZE, include_ancestor_headings=True
+        )
+    li_docs = [Document(text=doc.text, metadata=doc.metadata) for doc in parsed_docs]
+
+    qa_enabled = bool(QA_INDEX_NAME or QA_ENDPOINT_NAME)
+    if INDEXING_METHOD == "hierarchical":
+        nodes, embed_nodes = build_hierarchical_nodes(li_docs)
+        stored_nodes = nodes
+        if qa_enabled:
+            # create_qa_index stores the source documents as well
+            stored_nodes = nodes + li_docs
+    else:
+        embed_nodes = build_flat_nodes(li_docs)
+        nodes = embed_nodes
+        stored_nodes = li_docs
+    assign_content_ids(li_docs + nodes)
+    doc_sources = {doc.doc_id: doc.metadata["source"] for doc in li_docs}
+    docs_by_source = group_ids_by_source(li_docs, doc_sources)
+    stored_by_source = group_ids_by_source(stored_nodes, doc_sources)
+    embedded_by_source = group_ids_by_source(embed_nodes, doc_sources)
+
+    # Files that failed to parse keep their previous entries
+    parsed_blobs = [blob for blob in changed_blobs if blob.path in docs_by_source]
+    for blob in changed_blobs:
+        if blob.path not in docs_by_source:
+            logger.info(f"No documents parsed from {blob.path}, keeping old entries")
+
+    remove_embedded, remove_stored, remove_qa = [], [], []
+    new_embedded, new_stored = set(), set()
+    for blob in parsed_blobs:
+        old = manifest.get(blob.path)
+        new_embedded |= set(embedded_by_source.get(blob.path, [])) - set(
+            old["embedded_ids"]
+        )
+        new_stored |= set(stored_by_source.get(blob.path, [])) - set(old["stored_ids"])
+        remove_embedded += sorted(
+            set(old["embedded_ids"]) - set(embedded_by_source.get(blob.path, []))
+        )
+        remove_stored += sorted(
+            set(old["stored_ids"]) - set(stored_by_source.get(blob.path, []))
+        )
+    for path in removed_paths:
+        old = manifest.get(path)
+        remove_embedded += old["embedded_ids"]
+        remove_stored += old["stored_ids"]
+        remove_qa += [q for q_ids in old["qa_ids"].values() for q in q_ids]
+
+    # Questions are only generated for documents whose content changed
+    qa_ids_by_source = {}
+    if qa_enabled:
+        old_qa_ids = {}
+        for blob in parsed_blobs:
+            old_qa_ids.update(manifest.get(blob.path)["qa_ids"])
+        qa_input_docs = [doc for doc in li_docs if doc.doc_id not in old_qa_ids]
+        q_docs = []
+        if qa_input_docs:
+            q_docs = create_qa_index(qa_input_docs, docstore, embed_model, llm)
+        qa_ids = {doc.doc_id: list(old_qa_ids.get(doc.doc_id, [])) for doc in li_docs}
+        for q_doc in q_docs:
+            source_doc_id = q_doc.relationships[NodeRelationship.SOURCE].node_id
+            qa_ids[source_doc_id].append(q_doc.doc_id)
+        for doc_id, q_ids in old_qa_ids.items():
+            if doc_id not in qa_ids:
+                remove_qa += q_ids
+        for doc_id, q_ids in qa_ids.items():
+            qa_ids_by_source.setdefault(doc_sources[doc_id], {})[doc_id] = q_ids
+
+    logger.info(
+        f"Upserting {len(new_embedded)} datapoints, "
+        f"removing {len(remove_embedded)} datapoints"
+    )
+    if remove_embedded:
+        vs_index.remove_datapoints(datapoint_ids=remove_embedded)
+    if remove_qa:
+        qa_index, _ = get_existing_index_and_endpoint(QA_INDEX_NAME, QA_ENDPOINT_NAME)
+        qa_index.remove_datapoints(datapoint_ids=remove_qa)
+    for node_id in remove_stored:
+        docstore.delete_document(node_id, raise_error=False)
+
+    parsed_stored_ids = {
+        node_id
+        for blob in parsed_blobs
+        for node_id in stored_by_source.get(blob.path, [])
+    }
+    changed_stored = [n for n in stored_nodes if n.node_id in parsed_stored_ids]
+    docstore.add_documents(changed_stored)
+    if bm25_index:
+        bm25_index.delete_nodes(remove_stored)
+        bm25_index.add_nodes([n for n in changed_stored if n.node_id in new_stored])
+
+    to_embed = [n for n in embed_nodes if n.node_id in new_embedded]
+    if to_embed:
+        storage_context = StorageContext.from_defaults(
+            docstore=docstore, vector_store=vector_store
+        )
+        VectorStoreIndex(
+            nodes=to_embed,
+            storage_context=storage_context,
+            embed_model=embed_model,
+            llm=llm,
+        )
+
+    for blob in parsed_blobs:
+        manifest.update(
+            blob.path,
+            blob.md5_hash,
+            stored_ids=stored_by_source.get(blob.path, []),
+            embedded_ids=embedded_by_source.get(blob.path, []),
+            qa_ids=qa_ids_by_source.get(blob.path, {}),
+        )
+    for path in removed_paths:
+        manifest.remove(path)
+    manifest.save()
+
+
+def main(incremental: bool = False):
     """Main parsing, embedding and indexing logic for data living in GCS"""
+    if incremental:
+        # Compare the bucket listing (with MD5 hashes) against the manifest
+        # before touching Vector Search, Firestore or Document AI
+        manifest = IndexManifest(INDEX_MANIFEST_PATH)
+        changed_blobs, removed_paths = manifest.diff(
+            create_pdf_blob_list(INPUT_BUCKET_NAME, BUCKET_PREFIX)
+        )
+        logger.info(
+            f"{len(changed_blobs)} new or changed files, "
+            f"{len(removed_paths)} removed files"
+        )
+        if not changed_blobs and not removed_paths:
+            logger.info("Index is up to date")
+            return
+
     # Initialize Vertex AI and create index and endpoint
     aiplatform.init(project=PROJECT_ID, location=LOCATION)
 
@@ -218,6 +367,19 @@ def main():
         VECTOR_INDEX_NAME, INDEX_ENDPOINT_NAME, APPROXIMATE_NEIGHBORS_COUNT
     )
 
+    if incremental:
+        manifest.check_target(
+            {
+                "vector_index": vs_index.resource_name,
+                "qa_index": QA_INDEX_NAME,
+                "firestore": f"{FIRESTORE_DB_NAME}/{FIRESTORE_NAMESPACE}",
+                "indexing_method": INDEXING_METHOD,
+            },
+            index_is_empty=get_vectors_count(vs_index) == 0,
+        )
+    else:
+        invalidate_manifest(INDEX_MANIFEST_PATH)
+
     # Vertex AI Vector Search Vector DB and Firestore Docstore
     vector_store = VertexAIVectorStore(
         project_id=PROJECT_ID,
@@ -230,6 +392,10 @@ def main():
     docstore = FirestoreDocumentStore.from_database(
         project=PROJECT_ID, database=FIRESTORE_DB_NAME, namespace=FIRESTORE_NAMESPACE
     )
+    # Keep the on-disk BM25 index of this namespace in sync with the docstore
+    bm25_index = PersistentBM25Index(
+        os.path.join(BM25_INDEX_DIR, FIRESTORE_DB_NAME, FIRESTORE_NAMESPACE)
+    )
 
     # Setup embedding model and LLM
     embed_model = VertexTextEmbedding(
@@ -249,6 +415,21 @@ def main():
         gcs_output_path=GCS_OUTPUT_PATH,
     )
 
+    if incremental:
+        index_incrementally(
+            changed_blobs,
+            removed_paths,
+            manifest,
+            parser,
+            docstore,
+            vs_index,
+            vector_store,
+            embed_model,
+            llm,
+            bm25_index,
+        )
+        return
+
     # Download data from specified bucket and parse
     local_data_path = os.path.join("/tmp", BUCKET_PREFIX)
     os.makedirs(local_data_path, exist_ok=True)
@@ -258,41 +439,70 @@ def main():
         INPUT_BUCKET_NAME, prefix=BUCKET_PREFIX, destination_directory=local_data_path
     )
 
-    # Parse documents using Document AI
-    try:
-        parsed_docs, raw_results = parser.batch_parse(
-            blobs, chunk_size=CHUNK_SIZE, include_ancestor_headings=True
-        )
-        print(f"Number of documents parsed by Document AI: {len(parsed_docs)}")
-        if parsed_docs:
-            print(
-                f"First parsed document text (first 100 chars): {parsed_docs[0].text[:100]}..."  # noqa: E501
+    # Parse documents using Document AI. Shards are chunked and embedded as
+    # soon as they are downloaded, while the remaining operations and
+    # downloads are still running. The documents are only kept in memory for
+    # the QA index, which is built over all of them.
+    qa_enabled = bool(QA_INDEX_NAME or QA_ENDPOINT_NAME)
+    li_docs = []
+    num_docs = 0
+    raw_results = []
+    shards = parser.stream_parse(
+        blobs,
+        chunk_size=CHUNK_SIZE,
+        include_ancestor_headings=True,
+        blobs_per_operation=DOCAI_BLOBS_PER_OPERATION,
+        max_download_workers=DOCAI_DOWNLOAD_WORKERS,
+        results=raw_results,
+    )
+    while True:
+        try:
+            shard_docs = next(shards)
+        except StopIteration:
+            break
+        except Exception:
+            # The remaining operations are abandoned, so fail the run rather
+            # than build the QA index over partial input
+            logger.error(
+                f"Document AI parsing failed after {num_docs} documents",
+                exc_info=True,
+            )
+            raise
+
+        # Turn each parsed document into a llamaindex Document
+        shard_li_docs = [
+            Document(text=doc.text, metadata=doc.metadata) for doc in shard_docs
+        ]
+        num_docs += len(shard_li_docs)
+        if qa_enabled:
+            li_docs.extend(shard_li_docs)
+
+        if INDEXING_METHOD == "hierarchical":
+            create_hierarchical_index(
+                shard_li_docs, docstore, vector_store, embed_model, llm, bm25_index
             )
-        else:
-            print("No documents were parsed by Document AI.")
-
-        # Print raw results for debugging
-        print("Raw results:")
-        for result in raw_results:
-            print(f"  Source: {result.source_path}")
-            print(f"  Parsed: {result.parsed_path}")
-    except Exception as e:
-        print(f"Error processing single document: {str(e)}")
-        parsed_docs = []
-        raw_results = []
-
-    # Turn each parsed document into a llamaindex Document
-    li_docs = [Document(text=doc.text, metadata=doc.metadata) for doc in parsed_docs]
 
-    if QA_INDEX_NAME or QA_ENDPOINT_NAME:
-        create_qa_index(li_docs, docstore, embed_model, llm)
+        elif INDEXING_METHOD == "flat":
+            create_flat_index(
+                shard_li_docs, docstore, vector_store, embed_model, llm, bm25_index
+            )
+    print(f"Number of documents parsed by Document AI: {num_docs}")
 
-    if INDEXING_METHOD == "hierarchical":
-        create_hierarchical_index(li_docs, docstore, vector_store, embed_model, llm)
+    # Print raw results for debugging
+    print("Raw results:")
+    for result in raw_results:
+        print(f"  Source: {result.source_path}")
+        print(f"  Parsed: {result.parsed_path}")
 
-    elif INDEXING_METHOD == "flat":
-        create_flat_index(li_docs, docstore, vector_store, embed_model, llm)
+    if li_docs:
+        create_qa_index(li_docs, docstore, embed_model, llm, bm25_index)
 
 
 if __name__ == "__main__":
-    main()
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only re-index files which changed since the last incremental run",
+    )
+    main(incremental=arg_parser.parse_args().incremental)
@@ -35,6 +35,11 @@ def create_index(vector_index_name: str, approximate_neighbors_count: int):
     return vs_index
 
 
+def get_vectors_count(vs_index: aiplatform.MatchingEngineIndex) -> int:
+    """Returns the number of datapoints stored in the index."""
+    return int(vs_index.gca_resource.index_stats.vectors_count)
+
+
 def create_endpoint(index_endpoint_name: str):
     """Creates an index endpoint."""
     print(f"Creating Vector Search index endpoint {index_endpoint_name} ...")
@@ -1,18 +1,30 @@
 """Extensions to Llamaindex Base classes to allow for asynchronous execution"""
 
+import asyncio
 from collections.abc import Sequence
 import logging
 
+from backend.rag.postprocessor_pipeline import (
+    PostprocessorPipeline,
+    PostprocessorStage,
+)
+from backend.rag.request_metrics import record_metric, timed
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.core.base.response.schema import RESPONSE_TYPE
 from llama_index.core.callbacks import CallbackManager
 from llama_index.core.indices.query.query_transform.base import BaseQueryTransform
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
 from llama_index.core.prompts import BasePromptTemplate
 from llama_index.core.prompts.default_prompts import DEFAULT_HYDE_PROMPT
 from llama_index.core.prompts.mixin import PromptDictType, PromptMixinType
 from llama_index.core.query_engine import BaseQueryEngine, RetrieverQueryEngine
+from llama_index.core.response_synthesizers import BaseSynthesizer
+from llama_index.core.retrievers import BaseRetriever
 from llama_index.core.schema import NodeWithScore, QueryBundle, QueryType
 from llama_index.core.service_context_elements.llm_predictor import LLMPredictorType
 from llama_index.core.settings import Settings
+import numpy as np
 from pydantic import Field
 
 logging.basicConfig(level=logging.INFO)  # Set the desired logging level
@@ -130,6 +142,8 @@ class AsyncHyDEQueryTransform(BaseQueryTransform):
 
     It uses an LLM to generate hypothetical answer(s) to a given query,
     and use the resulting documents as embedding strings.
+    In the async path the hypotheses are generated concurrently, embedded
+    in a single batched call and mean-pooled into one query embedding.
 
     As described in
     `[Precise Zero-Shot Dense Retrieval without Relevance Labels]
@@ -141,6 +155,9 @@ class AsyncHyDEQueryTransform(BaseQueryTransform):
         llm: LLMPredictorType | None = None,
         hyde_prompt: BasePromptTemplate | None = None,
         include_original: bool = True,
+        embed_model: BaseEmbedding | None = None,
+        num_hypotheses: int = 1,
+        latency_budget_sec: float | None = None,
     ) -> None:
         """Initialize HyDEQueryTransform.
 
@@ -150,12 +167,21 @@ class AsyncHyDEQueryTransform(BaseQueryTransform):
             hyde_prompt (Optional[BasePromptTemplate]): Custom prompt for HyDE
             include_original (bool): Whether to include original query
                 string as one of the embedding strings
+            embed_model (Optional[BaseEmbedding]): Embedding model used to
+                pool the hypotheses into a single query embedding
+            num_hypotheses (int): Number of hypothetical documents to generate
+            latency_budget_sec (Optional[float]): Hypotheses not generated
+                within this budget are dropped (the original query is used
+                if none finish in time)
         """
         super().__init__()
 
         self._llm = llm or Settings.llm
         self._hyde_prompt = hyde_prompt or DEFAULT_HYDE_PROMPT
         self._include_original = include_original
+        self._embed_model = embed_model
+        self._num_hypotheses = num_hypotheses
+        self._latency_budget_sec = latency_budget_sec
 
     def _get_prompts(self) -> PromptDictType:
         """Get prompts."""
@@ -168,10 +194,11 @@ class AsyncHyDEQueryTransform(BaseQueryTransform):
 
     def _run(self, query_bundle: QueryBundle, metadata: dict) -> QueryBundle:
         """Run query transform."""
-        # TODO: support generating multiple hypothetical docs
         query_str = query_bundle.query_str
-        hypothetical_doc = self._llm.predict(self._hyde_prompt, context_str=query_str)
-        embedding_strs = [hypothetical_doc]
+        embedding_strs = [
+            self._llm.predict(self._hyde_prompt, context_str=query_str)
+            for _ in range(self._num_hypotheses)
+        ]
         if self._include_original:
             embedding_strs.extend(query_bundle.embedding_strs)
         return QueryBundle(
@@ -179,35 +206,124 @@ class AsyncHyDEQueryTransform(BaseQueryTransform):
             custom_embedding_strs=embedding_strs,
         )
 
-    async def _arun(self, query_bundle: QueryBundle) -> QueryBundle:
+    async def _agenerate_hypotheses(self, query_str: str) -> list[str]:
+        """Generate hypotheses concurrently, keeping those within budget"""
+        tasks = [
+            asyncio.create_task(
+                self._llm.apredict(self._hyde_prompt, context_str=query_str)
+            )
+            for _ in range(self._num_hypotheses)
+        ]
+        if not tasks:
+            return []
+        done, pending = await asyncio.wait(tasks, timeout=self._latency_budget_sec)
+        for task in pending:
+            task.cancel()
+        if pending:
+            # Wait for the cancelled LLM calls to unwind so none is leaked
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.info(
+                f"HyDE latency budget exceeded, dropped {len(pending)} hypotheses"
+            )
+        hypotheses = []
+        # Keep generation order so the pooled embedding is deterministic
+        for task in tasks:
+            if task not in done:
+                continue
+            if task.exception() is not None:
+                logger.warning(
+                    f"HyDE hypothesis generation failed: {task.exception()!r}"
+                )
+                continue
+            hypotheses.append(task.result())
+        return hypotheses
+
+    async def _arun(self, query_bundle: QueryBundle, metadata: dict) -> QueryBundle:
         """Run query transform."""
-        # TODO: support generating multiple hypothetical docs
         query_str = query_bundle.query_str
-        hypothetical_doc = await self._llm.apredict(
-            self._hyde_prompt, context_str=query_str
-        )
-        embedding_strs = [hypothetical_doc]
-        if self._include_original:
-            embedding_strs.extend(query_bundle.embedding_strs)
+        with timed("hyde_ms"):
+            hypotheses = await self._agenerate_hypotheses(query_str)
+            record_metric("hyde_hypotheses", len(hypotheses))
+            original_strs = (
+                query_bundle.embedding_strs
+                if self._include_original or not hypotheses
+                else []
+            )
+            embedding_strs = hypotheses + original_strs
+            if self._embed_model is None:
+                return QueryBundle(
+                    query_str=query_str,
+                    custom_embedding_strs=embedding_strs,
+                )
+            # Hypotheses are documents, the original query stays in query mode
+            embeddings = (
+                await self._embed_model.aget_text_embedding_batch(hypotheses)
+                if hypotheses
+                else []
+            )
+            embeddings += await asyncio.gather(
+                *[self._embed_model.aget_query_embedding(s) for s in original_strs]
+            )
         return QueryBundle(
             query_str=query_str,
             custom_embedding_strs=embedding_strs,
+            embedding=np.mean(embeddings, axis=0).tolist(),
         )
 
 
 class AsyncRetrieverQueryEngine(RetrieverQueryEngine):
     """Async Extension of the ReterieverQueryEngine
-    to allow for asynchronous post-processing"""
+    to allow for asynchronous post-processing.
+    Postprocessors run as a PostprocessorPipeline: either a plain chain of
+    node_postprocessors or explicit stages with dependencies, where
+    independent stages run concurrently."""
+
+    def __init__(
+        self,
+        retriever: BaseRetriever,
+        response_synthesizer: BaseSynthesizer | None = None,
+        node_postprocessors: list[BaseNodePostprocessor] | None = None,
+        callback_manager: CallbackManager | None = None,
+        postprocessor_stages: list[PostprocessorStage] | None = None,
+    ) -> None:
+        if postprocessor_stages:
+            node_postprocessors = [s.postprocessor for s in postprocessor_stages]
+        super().__init__(
+            retriever=retriever,
+            response_synthesizer=response_synthesizer,
+            node_postprocessors=node_postprocessors,
+            callback_manager=callback_manager,
+        )
+        self._postprocessor_pipeline = (
+            PostprocessorPipeline(postprocessor_stages)
+            if postprocessor_stages
+            else PostprocessorPipeline.chain(self._node_postprocessors)
+        )
+
+    @classmethod
+    def from_args(
+        cls,
+        retriever: BaseRetriever,
+        postprocessor_stages: list[PostprocessorStage] | None = None,
+        **kwargs,
+    ) -> "AsyncRetrieverQueryEngine":
+        """Same as RetrieverQueryEngine.from_args, with optional stages"""
+        if postprocessor_stages:
+            kwargs["node_postprocessors"] = [
+                s.postprocessor for s in postprocessor_stages
+            ]
+        query_engine = super().from_args(retriever, **kwargs)
+        if postprocessor_stages:
+            query_engine._postprocessor_pipeline = PostprocessorPipeline(
+                postprocessor_stages
+            )
+        return query_engine
 
     async def _apply_node_postprocessors(
         self, nodes: list[NodeWithScore], query_bundle: QueryBundle
     ) -> list[NodeWithScore]:
         """Apply node postprocessors."""
-        for node_postprocessor in self._node_postprocessors:
-            nodes = await node_postprocessor.postprocess_nodes(
-                nodes, query_bundle=query_bundle
-            )
-        return nodes
+        return await self._postprocessor_pipeline.run(nodes, query_bundle=query_bundle)
 
     async def aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
         """Retrieve nodes"""
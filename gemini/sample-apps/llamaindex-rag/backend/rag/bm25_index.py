@@ -0,0 +1,384 @@
+"""Persistent, incrementally updated BM25 index for hybrid retrieval"""
+
+import asyncio
+from collections import Counter
+from collections.abc import Iterable, Sequence
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+
+from bm25s.stopwords import STOPWORDS_EN
+from llama_index.core import QueryBundle
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+import numpy as np
+import Stemmer
+
+logging.basicConfig(level=logging.INFO)  # Set the desired logging level
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+VOCAB_FILE = "vocab.json"
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+class BM25Segment:
+    """
+    Immutable, term-major slice of the BM25 index stored as .npy arrays.
+    Arrays (and the stored nodes) are memory-mapped so opening a segment
+    does not read (or re-tokenize) the corpus, and an opened segment stays
+    readable after compaction removes its files.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.term_ids = np.load(os.path.join(path, "term_ids.npy"), mmap_mode="r")
+        self.term_offsets = np.load(
+            os.path.join(path, "term_offsets.npy"), mmap_mode="r"
+        )
+        self.postings_docs = np.load(
+            os.path.join(path, "postings_docs.npy"), mmap_mode="r"
+        )
+        self.postings_tfs = np.load(
+            os.path.join(path, "postings_tfs.npy"), mmap_mode="r"
+        )
+        self.doc_lengths = np.load(os.path.join(path, "doc_lengths.npy"), mmap_mode="r")
+        self.node_offsets = np.load(
+            os.path.join(path, "node_offsets.npy"), mmap_mode="r"
+        )
+        with open(os.path.join(path, "node_ids.json")) as f:
+            self.node_ids: list[str] = json.load(f)
+        self.total_length = int(np.sum(self.doc_lengths))
+        nodes_path = os.path.join(path, "nodes.jsonl")
+        self._nodes = (
+            np.memmap(nodes_path, dtype=np.uint8, mode="r")
+            if os.path.getsize(nodes_path)
+            else np.empty(0, dtype=np.uint8)
+        )
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.node_ids)
+
+    def postings(self, term_id: int) -> tuple[np.ndarray, np.ndarray]:
+        """Return (doc indices, term frequencies) for a term id"""
+        pos = int(np.searchsorted(self.term_ids, term_id))
+        if pos >= len(self.term_ids) or self.term_ids[pos] != term_id:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        start, end = int(self.term_offsets[pos]), int(self.term_offsets[pos + 1])
+        return self.postings_docs[start:end], self.postings_tfs[start:end]
+
+    def load_node(self, local_idx: int) -> BaseNode:
+        """Decode a single stored node without reading the rest of the segment"""
+        start = int(self.node_offsets[local_idx])
+        end = int(self.node_offsets[local_idx + 1])
+        return json_to_doc(json.loads(self._nodes[start:end].tobytes()))
+
+    @staticmethod
+    def write(
+        path: str,
+        nodes: Sequence[BaseNode],
+        doc_term_counts: Sequence[Counter],
+    ) -> None:
+        """Write a new segment for the given nodes and their term counts"""
+        os.makedirs(path, exist_ok=True)
+        postings: dict[int, list[tuple[int, int]]] = {}
+        doc_lengths = np.zeros(len(nodes), dtype=np.int32)
+        for local_idx, counts in enumerate(doc_term_counts):
+            doc_lengths[local_idx] = sum(counts.values())
+            for term_id, tf in counts.items():
+                postings.setdefault(term_id, []).append((local_idx, tf))
+
+        term_ids = np.array(sorted(postings), dtype=np.int32)
+        term_offsets = np.zeros(len(term_ids) + 1, dtype=np.int64)
+        postings_docs, postings_tfs = [], []
+        for i, term_id in enumerate(term_ids):
+            docs_tfs = postings[int(term_id)]
+            term_offsets[i + 1] = term_offsets[i] + len(docs_tfs)
+            postings_docs.extend(d for d, _ in docs_tfs)
+            postings_tfs.extend(tf for _, tf in docs_tfs)
+
+        node_offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        with open(os.path.join(path, "nodes.jsonl"), "wb") as f:
+            for i, node in enumerate(nodes):
+                line = (json.dumps(doc_to_json(node)) + "\n").encode("utf-8")
+                f.write(line)
+                node_offsets[i + 1] = node_offsets[i] + len(line)
+
+        np.save(os.path.join(path, "term_ids.npy"), term_ids)
+        np.save(os.path.join(path, "term_offsets.npy"), term_offsets)
+        np.save(
+            os.path.join(path, "postings_docs.npy"),
+            np.array(postings_docs, dtype=np.int32),
+        )
+        np.save(
+            os.path.join(path, "postings_tfs.npy"),
+            np.array(postings_tfs, dtype=np.float32),
+        )
+        np.save(os.path.join(path, "doc_lengths.npy"), doc_lengths)
+        np.save(os.path.join(path, "node_offsets.npy"), node_offsets)
+        with open(os.path.join(path, "node_ids.json"), "w") as f:
+            json.dump([node.node_id for node in nodes], f)
+
+
+class PersistentBM25Index:
+    """
+    On-disk BM25 index for a single docstore namespace.
+    The index is a list of immutable segments (one per call to add_nodes)
+    plus a manifest listing live segments and deleted documents, so the
+    indexing pipeline can append nodes without rebuilding the index and
+    serving processes only memory-map the arrays they need.
+    Deleted documents are tombstoned and dropped when segments are compacted.
+    Segments replaced by a compaction are only removed from disk by the
+    next compaction, so readers still holding the previous manifest can
+    open them.
+    A single writer (the indexing pipeline) is assumed per index_dir.
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        k1: float = 1.5,
+        b: float = 0.75,
+        max_segments: int = 16,
+        language: str = "english",
+    ):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self._stemmer = Stemmer.Stemmer(language)
+        self._stopwords = set(STOPWORDS_EN)
+        self._lock = threading.Lock()
+        self._manifest_mtime: int | None = None
+        self.vocab: dict[str, int] = {}
+        self.segments: list[BM25Segment] = []
+        self.deleted: dict[str, set[int]] = {}
+        self.retired: list[str] = []
+        self._next_segment = 0
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.refresh()
+
+    @classmethod
+    def load_or_build(
+        cls, index_dir: str, docstore: BaseDocumentStore, **kwargs
+    ) -> "PersistentBM25Index":
+        """
+        Open the index stored in index_dir, building it once from every
+        node in the docstore if it does not exist yet.
+        """
+        index = cls(index_dir, **kwargs)
+        if not index.segments:
+            nodes = list(docstore.docs.values())
+            logger.info(f"Building BM25 index in {index_dir} over {len(nodes)} nodes")
+            index.add_nodes(nodes)
+        return index
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.index_dir, MANIFEST_FILE))
+
+    @property
+    def num_docs(self) -> int:
+        return sum(
+            s.num_docs - len(self.deleted.get(s.name, ())) for s in self.segments
+        )
+
+    def tokenize(self, text: str) -> list[str]:
+        tokens = [
+            t for t in TOKEN_PATTERN.findall(text.lower()) if t not in self._stopwords
+        ]
+        return self._stemmer.stemWords(tokens)
+
+    def refresh(self) -> None:
+        """Reload the manifest if another process (e.g. indexing) updated it"""
+        manifest_path = os.path.join(self.index_dir, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return
+        mtime = os.stat(manifest_path).st_mtime_ns
+        if mtime == self._manifest_mtime:
+            return
+        with self._lock:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            with open(os.path.join(self.index_dir, VOCAB_FILE)) as f:
+                self.vocab = json.load(f)
+            self.segments = [
+                BM25Segment(os.path.join(self.index_dir, name))
+                for name in manifest["segments"]
+            ]
+            self.deleted = {k: set(v) for k, v in manifest["deleted"].items()}
+            self.retired = manifest.get("retired", [])
+            self._next_segment = manifest["next_segment"]
+            self._manifest_mtime = mtime
+
+    def _write_manifest(self) -> None:
+        vocab_tmp = os.path.join(self.index_dir, VOCAB_FILE + ".tmp")
+        with open(vocab_tmp, "w") as f:
+            json.dump(self.vocab, f)
+        os.replace(vocab_tmp, os.path.join(self.index_dir, VOCAB_FILE))
+
+        manifest = {
+            "segments": [s.name for s in self.segments],
+            "deleted": {k: sorted(v) for k, v in self.deleted.items() if v},
+            "retired": self.retired,
+            "next_segment": self._next_segment,
+            "k1": self.k1,
+            "b": self.b,
+        }
+        manifest_path = os.path.join(self.index_dir, MANIFEST_FILE)
+        manifest_tmp = manifest_path + ".tmp"
+        with open(manifest_tmp, "w") as f:
+            json.dump(manifest, f)
+        # Atomic swap so concurrent readers never see a partial manifest
+        os.replace(manifest_tmp, manifest_path)
+        self._manifest_mtime = os.stat(manifest_path).st_mtime_ns
+
+    def _tombstone(self, node_ids: Iterable[str]) -> int:
+        node_ids = set(node_ids)
+        num_deleted = 0
+        for segment in self.segments:
+            deleted = self.deleted.setdefault(segment.name, set())
+            for local_idx, node_id in enumerate(segment.node_ids):
+                if node_id in node_ids and local_idx not in deleted:
+                    deleted.add(local_idx)
+                    num_deleted += 1
+        return num_deleted
+
+    def add_nodes(self, nodes: Sequence[BaseNode]) -> None:
+        """Append nodes as a new segment, replacing nodes with the same id"""
+        self.refresh()
+        if not nodes:
+            return
+        with self._lock:
+            doc_term_counts = []
+            for node in nodes:
+                counts = Counter()
+                for token in self.tokenize(node.get_content()):
+                    term_id = self.vocab.setdefault(token, len(self.vocab))
+                    counts[term_id] += 1
+                doc_term_counts.append(counts)
+            self._tombstone(node.node_id for node in nodes)
+
+            name = f"seg_{self._next_segment:06d}"
+            self._next_segment += 1
+            path = os.path.join(self.index_dir, name)
+            BM25Segment.write(path, nodes, doc_term_counts)
+            self.segments.append(BM25Segment(path))
+            self._write_manifest()
+        logger.info(f"Added {len(nodes)} nodes to BM25 index {self.index_dir}")
+        if len(self.segments) > self.max_segments:
+            self.compact()
+
+    def delete_nodes(self, node_ids: Iterable[str]) -> None:
+        """Tombstone nodes so they are no longer returned"""
+        self.refresh()
+        with self._lock:
+            if self._tombstone(node_ids):
+                self._write_manifest()
+
+    def compact(self) -> None:
+        """Merge every segment into one, dropping deleted documents"""
+        self.refresh()
+        with self._lock:
+            live_nodes = []
+            for segment in self.segments:
+                deleted = self.deleted.get(segment.name, set())
+                live_nodes.extend(
+                    segment.load_node(i)
+                    for i in range(segment.num_docs)
+                    if i not in deleted
+                )
+            # Segments retired by the previous compaction are no longer
+            # referenced by any manifest a reader can pick up
+            expired = self.retired
+            self.retired = [segment.name for segment in self.segments]
+            doc_term_counts = [
+                Counter(self.vocab[t] for t in self.tokenize(node.get_content()))
+                for node in live_nodes
+            ]
+            name = f"seg_{self._next_segment:06d}"
+            self._next_segment += 1
+            path = os.path.join(self.index_dir, name)
+            BM25Segment.write(path, live_nodes, doc_term_counts)
+            self.segments = [BM25Segment(path)]
+            self.deleted = {}
+            self._write_manifest()
+        for expired_name in expired:
+            shutil.rmtree(
+                os.path.join(self.index_dir, expired_name), ignore_errors=True
+            )
+        logger.info(f"Compacted BM25 index {self.index_dir} into {name}")
+
+    def search(
+        self, query_str: str, top_k: int
+    ) -> list[tuple[float, BM25Segment, int]]:
+        """Return up to top_k (score, segment, local doc index) tuples"""
+        self.refresh()
+        segments, deleted = self.segments, self.deleted
+        term_ids = {self.vocab[t] for t in self.tokenize(query_str) if t in self.vocab}
+        num_docs = self.num_docs
+        if not term_ids or not num_docs:
+            return []
+
+        total_length = sum(s.total_length for s in segments)
+        avgdl = total_length / max(sum(s.num_docs for s in segments), 1)
+        postings = {
+            term_id: [s.postings(term_id) for s in segments] for term_id in term_ids
+        }
+        # Lucene idf; document frequencies include tombstoned documents
+        # until the next compaction.
+        idfs = {}
+        for term_id, term_postings in postings.items():
+            df = sum(len(docs) for docs, _ in term_postings)
+            idfs[term_id] = np.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+
+        candidates = []
+        for seg_idx, segment in enumerate(segments):
+            scores = np.zeros(segment.num_docs, dtype=np.float32)
+            for term_id in term_ids:
+                docs, tfs = postings[term_id][seg_idx]
+                if len(docs) == 0:
+                    continue
+                docs = np.asarray(docs)
+                tfs = np.asarray(tfs)
+                norm = self.k1 * (
+                    1 - self.b + self.b * segment.doc_lengths[docs] / avgdl
+                )
+                scores[docs] += idfs[term_id] * tfs * (self.k1 + 1) / (tfs + norm)
+            removed = deleted.get(segment.name)
+            if removed:
+                scores[list(removed)] = 0.0
+            k = min(top_k, segment.num_docs)
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidates.extend(
+                (float(scores[i]), segment, int(i)) for i in top if scores[i] > 0
+            )
+        candidates.sort(key=lambda x: x[0], reverse=True)
+        return candidates[:top_k]
+
+
+class PersistentBM25Retriever(BaseRetriever):
+    """Retriever over a PersistentBM25Index"""
+
+    def __init__(self, index: PersistentBM25Index, similarity_top_k: int = 5) -> None:
+        self._index = index
+        self._similarity_top_k = similarity_top_k
+        super().__init__()
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        results = self._index.search(query_bundle.query_str, self._similarity_top_k)
+        return [
+            NodeWithScore(node=segment.load_node(local_idx), score=score)
+            for score, segment, local_idx in results
+        ]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        # Scoring over memory-mapped segments blocks, keep it off the loop
+        return await asyncio.to_thread(self._retrieve, query_bundle)
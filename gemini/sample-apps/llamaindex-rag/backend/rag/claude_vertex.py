@@ -1,10 +1,13 @@
 """Llamaindex LLM implementation of Claude Vertex AI"""
 
+import time
 from typing import Any
 
 from anthropic import AnthropicVertex, AsyncAnthropicVertex
+from backend.rag.request_metrics import record_metric
 from llama_index.core.llms import (
     CompletionResponse,
+    CompletionResponseAsyncGen,
     CompletionResponseGen,
     CustomLLM,
     LLMMetadata,
@@ -13,6 +16,10 @@ from llama_index.core.llms.callbacks import llm_completion_callback
 from pydantic import Field, PrivateAttr
 
 
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
 class ClaudeVertexLLM(CustomLLM):
     project_id: str = Field(description="The project ID for Vertex AI")
     region: str = Field(description="The region for Vertex AI")
@@ -74,6 +81,8 @@ class ClaudeVertexLLM(CustomLLM):
 
     @llm_completion_callback()
     def stream_complete(self, prompt: str, **kwargs: Any) -> CompletionResponseGen:
+        start = time.perf_counter()
+        time_to_first_token_ms = None
         with self.client.messages.stream(
             model=self.model_name,
             max_tokens=self.max_tokens,
@@ -82,5 +91,50 @@ class ClaudeVertexLLM(CustomLLM):
         ) as stream:
             response = ""
             for text in stream.text_stream:
+                if time_to_first_token_ms is None:
+                    time_to_first_token_ms = _elapsed_ms(start)
+                    record_metric("llm_time_to_first_token_ms", time_to_first_token_ms)
                 response += text
-                yield CompletionResponse(text=response, delta=text)
+                yield CompletionResponse(
+                    text=response,
+                    delta=text,
+                    additional_kwargs={
+                        "time_to_first_token_ms": time_to_first_token_ms
+                    },
+                )
+
+    @llm_completion_callback()
+    async def astream_complete(
+        self, prompt: str, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        """
+        Streams with the async client, so concurrent streams share the event
+        loop instead of each blocking it (or a thread) for the whole generation.
+        """
+
+        async def gen() -> CompletionResponseAsyncGen:
+            start = time.perf_counter()
+            time_to_first_token_ms = None
+            async with self.async_client.messages.stream(
+                model=self.model_name,
+                max_tokens=self.max_tokens,
+                system=self.system_prompt,
+                messages=[{"role": "user", "content": prompt}],
+            ) as stream:
+                response = ""
+                async for text in stream.text_stream:
+                    if time_to_first_token_ms is None:
+                        time_to_first_token_ms = _elapsed_ms(start)
+                        record_metric(
+                            "llm_time_to_first_token_ms", time_to_first_token_ms
+                        )
+                    response += text
+                    yield CompletionResponse(
+                        text=response,
+                        delta=text,
+                        additional_kwargs={
+                            "time_to_first_token_ms": time_to_first_token_ms
+                        },
+                    )
+
+        return gen()
@@ -0,0 +1,131 @@
+"""Batched, cached document lookups against the Firestore docstore"""
+
+import asyncio
+from collections.abc import Sequence
+import logging
+import threading
+
+from cachetools import LRUCache
+from llama_index.core.schema import BaseNode
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+from llama_index.core.storage.docstore.utils import json_to_doc
+
+logging.basicConfig(level=logging.INFO)  # Set the desired logging level
+logger = logging.getLogger(__name__)
+
+
+class DocstoreFetcher:
+    """
+    Multi-get layer over a llamaindex document store.
+    For a FirestoreDocumentStore all missing ids are fetched in a single
+    BatchGetDocuments call on Firestore's async client, so retrievers do not
+    issue one blocking round trip per node on the event loop.
+    Other docstores fall back to concurrent aget_document calls.
+    Fetched nodes are kept in a per-process LRU cache so hot parent and
+    source documents are not fetched again for every query.
+    """
+
+    def __init__(self, docstore: BaseDocumentStore, cache_size: int = 1024):
+        self._docstore = docstore
+        self._cache: LRUCache = LRUCache(maxsize=cache_size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # FirestoreDocumentStore -> FirestoreKVStore, which stores each node
+        # as a Firestore document in a collection derived from the namespace.
+        kvstore = getattr(docstore, "_kvstore", None)
+        node_collection = getattr(docstore, "_node_collection", None)
+        if hasattr(kvstore, "_adb") and node_collection:
+            self._kvstore = kvstore
+            self._collection_id = kvstore.firestore_collection(node_collection)
+        else:
+            self._kvstore = None
+            self._collection_id = None
+
+    def _from_cache(self, doc_ids: Sequence[str]) -> tuple[dict, list[str]]:
+        found, missing = {}, []
+        with self._lock:
+            for doc_id in dict.fromkeys(doc_ids):
+                node = self._cache.get(doc_id)
+                if node is None:
+                    missing.append(doc_id)
+                else:
+                    found[doc_id] = node
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def _to_cache(self, nodes: dict[str, BaseNode]) -> None:
+        with self._lock:
+            self._cache.update(nodes)
+
+    def _snapshots_to_nodes(self, snapshots) -> dict[str, BaseNode]:
+        nodes = {}
+        for snapshot in snapshots:
+            if snapshot.exists:
+                data = self._kvstore.replace_field_name_get(snapshot.to_dict())
+                nodes[snapshot.id] = json_to_doc(data)
+        return nodes
+
+    @staticmethod
+    def _ordered(
+        doc_ids: Sequence[str], nodes: dict[str, BaseNode]
+    ) -> list[BaseNode]:
+        for doc_id in doc_ids:
+            if doc_id not in nodes:
+                raise ValueError(f"doc_id {doc_id} not found.")
+        return [nodes[doc_id] for doc_id in doc_ids]
+
+    async def aget_documents(self, doc_ids: Sequence[str]) -> list[BaseNode]:
+        """Return the nodes for doc_ids (in order) with one batched lookup"""
+        found, missing = self._from_cache(doc_ids)
+        if missing:
+            if self._kvstore is not None:
+                collection = self._kvstore._adb.collection(self._collection_id)
+                refs = [collection.document(doc_id) for doc_id in missing]
+                snapshots = [s async for s in self._kvstore._adb.get_all(refs)]
+                fetched = self._snapshots_to_nodes(snapshots)
+            else:
+                docs = await asyncio.gather(
+                    *[
+                        self._docstore.aget_document(doc_id, raise_error=False)
+                        for doc_id in missing
+                    ]
+                )
+                fetched = {
+                    doc_id: doc for doc_id, doc in zip(missing, docs) if doc is not None
+                }
+            self._to_cache(fetched)
+            found.update(fetched)
+        return self._ordered(doc_ids, found)
+
+    def get_documents(self, doc_ids: Sequence[str]) -> list[BaseNode]:
+        """Synchronous counterpart of aget_documents"""
+        found, missing = self._from_cache(doc_ids)
+        if missing:
+            if self._kvstore is not None:
+                collection = self._kvstore._db.collection(self._collection_id)
+                refs = [collection.document(doc_id) for doc_id in missing]
+                fetched = self._snapshots_to_nodes(self._kvstore._db.get_all(refs))
+            else:
+                docs = [
+                    self._docstore.get_document(doc_id, raise_error=False)
+                    for doc_id in missing
+                ]
+                fetched = {
+                    doc_id: doc for doc_id, doc in zip(missing, docs) if doc is not None
+                }
+            self._to_cache(fetched)
+            found.update(fetched)
+        return self._ordered(doc_ids, found)
+
+    def stats(self) -> dict:
+        """Return cache hit/miss counters"""
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "max_size": self._cache.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,199 @@
+"""Bounded, retrying and checkpointed runner for LLMEvaluator"""
+
+import asyncio
+from collections.abc import Callable
+import glob
+import logging
+import os
+import shutil
+import threading
+
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)  # Set the desired logging level
+logger = logging.getLogger(__name__)
+
+RESULT_COLUMNS = ["answer", "retrieved_context", "eval_result", "score"]
+
+
+class EvalCancelledError(Exception):
+    """Raised by EvalRunner.arun when its cancel_event was set"""
+
+
+class EvalRunner:
+    """
+    Evaluates the rows of a dataset with at most max_concurrency rows in
+    flight, retrying each failing row up to max_retries times with
+    exponential backoff. Finished rows are buffered and every batch_size
+    rows are written as a Parquet part file to checkpoint_dir and handed
+    to batch_writer (e.g. write_results_to_bq), so partial results are
+    available while the evaluation runs. A later run on the same
+    checkpoint_dir only evaluates rows which have not been completed.
+    Rows which still fail after all retries are left out of the result
+    and recorded in failed_rows. Setting cancel_event (from any thread)
+    stops the run once the in-flight rows are finished and checkpointed.
+    """
+
+    def __init__(
+        self,
+        evaluator,
+        max_concurrency: int = 8,
+        max_retries: int = 2,
+        retry_backoff_sec: float = 2.0,
+        checkpoint_dir: str | None = None,
+        batch_size: int = 25,
+        batch_writer: Callable[[pd.DataFrame], None] | None = None,
+        progress_callback: Callable[[int, int], None] | None = None,
+        cancel_event: threading.Event | None = None,
+    ):
+        self.evaluator = evaluator
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_backoff_sec = retry_backoff_sec
+        self.checkpoint_dir = checkpoint_dir
+        self.batch_size = batch_size
+        self.batch_writer = batch_writer
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event
+        self.failed_rows: dict[int, str] = {}
+        self._buffer: list[dict] = []
+        self._num_parts = 0
+
+    def load_checkpoint(self) -> pd.DataFrame:
+        """Return the rows completed by previous runs, indexed by row_idx"""
+        if not self.checkpoint_dir:
+            return pd.DataFrame(columns=["row_idx", "question", *RESULT_COLUMNS])
+        parts = sorted(glob.glob(os.path.join(self.checkpoint_dir, "part-*.parquet")))
+        self._num_parts = len(parts)
+        if not parts:
+            return pd.DataFrame(columns=["row_idx", "question", *RESULT_COLUMNS])
+        completed = pd.concat([pd.read_parquet(part) for part in parts])
+        return completed.drop_duplicates("row_idx", keep="last")
+
+    def clear_checkpoint(self) -> None:
+        if self.checkpoint_dir:
+            shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
+    def _write_part(self, batch: pd.DataFrame) -> None:
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        path = os.path.join(self.checkpoint_dir, f"part-{self._num_parts:05d}.parquet")
+        self._num_parts += 1
+        batch.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+    async def _flush(self) -> None:
+        if not self._buffer:
+            return
+        batch = pd.DataFrame(self._buffer)
+        self._buffer = []
+        if self.checkpoint_dir:
+            self._write_part(batch)
+        if self.batch_writer:
+            try:
+                await asyncio.to_thread(self.batch_writer, batch)
+            except Exception as e:
+                logger.info(f"Failed to write batch of {len(batch)} results: {e}")
+
+    async def _evaluate_row(
+        self, retrieval_qa_func: Callable, question: str, ground_truth: str
+    ) -> dict:
+        for attempt in range(self.max_retries + 1):
+            try:
+                answer, eval_result, retrieved_context = (
+                    await self.evaluator.async_eval_question_answer_pair(
+                        retrieval_qa_func,
+                        self.evaluator.eval_model,
+                        question,
+                        ground_truth,
+                    )
+                )
+                return {
+                    "answer": answer,
+                    "retrieved_context": retrieved_context,
+                    "eval_result": eval_result,
+                    "score": self.evaluator.extract_score(eval_result),
+                }
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.info(f"Retrying question {question!r} after error: {e}")
+                await asyncio.sleep(self.retry_backoff_sec * 2**attempt)
+
+    async def arun(
+        self, retrieval_qa_func: Callable, eval_df: pd.DataFrame
+    ) -> pd.DataFrame:
+        """Return eval_df (completed rows only) with the evaluation columns"""
+        questions = eval_df["question"].tolist()
+        ground_truths = eval_df["ground_truth"].tolist()
+        results = {}
+        for row in self.load_checkpoint().to_dict(orient="records"):
+            row_idx = int(row["row_idx"])
+            # Ignore rows checkpointed for a different dataset
+            if row_idx < len(questions) and row["question"] == questions[row_idx]:
+                if row["retrieved_context"] is not None:
+                    row["retrieved_context"] = list(row["retrieved_context"])
+                results[row_idx] = {col: row[col] for col in RESULT_COLUMNS}
+        todo = iter([i for i in range(len(questions)) if i not in results])
+        num_done = len(results)
+        logger.info(
+            f"Evaluating {len(questions) - num_done} rows "
+            f"({num_done} restored from checkpoint)"
+        )
+        if self.progress_callback:
+            self.progress_callback(num_done, len(questions))
+        flush_lock = asyncio.Lock()
+
+        async def worker():
+            nonlocal num_done
+            for row_idx in todo:
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    return
+                try:
+                    result = await self._evaluate_row(
+                        retrieval_qa_func, questions[row_idx], ground_truths[row_idx]
+                    )
+                except Exception as e:
+                    logger.info(f"Failed to evaluate row {row_idx}: {e}")
+                    self.failed_rows[row_idx] = str(e)
+                    continue
+                results[row_idx] = result
+                num_done += 1
+                if self.progress_callback:
+                    self.progress_callback(num_done, len(questions))
+                self._buffer.append(
+                    {"row_idx": row_idx, "question": questions[row_idx], **result}
+                )
+                if len(self._buffer) >= self.batch_size:
+                    async with flush_lock:
+                        await self._flush()
+
+        try:
+            await asyncio.gather(*[worker() for _ in range(self.max_concurrency)])
+        finally:
+            # Also keep the rows finished before a failure or cancellation
+            await asyncio.shield(self._flush())
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise EvalCancelledError("Evaluation was cancelled")
+
+        row_idxs = sorted(results)
+        result_df = eval_df.iloc[row_idxs].copy()
+        for col in RESULT_COLUMNS:
+            result_df[col] = [results[i][col] for i in row_idxs]
+        return result_df
+
+    def run(
+        self,
+        retrieval_qa_func: Callable,
+        eval_df: pd.DataFrame,
+        loop: asyncio.AbstractEventLoop | None = None,
+    ) -> pd.DataFrame:
+        """
+        Blocking counterpart of arun. Pass the loop of a running server to
+        evaluate on it from a worker thread, e.g. when retrieval_qa_func uses
+        async clients bound to that loop; otherwise a new loop is used.
+        """
+        if loop is None:
+            return asyncio.run(self.arun(retrieval_qa_func, eval_df))
+        return asyncio.run_coroutine_threadsafe(
+            self.arun(retrieval_qa_func, eval_df), loop
+        ).result()
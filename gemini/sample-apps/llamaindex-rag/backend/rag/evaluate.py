@@ -6,6 +6,7 @@ import logging
 import re
 
 from backend.rag.claude_vertex import ClaudeVertexLLM
+from backend.rag.eval_runner import EvalRunner
 from google.cloud import bigquery
 from llama_index.core.base.response.schema import Response
 from llama_index.core.chat_engine.types import AgentChatResponse
@@ -134,33 +135,25 @@ class LLMEvaluator:
             return 0  # Return None if no number is found
 
     async def async_eval_retrieval(
-        self, retrieval_qa_func: Callable, eval_df: pd.DataFrame
+        self, retrieval_qa_func: Callable, eval_df: pd.DataFrame, **runner_kwargs
     ) -> pd.DataFrame:
         """
         LLMEvaluator.async_eval_retrieval
+        runner_kwargs are passed to EvalRunner (concurrency, retries,
+        checkpointing and batch writes).
         """
-        results = await asyncio.gather(
-            *[
-                self.async_eval_question_answer_pair(
-                    retrieval_qa_func, self.eval_model, x["question"], x["ground_truth"]
-                )
-                for idx, x in eval_df[["question", "ground_truth"]].iterrows()
-            ]
-        )
-        answers, eval_result, retrieved_context = list(zip(*results))
-        eval_df["answer"] = answers
-        eval_df["retrieved_context"] = retrieved_context
-        eval_df["eval_result"] = eval_result
-        eval_df["score"] = eval_df["eval_result"].apply(lambda x: self.extract_score(x))
-        return eval_df
+        runner = EvalRunner(self, **runner_kwargs)
+        return await runner.arun(retrieval_qa_func, eval_df)
 
     def evaluate(
-        self, retrieval_qa_func: Callable, eval_df: pd.DataFrame
+        self, retrieval_qa_func: Callable, eval_df: pd.DataFrame, **runner_kwargs
     ) -> pd.DataFrame:
         """
         LLMEvaluator.evaluate
         """
-        eval_df = asyncio.run(self.async_eval_retrieval(retrieval_qa_func, eval_df))
+        eval_df = asyncio.run(
+            self.async_eval_retrieval(retrieval_qa_func, eval_df, **runner_kwargs)
+        )
         return eval_df
 
 
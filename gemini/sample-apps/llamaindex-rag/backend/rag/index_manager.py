@@ -2,32 +2,36 @@
 experimentation UI"""
 
 import logging
+import os
+import time
 
-import Stemmer
 from backend.rag.async_extensions import (
     AsyncHyDEQueryTransform,
     AsyncRetrieverQueryEngine,
     AsyncTransformQueryEngine,
 )
+from backend.rag.bm25_index import PersistentBM25Index, PersistentBM25Retriever
 from backend.rag.claude_vertex import ClaudeVertexLLM
+from backend.rag.docstore_fetcher import DocstoreFetcher
 from backend.rag.node_reranker import CustomLLMRerank
 from backend.rag.parent_retriever import ParentRetriever
+from backend.rag.postprocessor_pipeline import PostprocessorStage
 from backend.rag.prompts import Prompts
 from backend.rag.qa_followup_retriever import QAFollowupRetriever, QARetriever
+from backend.rag.query_engine_pool import QueryEnginePool
 from google.cloud import aiplatform
 from llama_index.core import (
     PromptTemplate,
-    Settings,
     StorageContext,
     VectorStoreIndex,
     get_response_synthesizer,
 )
 from llama_index.core.agent import ReActAgent
+from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.core.retrievers import AutoMergingRetriever, QueryFusionRetriever
 from llama_index.core.tools import QueryEngineTool, ToolMetadata
 from llama_index.embeddings.vertex import VertexTextEmbedding
 from llama_index.llms.vertex import Vertex
-from llama_index.retrievers.bm25 import BM25Retriever
 from llama_index.storage.docstore.firestore import FirestoreDocumentStore
 from llama_index.vector_stores.vertexaivectorsearch import VertexAIVectorStore
 
@@ -59,6 +63,13 @@ class IndexManager:
         firestore_db_name: str | None,
         firestore_namespace: str | None,
         vs_bucket_name: str,
+        query_engine_pool_size: int = 8,
+        bm25_index_dir: str = "/tmp/bm25_indexes",
+        docstore_cache_size: int = 1024,
+        qa_followup_concurrent: bool = True,
+        base_retriever_timeout: float | None = None,
+        qa_retriever_timeout: float | None = None,
+        embed_model: BaseEmbedding | None = None,
     ):
         self.project_id = project_id
         self.location = location
@@ -70,7 +81,19 @@ class IndexManager:
         self.firestore_db_name = firestore_db_name
         self.firestore_namespace = firestore_namespace
         self.vs_bucket_name = vs_bucket_name
-        self.embed_model = VertexTextEmbedding(
+        self.query_engine_pool = QueryEnginePool(max_size=query_engine_pool_size)
+        self.bm25_index_dir = bm25_index_dir
+        self.bm25_index: PersistentBM25Index | None = None
+        self.docstore_cache_size = docstore_cache_size
+        self.qa_followup_concurrent = qa_followup_concurrent
+        self.base_retriever_timeout = base_retriever_timeout
+        self.qa_retriever_timeout = qa_retriever_timeout
+        self._aiplatform_initialized = False
+        self._vector_search_ids: dict[tuple[str, str], tuple[str, float]] = {}
+        self._vector_search_cache_hits = 0
+        self._vector_search_cache_misses = 0
+        self._control_plane_ms_saved = 0.0
+        self.embed_model = embed_model or VertexTextEmbedding(
             model_name=self.embeddings_model_name,
             project=self.project_id,
             location=self.location,
@@ -90,6 +113,7 @@ class IndexManager:
             )
         else:
             self.qa_index = None
+        self._init_docstore_fetchers()
 
     def get_current_index_info(self) -> dict:
         """Return the indices currently being used"""
@@ -105,7 +129,12 @@ class IndexManager:
     def get_vertex_llm(
         self, llm_name: str, temperature: float, system_prompt: str
     ) -> Vertex | ClaudeVertexLLM:
-        """Return the LLM currently being used"""
+        """
+        Return a new LLM for one query engine or agent. The LLM is passed
+        to every component explicitly instead of being set as the global
+        Settings.llm, so concurrent requests with different models or
+        temperatures don't overwrite each other's LLM.
+        """
         if "gemini" in llm_name:
             llm = Vertex(
                 model=llm_name,
@@ -121,9 +150,17 @@ class IndexManager:
                 max_tokens=3000,
                 system_prompt=system_prompt,
             )
-        Settings.llm = llm
         return llm
 
+    def get_reranker_llm(self, temperature: float, system_prompt: str) -> Vertex:
+        """Return a new LLM for the LLM reranking stage"""
+        return Vertex(
+            model="gemini-1.5-flash",
+            max_tokens=8192,
+            temperature=temperature,
+            system_prompt=system_prompt,
+        )
+
     def set_current_indexes(
         self,
         base_index_name,
@@ -133,7 +170,38 @@ class IndexManager:
         firestore_db_name: str | None,
         firestore_namespace: str | None,
     ) -> None:
-        """Set the current indices to be used for the RAG"""
+        """
+        Set the current indices to be used for the RAG.
+        Nothing is re-resolved or rebuilt if the indices did not change,
+        otherwise the ids of the changed indexes and endpoints are refreshed.
+        """
+        previous = self.get_current_index_info()
+        if previous == {
+            "base_index_name": base_index_name,
+            "base_endpoint_name": base_endpoint_name,
+            "qa_index_name": qa_index_name,
+            "qa_endpoint_name": qa_endpoint_name,
+            "firestore_db_name": firestore_db_name,
+            "firestore_namespace": firestore_namespace,
+        }:
+            # None of the current indexes and endpoints is resolved again
+            self._control_plane_ms_saved += self._current_resolve_ms()
+            return
+        previous_keys = {
+            ("index", self.base_index_name),
+            ("endpoint", self.base_endpoint_name),
+            ("index", self.qa_index_name),
+            ("endpoint", self.qa_endpoint_name),
+        }
+        for key in [
+            ("index", base_index_name),
+            ("endpoint", base_endpoint_name),
+            ("index", qa_index_name),
+            ("endpoint", qa_endpoint_name),
+        ]:
+            if key not in previous_keys:
+                # Newly selected, resolve again in case it was re-created
+                self._vector_search_ids.pop(key, None)
         self.base_index_name = base_index_name
         self.base_endpoint_name = base_endpoint_name
         self.qa_index_name = qa_index_name
@@ -155,6 +223,102 @@ class IndexManager:
             )
         else:
             self.qa_index = None
+        self._init_docstore_fetchers()
+        # Pooled engines hold retrievers bound to the previous indexes
+        self.query_engine_pool.clear()
+        self.bm25_index = None
+
+    def _init_docstore_fetchers(self) -> None:
+        """Create the cached multi-get layers shared by all pooled retrievers"""
+        self.base_docstore_fetcher = DocstoreFetcher(
+            self.base_index.docstore, cache_size=self.docstore_cache_size
+        )
+        self.qa_docstore_fetcher = (
+            DocstoreFetcher(self.qa_index.docstore, cache_size=self.docstore_cache_size)
+            if self.qa_index
+            else None
+        )
+
+    def get_bm25_index(self) -> PersistentBM25Index:
+        """
+        Returns the on-disk BM25 index of the current docstore namespace,
+        building it from the docstore only if it has never been persisted.
+        """
+        if self.bm25_index is None:
+            index_dir = os.path.join(
+                self.bm25_index_dir,
+                self.firestore_db_name or "default",
+                self.firestore_namespace or "default",
+            )
+            self.bm25_index = PersistentBM25Index.load_or_build(
+                index_dir, docstore=self.base_index.docstore
+            )
+        return self.bm25_index
+
+    def get_query_engine_pool_stats(self) -> dict:
+        """Return hit/miss counters of the query engine pool"""
+        return self.query_engine_pool.stats()
+
+    def _resolve_vector_search_id(self, kind: str, display_name: str) -> str:
+        """
+        Return the id of the Vector Search index or endpoint ("kind") with the
+        given display name. Listing them is a control-plane round trip, so
+        ids are cached together with the time the lookup took.
+        """
+        key = (kind, display_name)
+        if key in self._vector_search_ids:
+            resource_id, resolve_ms = self._vector_search_ids[key]
+            self._vector_search_cache_hits += 1
+            self._control_plane_ms_saved += resolve_ms
+            return resource_id
+        start = time.perf_counter()
+        if not self._aiplatform_initialized:
+            aiplatform.init(project=self.project_id, location=self.location)
+            self._aiplatform_initialized = True
+        if kind == "index":
+            resources = aiplatform.MatchingEngineIndex.list(
+                filter=f'display_name="{display_name}"'
+            )
+        else:
+            resources = aiplatform.MatchingEngineIndexEndpoint.list(
+                filter=f'display_name="{display_name}"'
+            )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if not resources:
+            raise ValueError(f"No {kind} found with display name: {display_name}")
+        resource_id = resources[0].resource_name.split("/")[-1]
+        self._vector_search_ids[key] = (resource_id, elapsed_ms)
+        self._vector_search_cache_misses += 1
+        return resource_id
+
+    def get_vector_search_cache_stats(self) -> dict:
+        """Return the cached Vector Search ids and the control-plane time saved"""
+        return {
+            "cached_ids": {
+                f"{kind}:{name}": resource_id
+                for (kind, name), (resource_id, _) in self._vector_search_ids.items()
+            },
+            "hits": self._vector_search_cache_hits,
+            "misses": self._vector_search_cache_misses,
+            "control_plane_ms_saved": round(self._control_plane_ms_saved, 2),
+        }
+
+    def _current_resolve_ms(self) -> float:
+        """Time it took to resolve the ids of the indexes currently in use"""
+        names = [
+            ("index", self.base_index_name),
+            ("endpoint", self.base_endpoint_name),
+        ]
+        if self.qa_index is not None:
+            names += [
+                ("index", self.qa_index_name),
+                ("endpoint", self.qa_endpoint_name),
+            ]
+        return sum(
+            self._vector_search_ids[key][1]
+            for key in names
+            if key in self._vector_search_ids
+        )
 
     def get_vector_index(
         self,
@@ -166,29 +330,17 @@ class IndexManager:
         """
         Returns a llamaindex VectorStoreIndex object which contains a storage context,
         with an accompanying local document store from Google Cloud Storage.
+        Index and endpoint ids are resolved from their display names once and
+        cached (see set_current_indexes for when they are refreshed).
         """
-        # Initialize Vertex AI
-        aiplatform.init(project=self.project_id, location=self.location)
-        # Get the Vector Search index
-        indexes = aiplatform.MatchingEngineIndex.list(
-            filter=f'display_name="{index_name}"'
-        )
-        if not indexes:
-            raise ValueError(f"No index found with display name: {index_name}")
-        vs_index = indexes[0]
-        # Get the Vector Search endpoint
-        endpoints = aiplatform.MatchingEngineIndexEndpoint.list(
-            filter=f'display_name="{endpoint_name}"'
-        )
-        if not endpoints:
-            raise ValueError(f"No endpoint found with display name: {endpoint_name}")
-        vs_endpoint = endpoints[0]
+        index_id = self._resolve_vector_search_id("index", index_name)
+        endpoint_id = self._resolve_vector_search_id("endpoint", endpoint_name)
         # Create the vector store
         vector_store = VertexAIVectorStore(
             project_id=self.project_id,
             region=self.location,
-            index_id=vs_index.resource_name.split("/")[-1],
-            endpoint_id=vs_endpoint.resource_name.split("/")[-1],
+            index_id=index_id,
+            endpoint_id=endpoint_id,
             gcs_bucket_name=self.vs_bucket_name,
         )
         if firestore_db_name and firestore_namespace:
@@ -217,11 +369,66 @@ class IndexManager:
         similarity_top_k: int = 5,
         retrieval_strategy: str = "auto_merging",
         use_hyde: bool = True,
+        hyde_num_hypotheses: int = 1,
+        hyde_latency_budget_sec: float | None = None,
         use_refine: bool = True,
         use_node_rerank: bool = False,
         qa_followup: bool = True,
         hybrid_retrieval: bool = True,
     ) -> AsyncRetrieverQueryEngine:
+        """
+        Returns a llamaindex QueryEngine given a
+        VectorStoreIndex and hyperparameters.
+        Engines are pooled by configuration and only built on a miss.
+        """
+        config_key = (
+            llm_name,
+            temperature,
+            similarity_top_k,
+            retrieval_strategy,
+            use_hyde,
+            hyde_num_hypotheses,
+            hyde_latency_budget_sec,
+            use_refine,
+            use_node_rerank,
+            qa_followup,
+            hybrid_retrieval,
+            tuple(sorted(prompts.to_dict().items())),
+        )
+        query_engine = self.query_engine_pool.get_or_create(
+            config_key,
+            lambda: self._build_query_engine(
+                prompts=prompts,
+                llm_name=llm_name,
+                temperature=temperature,
+                similarity_top_k=similarity_top_k,
+                retrieval_strategy=retrieval_strategy,
+                use_hyde=use_hyde,
+                hyde_num_hypotheses=hyde_num_hypotheses,
+                hyde_latency_budget_sec=hyde_latency_budget_sec,
+                use_refine=use_refine,
+                use_node_rerank=use_node_rerank,
+                qa_followup=qa_followup,
+                hybrid_retrieval=hybrid_retrieval,
+            ),
+        )
+        return query_engine
+
+    def _build_query_engine(
+        self,
+        prompts: Prompts,
+        llm_name: str,
+        temperature: float,
+        similarity_top_k: int,
+        retrieval_strategy: str,
+        use_hyde: bool,
+        hyde_num_hypotheses: int,
+        hyde_latency_budget_sec: float | None,
+        use_refine: bool,
+        use_node_rerank: bool,
+        qa_followup: bool,
+        hybrid_retrieval: bool,
+    ) -> AsyncRetrieverQueryEngine | AsyncTransformQueryEngine:
         """
         Creates a llamaindex QueryEngine given a
         VectorStoreIndex and hyperparameters
@@ -229,9 +436,8 @@ class IndexManager:
         llm = self.get_vertex_llm(
             llm_name=llm_name,
             temperature=temperature,
-            system_prompt=Prompts.system_prompt,
+            system_prompt=prompts.system_prompt,
         )
-        Settings.llm = llm
 
         qa_prompt = PromptTemplate(prompts.qa_prompt_tmpl)
         refine_prompt = PromptTemplate(prompts.refine_prompt_tmpl)
@@ -242,10 +448,14 @@ class IndexManager:
                 refine_template=refine_prompt,
                 response_mode="compact",
                 use_async=True,
+                llm=llm,
             )
         else:
             synth = get_response_synthesizer(
-                text_qa_template=qa_prompt, response_mode="compact", use_async=True
+                text_qa_template=qa_prompt,
+                response_mode="compact",
+                use_async=True,
+                llm=llm,
             )
 
         base_retriever = self.base_index.as_retriever(similarity_top_k=similarity_top_k)
@@ -265,28 +475,34 @@ class IndexManager:
             )
         elif retrieval_strategy == "parent":
             retriever = ParentRetriever(
-                base_retriever, docstore=self.base_index.docstore
+                base_retriever,
+                docstore=self.base_index.docstore,
+                fetcher=self.base_docstore_fetcher,
             )
         elif retrieval_strategy == "baseline":
             retriever = base_retriever
 
         if qa_followup:
             qa_retriever = QARetriever(
-                qa_vector_retriever=qa_vector_retriever, docstore=self.qa_index.docstore
+                qa_vector_retriever=qa_vector_retriever,
+                docstore=self.qa_index.docstore,
+                fetcher=self.qa_docstore_fetcher,
             )
             retriever = QAFollowupRetriever(
-                qa_retriever=qa_retriever, base_retriever=retriever
+                qa_retriever=qa_retriever,
+                base_retriever=retriever,
+                concurrent=self.qa_followup_concurrent,
+                base_timeout=self.base_retriever_timeout,
+                qa_timeout=self.qa_retriever_timeout,
             )
 
         if hybrid_retrieval:
-            bm25_retriever = BM25Retriever.from_defaults(
-                docstore=self.base_index.docstore,
-                similarity_top_k=similarity_top_k,
-                stemmer=Stemmer.Stemmer("english"),
-                language="english",
+            bm25_retriever = PersistentBM25Retriever(
+                index=self.get_bm25_index(), similarity_top_k=similarity_top_k
             )
             retriever = QueryFusionRetriever(
                 [retriever, bm25_retriever],
+                llm=llm,
                 similarity_top_k=similarity_top_k,
                 num_queries=1,  # set this to 1 to disable query generation
                 mode="reciprocal_rerank",
@@ -297,11 +513,8 @@ class IndexManager:
             )
 
         if use_node_rerank:
-            reranker_llm = Vertex(
-                model="gemini-1.5-flash",
-                max_tokens=8192,
-                temperature=temperature,
-                system_prompt=prompts.system_prompt,
+            reranker_llm = self.get_reranker_llm(
+                temperature=temperature, system_prompt=prompts.system_prompt
             )
             choice_select_prompt = PromptTemplate(prompts.choice_select_prompt_tmpl)
             llm_reranker = CustomLLMRerank(
@@ -315,24 +528,34 @@ class IndexManager:
 
         query_engine = AsyncRetrieverQueryEngine.from_args(
             retriever,
+            llm=llm,
             response_synthesizer=synth,
-            node_postprocessors=[llm_reranker] if llm_reranker else None,
+            postprocessor_stages=(
+                [PostprocessorStage(name="llm_rerank", postprocessor=llm_reranker)]
+                if llm_reranker
+                else None
+            ),
         )
 
         if use_hyde:
             hyde_prompt = PromptTemplate(prompts.hyde_prompt_tmpl)
             hyde = AsyncHyDEQueryTransform(
-                include_original=True, hyde_prompt=hyde_prompt
+                llm=llm,
+                include_original=True,
+                hyde_prompt=hyde_prompt,
+                embed_model=self.embed_model,
+                num_hypotheses=hyde_num_hypotheses,
+                latency_budget_sec=hyde_latency_budget_sec,
             )
             query_engine = AsyncTransformQueryEngine(
                 query_engine=query_engine, query_transform=hyde
             )
 
-        self.query_engine = query_engine
         return query_engine
 
     def get_react_agent(
         self,
+        query_engine: AsyncRetrieverQueryEngine | AsyncTransformQueryEngine,
         prompts: Prompts,
         llm_name: str = "gemini-1.5-flash",
         temperature: float = 0.2,
@@ -342,7 +565,7 @@ class IndexManager:
         """
         query_engine_tools = [
             QueryEngineTool(
-                query_engine=self.query_engine,
+                query_engine=query_engine,
                 metadata=ToolMetadata(
                     name="google_financials",
                     description=(
@@ -357,7 +580,6 @@ class IndexManager:
             temperature=temperature,
             system_prompt=prompts.system_prompt,
         )
-        Settings.llm = llm
         agent = ReActAgent.from_tools(
             query_engine_tools, llm=llm, verbose=True, context=prompts.system_prompt
         )
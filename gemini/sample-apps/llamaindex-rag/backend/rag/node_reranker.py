@@ -1,10 +1,10 @@
 """Node Re-ranker class for async execution"""
 
+import asyncio
 from collections.abc import Callable
 import logging
 
-import google.auth
-import google.auth.transport.requests
+from backend.rag.ranking_client import RankingClient, get_ranking_client
 from llama_index.core import QueryBundle, Settings
 from llama_index.core.bridge.pydantic import Field, PrivateAttr
 from llama_index.core.indices.utils import (
@@ -19,68 +19,36 @@ from llama_index.core.prompts.mixin import PromptDictType
 from llama_index.core.schema import NodeWithScore, TextNode
 from llama_index.core.service_context import ServiceContext
 from llama_index.core.settings import llm_from_settings_or_context
-from llama_index.llms.vertex import Vertex
-import requests
 
 logging.basicConfig(level=logging.INFO)  # Set the desired logging level
 logger = logging.getLogger(__name__)
 
 
-# Initialize the LLM and set it in the Settings
-llm = Vertex(model="gemini-1.5-flash", temperature=0.0)
-Settings.llm = llm
-
-
-def authenticate_google():
-    """Authenticate using Google credentials and return the access token."""
-    credentials, project_id = google.auth.default(
-        quota_project_id="pr-sbx-vertex-genai"
-    )
-    auth_req = google.auth.transport.requests.Request()
-    credentials.refresh(auth_req)
-    return credentials.token
-
-
-def call_reranker(query, records, google_token):
-    """Calls the reranker API with the given query and records.
-
-    Args:
-      query: The search query.
-      records: A list of dictionaries, where each dictionary represents a record
-        with "id", "title", and "content" fields.
-
-    Returns:
-      The API response as a dictionary.
-    """
-    # Replace 'your-project-id' with your actual Google Cloud project ID
-    project_id = "pr-sbx-vertex-genai"
-    model_name = "semantic-ranker-512@latest"
-    url = f"https://discoveryengine.googleapis.com/v1alpha/projects/{project_id}/locations/global/rankingConfigs/default_ranking_config:rank"
-
-    headers = {
-        "Authorization": "Bearer " + google_token,
-        "Content-Type": "application/json",
-        "X-Goog-User-Project": project_id,
-    }
+class GoogleReRankerSecretSauce(BaseNodePostprocessor):
+    """Reranker backed by the Vertex AI Search ranking API"""
 
-    data = {
-        "model": model_name,
-        "query": query,
-        "records": records,
-    }
+    _ranking_client: RankingClient = PrivateAttr()
 
-    response = requests.post(url, headers=headers, json=data)
-    print(response)
-    response.raise_for_status()  # Raise an error if the request failed
-    return response.json()
+    def __init__(self, ranking_client: RankingClient | None = None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._ranking_client = ranking_client or get_ranking_client()
 
+    async def postprocess_nodes(
+        self,
+        nodes: list[NodeWithScore],
+        query_bundle: QueryBundle | None = None,
+        query_str: str | None = None,
+    ) -> list[NodeWithScore]:
+        """Postprocess nodes."""
+        if query_str is not None and query_bundle is not None:
+            raise ValueError("Cannot specify both query_str and query_bundle")
+        elif query_str is not None:
+            query_bundle = QueryBundle(query_str)
+        return await self._postprocess_nodes(nodes, query_bundle)
 
-class GoogleReRankerSecretSauce(BaseNodePostprocessor):
-    def _postprocess_nodes(
+    async def _postprocess_nodes(
         self, nodes: list[NodeWithScore], query_bundle: QueryBundle | None
     ) -> list[NodeWithScore]:
-        google_token = authenticate_google()
-
         records = []
         for node_wscore in nodes:
             records.append(
@@ -90,7 +58,9 @@ class GoogleReRankerSecretSauce(BaseNodePostprocessor):
                     "content": node_wscore.node.text,
                 }
             )
-        response_json = call_reranker(query_bundle.query_str, records, google_token)
+        response_json = await self._ranking_client.rank(
+            query_bundle.query_str, records
+        )
 
         records = response_json["records"]
         new_nodes_wscores = []
@@ -111,6 +81,12 @@ class CustomLLMRerank(BaseNodePostprocessor):
     )
     choice_batch_size: int = Field(description="Batch size for choice select.")
     llm: LLM = Field(description="The LLM to rerank with.")
+    max_concurrency: int = Field(
+        description="Maximum number of batches scored concurrently.", ge=1
+    )
+    max_retries: int = Field(
+        description="Times a batch whose answer cannot be parsed is re-scored.", ge=0
+    )
 
     _format_node_batch_fn: Callable = PrivateAttr()
     _parse_choice_select_answer_fn: Callable = PrivateAttr()
@@ -124,6 +100,8 @@ class CustomLLMRerank(BaseNodePostprocessor):
         parse_choice_select_answer_fn: Callable | None = None,
         service_context: ServiceContext | None = None,
         top_n: int = 10,
+        max_concurrency: int = 4,
+        max_retries: int = 1,
     ) -> None:
         choice_select_prompt = choice_select_prompt or DEFAULT_CHOICE_SELECT_PROMPT
 
@@ -142,6 +120,8 @@ class CustomLLMRerank(BaseNodePostprocessor):
             choice_batch_size=choice_batch_size,
             service_context=service_context,
             top_n=top_n,
+            max_concurrency=max_concurrency,
+            max_retries=max_retries,
         )
 
     def _get_prompts(self) -> PromptDictType:
@@ -172,6 +152,44 @@ class CustomLLMRerank(BaseNodePostprocessor):
             pass
         return await self._postprocess_nodes(nodes, query_bundle)
 
+    async def _score_batch(
+        self,
+        batch_idx: int,
+        nodes_batch: list,
+        query_str: str,
+        semaphore: asyncio.Semaphore,
+    ) -> list[tuple[float, int, int]]:
+        """
+        Score a single batch, re-asking the LLM only for this batch when
+        its answer cannot be parsed. Returns (relevance, batch_idx, position)
+        tuples so results can be merged deterministically.
+        """
+        fmt_batch_str = self._format_node_batch_fn(nodes_batch)
+        for attempt in range(self.max_retries + 1):
+            async with semaphore:
+                raw_response = await self.llm.apredict(
+                    self.choice_select_prompt,
+                    context_str=fmt_batch_str,
+                    query_str=query_str,
+                )
+            logging.info(raw_response)
+            try:
+                raw_choices, relevances = self._parse_choice_select_answer_fn(
+                    raw_response, len(nodes_batch)
+                )
+                break
+            # Try again
+            except IndexError:
+                if attempt == self.max_retries:
+                    raise
+                logger.info(f"Could not parse rerank batch {batch_idx}, retrying")
+        choice_idxs = [int(choice) - 1 for choice in raw_choices]
+        relevances = relevances or [1.0 for _ in choice_idxs]
+        return [
+            (relevance, batch_idx, choice_idx)
+            for choice_idx, relevance in zip(choice_idxs, relevances)
+        ]
+
     async def _postprocess_nodes(
         self,
         nodes: list[NodeWithScore],
@@ -182,46 +200,27 @@ class CustomLLMRerank(BaseNodePostprocessor):
         if len(nodes) == 0:
             return []
 
-        initial_results: list[NodeWithScore] = []
-        for idx in range(0, len(nodes), self.choice_batch_size):
-            nodes_batch = [
-                node.node for node in nodes[idx : idx + self.choice_batch_size]
-            ]
-
-            query_str = query_bundle.query_str
-            fmt_batch_str = self._format_node_batch_fn(nodes_batch)
-            # call each batch independently
-            raw_response = await self.llm.apredict(
-                self.choice_select_prompt,
-                context_str=fmt_batch_str,
-                query_str=query_str,
-            )
-
-            logging.info(raw_response)
-            try:
-                raw_choices, relevances = self._parse_choice_select_answer_fn(
-                    raw_response, len(nodes_batch)
-                )
-            # Try again
-            except IndexError:
-                raw_response = await self.llm.apredict(
-                    self.choice_select_prompt,
-                    context_str=fmt_batch_str,
-                    query_str=query_str,
-                )
-                raw_choices, relevances = self._parse_choice_select_answer_fn(
-                    raw_response, len(nodes_batch)
+        batches = [
+            [node.node for node in nodes[idx : idx + self.choice_batch_size]]
+            for idx in range(0, len(nodes), self.choice_batch_size)
+        ]
+        # Score all batches at once, bounded by max_concurrency LLM calls
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        batch_results = await asyncio.gather(
+            *[
+                self._score_batch(
+                    batch_idx, nodes_batch, query_bundle.query_str, semaphore
                 )
-            choice_idxs = [int(choice) - 1 for choice in raw_choices]
-            choice_nodes = [nodes_batch[idx] for idx in choice_idxs]
-            relevances = relevances or [1.0 for _ in choice_nodes]
-            initial_results.extend(
-                [
-                    NodeWithScore(node=node, score=relevance)
-                    for node, relevance in zip(choice_nodes, relevances)
-                ]
-            )
+                for batch_idx, nodes_batch in enumerate(batches)
+            ]
+        )
 
-        return sorted(initial_results, key=lambda x: x.score or 0.0, reverse=True)[
-            : self.top_n
+        # Ties are broken by original node order, independent of completion order
+        scored = sorted(
+            (result for results in batch_results for result in results),
+            key=lambda x: (-(x[0] or 0.0), x[1], x[2]),
+        )
+        return [
+            NodeWithScore(node=batches[batch_idx][choice_idx], score=relevance)
+            for relevance, batch_idx, choice_idx in scored[: self.top_n]
         ]
@@ -2,6 +2,7 @@
 
 import logging
 
+from backend.rag.docstore_fetcher import DocstoreFetcher
 from llama_index.core import QueryBundle
 from llama_index.core.retrievers import BaseRetriever, VectorIndexRetriever
 from llama_index.core.schema import NodeRelationship, NodeWithScore, TextNode
@@ -18,7 +19,10 @@ class ParentRetriever(BaseRetriever):
     the source document associated with a node."""
 
     def __init__(
-        self, vector_retriever: VectorIndexRetriever, docstore: FirestoreDocumentStore
+        self,
+        vector_retriever: VectorIndexRetriever,
+        docstore: FirestoreDocumentStore,
+        fetcher: DocstoreFetcher | None = None,
     ) -> None:
         """
         This retriever uses a vector store to do initial node retriever and a documentstore to retrieve nodes by id
@@ -26,11 +30,14 @@ class ParentRetriever(BaseRetriever):
 
         self._vector_retriever = vector_retriever
         self._docstore = docstore
+        self._fetcher = fetcher or DocstoreFetcher(docstore)
         super().__init__()
 
-    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
-        """Expand retrieved nodes into all their source documents"""
-        initial_nodes = self._vector_retriever.retrieve(query_bundle)
+    @staticmethod
+    def _mean_score_per_source(initial_nodes: list[NodeWithScore]) -> list[dict]:
+        """Group retrieved nodes by source document, averaging their scores"""
+        if not initial_nodes:
+            return []
         node_source_id_score_df = pd.DataFrame(
             [
                 {
@@ -43,12 +50,34 @@ class ParentRetriever(BaseRetriever):
         final_df = (
             node_source_id_score_df.groupby("source_id")["score"].mean().reset_index()
         )
-        unique_source_doc_ids_scores = final_df.to_dict("records")
+        return final_df.to_dict("records")
 
-        source_docs = []
-        for doc_score in unique_source_doc_ids_scores:
-            source_doc = self._docstore.get_document(doc_score["source_id"])
-            node = TextNode(id_=doc_score["source_id"], text=source_doc.text)
-            source_docs.append(NodeWithScore(node=node, score=doc_score["score"]))
+    @staticmethod
+    def _to_source_nodes(
+        unique_source_doc_ids_scores: list[dict], source_docs: list
+    ) -> list[NodeWithScore]:
+        return [
+            NodeWithScore(
+                node=TextNode(id_=doc_score["source_id"], text=source_doc.text),
+                score=doc_score["score"],
+            )
+            for doc_score, source_doc in zip(unique_source_doc_ids_scores, source_docs)
+        ]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        """Expand retrieved nodes into all their source documents"""
+        initial_nodes = self._vector_retriever.retrieve(query_bundle)
+        unique_source_doc_ids_scores = self._mean_score_per_source(initial_nodes)
+        source_docs = self._fetcher.get_documents(
+            [d["source_id"] for d in unique_source_doc_ids_scores]
+        )
+        return self._to_source_nodes(unique_source_doc_ids_scores, source_docs)
 
-        return source_docs
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        """Expand retrieved nodes into all their source documents"""
+        initial_nodes = await self._vector_retriever.aretrieve(query_bundle)
+        unique_source_doc_ids_scores = self._mean_score_per_source(initial_nodes)
+        source_docs = await self._fetcher.aget_documents(
+            [d["source_id"] for d in unique_source_doc_ids_scores]
+        )
+        return self._to_source_nodes(unique_source_doc_ids_scores, source_docs)
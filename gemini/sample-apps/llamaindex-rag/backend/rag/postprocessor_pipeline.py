@@ -0,0 +1,172 @@
+"""Dependency-aware, concurrent node postprocessor pipeline"""
+
+import asyncio
+from collections import Counter
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+import graphlib
+import inspect
+import logging
+
+from backend.rag.request_metrics import timed
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+logging.basicConfig(level=logging.INFO)  # Set the desired logging level
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PostprocessorStage:
+    """A named postprocessor and the stages whose output it consumes"""
+
+    name: str
+    postprocessor: BaseNodePostprocessor
+    depends_on: tuple[str, ...] = field(default_factory=tuple)
+
+
+def merge_node_lists(node_lists: Sequence[list[NodeWithScore]]) -> list[NodeWithScore]:
+    """
+    Merge the outputs of stages that ran concurrently on the same input.
+    Only nodes kept by every stage survive (so filters compose), metadata
+    added by any stage is kept (so enrichers compose), and order and scores
+    come from the last list. Merged nodes are new objects, so the inputs
+    are never mutated.
+    """
+    if len(node_lists) == 1:
+        return node_lists[0]
+    common_ids = set.intersection(
+        *[{n.node.node_id for n in node_list} for node_list in node_lists]
+    )
+    merged_metadata: dict[str, dict] = {node_id: {} for node_id in common_ids}
+    for node_list in node_lists:
+        for n in node_list:
+            if n.node.node_id in common_ids:
+                merged_metadata[n.node.node_id].update(n.node.metadata)
+    merged = []
+    for n in node_lists[-1]:
+        if n.node.node_id in common_ids:
+            merged_node = n.model_copy(deep=True)
+            merged_node.node.metadata = merged_metadata[n.node.node_id]
+            merged.append(merged_node)
+    return merged
+
+
+def copy_node_list(nodes: Sequence[NodeWithScore]) -> list[NodeWithScore]:
+    """Deep copy nodes so a stage can mutate them without affecting others"""
+    return [n.model_copy(deep=True) for n in nodes]
+
+
+async def apply_postprocessor(
+    postprocessor: BaseNodePostprocessor,
+    nodes: list[NodeWithScore],
+    query_bundle: QueryBundle,
+) -> list[NodeWithScore]:
+    """Run a postprocessor, off the event loop if it is synchronous"""
+    if inspect.iscoroutinefunction(postprocessor.postprocess_nodes):
+        return await postprocessor.postprocess_nodes(nodes, query_bundle=query_bundle)
+    return await asyncio.to_thread(
+        postprocessor.postprocess_nodes, nodes, query_bundle=query_bundle
+    )
+
+
+class PostprocessorPipeline:
+    """
+    Runs postprocessor stages as a DAG. Stages without dependencies receive
+    the retrieved nodes, other stages receive the merged output of the stages
+    they depend on, and stages that do not depend on each other run
+    concurrently. The pipeline output is the merged output of every stage
+    that no other stage depends on. The wall time of each stage is recorded
+    as a request metric (postprocessor_<name>_ms).
+    Stages whose input is shared with another stage receive their own copy
+    of the nodes, since postprocessors may mutate nodes in place.
+    """
+
+    def __init__(self, stages: Sequence[PostprocessorStage]):
+        self._stages = {stage.name: stage for stage in stages}
+        if len(self._stages) != len(stages):
+            raise ValueError("Postprocessor stage names must be unique")
+        for stage in stages:
+            for dependency in stage.depends_on:
+                if dependency not in self._stages:
+                    raise ValueError(
+                        f"Stage {stage.name} depends on unknown stage {dependency}"
+                    )
+        sorter = graphlib.TopologicalSorter(
+            {stage.name: stage.depends_on for stage in stages}
+        )
+        try:
+            self._order = list(sorter.static_order())
+        except graphlib.CycleError as e:
+            raise ValueError(f"Postprocessor stages contain a cycle: {e.args[1]}")
+        depended_on = {d for stage in stages for d in stage.depends_on}
+        self._sinks = [name for name in self._order if name not in depended_on]
+        # Stages reading each input (None stands for the retrieved nodes).
+        # Stages with several dependencies get freshly merged nodes, the
+        # others need a copy whenever another stage reads the same input.
+        readers = Counter(
+            dependency
+            for stage in stages
+            for dependency in (stage.depends_on or (None,))
+        )
+        self._copy_input = {
+            stage.name
+            for stage in stages
+            if len(stage.depends_on) <= 1
+            and readers[stage.depends_on[0] if stage.depends_on else None] > 1
+        }
+
+    @classmethod
+    def chain(
+        cls, postprocessors: Sequence[BaseNodePostprocessor]
+    ) -> "PostprocessorPipeline":
+        """Build a pipeline running postprocessors one after another"""
+        stages = []
+        for idx, postprocessor in enumerate(postprocessors):
+            stages.append(
+                PostprocessorStage(
+                    name=f"{idx}_{postprocessor.class_name()}",
+                    postprocessor=postprocessor,
+                    depends_on=(stages[-1].name,) if stages else (),
+                )
+            )
+        return cls(stages)
+
+    async def _run_stage(
+        self,
+        stage: PostprocessorStage,
+        nodes: list[NodeWithScore],
+        query_bundle: QueryBundle,
+        tasks: dict[str, asyncio.Task],
+    ) -> list[NodeWithScore]:
+        if stage.depends_on:
+            inputs = [await tasks[dependency] for dependency in stage.depends_on]
+            stage_nodes = merge_node_lists(inputs)
+        else:
+            stage_nodes = nodes
+        if stage.name in self._copy_input:
+            stage_nodes = copy_node_list(stage_nodes)
+        else:
+            stage_nodes = list(stage_nodes)
+        with timed(f"postprocessor_{stage.name}_ms"):
+            return await apply_postprocessor(
+                stage.postprocessor, stage_nodes, query_bundle
+            )
+
+    async def run(
+        self, nodes: list[NodeWithScore], query_bundle: QueryBundle
+    ) -> list[NodeWithScore]:
+        if not self._stages:
+            return nodes
+        tasks: dict[str, asyncio.Task] = {}
+        for name in self._order:
+            tasks[name] = asyncio.create_task(
+                self._run_stage(self._stages[name], nodes, query_bundle, tasks)
+            )
+        try:
+            outputs = await asyncio.gather(*[tasks[name] for name in self._sinks])
+        except Exception:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        return merge_node_lists(outputs)
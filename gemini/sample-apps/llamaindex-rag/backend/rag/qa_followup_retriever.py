@@ -1,8 +1,12 @@
 """Custom retriever which implements
 retrieval based on hypothetical questions"""
 
+import asyncio
 import logging
+import time
 
+from backend.rag.docstore_fetcher import DocstoreFetcher
+from backend.rag.request_metrics import record_metric
 from llama_index.core import QueryBundle
 from llama_index.core.retrievers import BaseRetriever, VectorIndexRetriever
 from llama_index.core.schema import NodeRelationship, NodeWithScore
@@ -21,48 +25,46 @@ class QARetriever(BaseRetriever):
         self,
         qa_vector_retriever: VectorIndexRetriever,
         docstore: FirestoreDocumentStore,
+        fetcher: DocstoreFetcher | None = None,
     ) -> None:
         """
         This retriever uses a vector store to do
-        initial node retriever and a documentstore to retrieve nodes by id
+        initial node retriever and a documentstore to retrieve nodes by id.
+        Source documents are looked up in bulk through the (shared) fetcher.
         """
 
         self._qa_vector_retriever = qa_vector_retriever
         self._docstore = docstore
+        self._fetcher = fetcher or DocstoreFetcher(docstore)
         super().__init__()
 
-    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
-        qa_nodes = self._qa_vector_retriever.retrieve(query_bundle)
-        og_docs = []
+    @staticmethod
+    def _source_doc_ids(qa_nodes: list[NodeWithScore]) -> list[str]:
+        source_doc_ids = []
         for nodewscore in qa_nodes:
-            logger.info(nodewscore.node.text)
-            source_doc_id = nodewscore.node.relationships[
-                NodeRelationship.SOURCE
-            ].node_id
-            og_docs.append(
-                NodeWithScore(
-                    node=self._docstore.get_document(source_doc_id),
-                    score=nodewscore.score,
-                )
+            logger.info(f"Matched Question: {nodewscore.node.text}")
+            source_doc_ids.append(
+                nodewscore.node.relationships[NodeRelationship.SOURCE].node_id
             )
+        return source_doc_ids
 
-        return og_docs
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        qa_nodes = self._qa_vector_retriever.retrieve(query_bundle)
+        source_docs = self._fetcher.get_documents(self._source_doc_ids(qa_nodes))
+        return [
+            NodeWithScore(node=source_doc, score=nodewscore.score)
+            for source_doc, nodewscore in zip(source_docs, qa_nodes)
+        ]
 
     async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
         qa_nodes = await self._qa_vector_retriever.aretrieve(query_bundle)
-        og_docs = []
-        for nodewscore in qa_nodes:
-            logger.info(f"Matched Question: {nodewscore.node.text}")
-            source_doc_id = nodewscore.node.relationships[
-                NodeRelationship.SOURCE
-            ].node_id
-            og_docs.append(
-                NodeWithScore(
-                    node=self._docstore.get_document(source_doc_id),
-                    score=nodewscore.score,
-                )
-            )
-        return og_docs
+        source_docs = await self._fetcher.aget_documents(
+            self._source_doc_ids(qa_nodes)
+        )
+        return [
+            NodeWithScore(node=source_doc, score=nodewscore.score)
+            for source_doc, nodewscore in zip(source_docs, qa_nodes)
+        ]
 
 
 class QAFollowupRetriever(BaseRetriever):
@@ -71,21 +73,34 @@ class QAFollowupRetriever(BaseRetriever):
     into an index storing questions answered per docs"""
 
     def __init__(
-        self, qa_retriever: QARetriever, base_retriever: BaseRetriever
+        self,
+        qa_retriever: QARetriever,
+        base_retriever: BaseRetriever,
+        concurrent: bool = True,
+        base_timeout: float | None = None,
+        qa_timeout: float | None = None,
     ) -> None:
         """
         This retriever uses a vector store to do initial node retriever
-        and a documentstore to retrieve nodes by id
+        and a documentstore to retrieve nodes by id.
+        In aretrieve each branch runs through the retriever's aretrieve, so
+        the QA branch uses the batched async docstore fetch. With
+        concurrent=True both branches run at once; a branch exceeding its
+        timeout (seconds) is cancelled and contributes no nodes instead of
+        stalling the query.
         """
 
         self._qa_retriever = qa_retriever
         self._base_retriever = base_retriever
+        self._concurrent = concurrent
+        self._base_timeout = base_timeout
+        self._qa_timeout = qa_timeout
         super().__init__()
 
-    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
-        am_nodes = self._base_retriever.retrieve(query_bundle)
-        qa_nodes = self._qa_retriever.retrieve(query_bundle)
-
+    @staticmethod
+    def _combine(
+        am_nodes: list[NodeWithScore], qa_nodes: list[NodeWithScore]
+    ) -> list[NodeWithScore]:
         am_ids = {n.node.node_id for n in am_nodes}
         qa_ids = {n.node.node_id for n in qa_nodes}
         num_qa_ids = len(qa_ids)
@@ -98,18 +113,42 @@ class QAFollowupRetriever(BaseRetriever):
         retrieve_nodes = [combined_dict[rid] for rid in retrieve_ids]
         return retrieve_nodes
 
-    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
-        am_nodes = await self._base_retriever.aretrieve(query_bundle)
-        qa_nodes = await self._qa_retriever.aretrieve(query_bundle)
+    @staticmethod
+    async def _timed_branch(
+        name: str,
+        retriever: BaseRetriever,
+        query_bundle: QueryBundle,
+        timeout: float | None,
+    ) -> list[NodeWithScore]:
+        """Run one retrieval branch, recording its latency and timing out"""
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(retriever.aretrieve(query_bundle), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{name} retriever timed out after {timeout}s")
+            record_metric(f"{name}_retriever_timed_out", True)
+            return []
+        finally:
+            record_metric(
+                f"{name}_retriever_ms",
+                round((time.perf_counter() - start) * 1000, 2),
+            )
 
-        am_ids = {n.node.node_id for n in am_nodes}
-        qa_ids = {n.node.node_id for n in qa_nodes}
-        num_qa_ids = len(qa_ids)
-        num_am_ids = len(am_ids)
-        logger.info(f"number of nodes found with question matching {num_qa_ids}")
-        logger.info(f"number of nodes found with base retriever: {num_am_ids}")
-        combined_dict = {n.node.node_id: n for n in am_nodes}
-        combined_dict.update({n.node.node_id: n for n in qa_nodes})
-        retrieve_ids = am_ids.union(qa_ids)
-        retrieve_nodes = [combined_dict[rid] for rid in retrieve_ids]
-        return retrieve_nodes
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        am_nodes = self._base_retriever.retrieve(query_bundle)
+        qa_nodes = self._qa_retriever.retrieve(query_bundle)
+        return self._combine(am_nodes, qa_nodes)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        base_branch = self._timed_branch(
+            "base", self._base_retriever, query_bundle, self._base_timeout
+        )
+        qa_branch = self._timed_branch(
+            "qa", self._qa_retriever, query_bundle, self._qa_timeout
+        )
+        if self._concurrent:
+            am_nodes, qa_nodes = await asyncio.gather(base_branch, qa_branch)
+        else:
+            am_nodes = await base_branch
+            qa_nodes = await qa_branch
+        return self._combine(am_nodes, qa_nodes)
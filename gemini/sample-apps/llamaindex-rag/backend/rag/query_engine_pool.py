@@ -0,0 +1,80 @@
+"""Bounded pool of fully built query engines keyed by RAG configuration"""
+
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+import logging
+import threading
+from typing import Any
+
+logging.basicConfig(level=logging.INFO)  # Set the desired logging level
+logger = logging.getLogger(__name__)
+
+
+class QueryEnginePool:
+    """
+    LRU pool of query engines keyed by the RAGConfig fields
+    (and the prompts) they were built with.
+    Building a query engine instantiates LLMs, synthesizers and
+    retrievers, so engines are reused across requests on a hit and
+    the least recently used engine is evicted once max_size is reached.
+    The pool is cleared whenever the underlying indexes change.
+    """
+
+    def __init__(self, max_size: int = 8):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._generation = 0
+        self._engines: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the engine stored under key, building it with factory on a miss"""
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is not None:
+                self._engines.move_to_end(key)
+                self.hits += 1
+                return engine
+            self.misses += 1
+            generation = self._generation
+
+        # Build outside of the lock so a slow build does not block hits
+        engine = factory()
+
+        with self._lock:
+            if generation != self._generation:
+                # The pool was cleared mid-build, so the engine may be bound
+                # to stale indexes: serve it once but do not pool it
+                return engine
+            self._engines[key] = engine
+            self._engines.move_to_end(key)
+            while len(self._engines) > self.max_size:
+                evicted_key, _ = self._engines.popitem(last=False)
+                self.evictions += 1
+                logger.info(f"Evicted query engine for config {evicted_key}")
+        return engine
+
+    def clear(self) -> None:
+        """Drop every pooled engine (e.g. after the indexes are swapped)"""
+        with self._lock:
+            num_engines = len(self._engines)
+            self._engines.clear()
+            self._generation += 1
+        logger.info(f"Invalidated {num_engines} pooled query engines")
+
+    def stats(self) -> dict:
+        """Return hit/miss counters for the pool"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._engines),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,155 @@
+"""Shared async client for the Vertex AI Search ranking API"""
+
+import asyncio
+import datetime
+import logging
+
+import google.auth
+import google.auth.transport.requests
+import httpx
+
+logging.basicConfig(level=logging.INFO)  # Set the desired logging level
+logger = logging.getLogger(__name__)
+
+DISCOVERY_ENGINE_URL = "https://discoveryengine.googleapis.com"
+
+
+class RankingClient:
+    """
+    Async, connection-pooled client for the ranking API.
+    The access token is cached and only refreshed shortly before it
+    expires, and the HTTP connection pool is reused across requests.
+    Point base_url at a local stub server (with authenticate=False)
+    to run without Google credentials, e.g. in tests.
+    """
+
+    def __init__(
+        self,
+        project_id: str = "pr-sbx-vertex-genai",
+        model_name: str = "semantic-ranker-512@latest",
+        base_url: str = DISCOVERY_ENGINE_URL,
+        authenticate: bool = True,
+        token_refresh_margin_sec: int = 300,
+        max_connections: int = 20,
+        timeout_sec: float = 30.0,
+    ):
+        self.project_id = project_id
+        self.model_name = model_name
+        self.base_url = base_url.rstrip("/")
+        self.authenticate = authenticate
+        self.token_refresh_margin = datetime.timedelta(
+            seconds=token_refresh_margin_sec
+        )
+        self.max_connections = max_connections
+        self.timeout_sec = timeout_sec
+        self.token_refreshes = 0
+        self._credentials = None
+        self._token_lock: asyncio.Lock | None = None
+        self._client: httpx.AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def rank_url(self) -> str:
+        return (
+            f"{self.base_url}/v1alpha/projects/{self.project_id}/locations/global"
+            "/rankingConfigs/default_ranking_config:rank"
+        )
+
+    async def _bind_to_loop(self) -> None:
+        """(Re)create loop-bound resources when used from a new event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            old_client, old_loop = self._client, self._loop
+            self._loop = loop
+            self._token_lock = asyncio.Lock()
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout_sec,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            if old_client is not None:
+                await self._close_client(old_client, old_loop)
+
+    @staticmethod
+    async def _close_client(
+        client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop | None
+    ) -> None:
+        """Close a client created on another (possibly finished) event loop"""
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            # Let the owning loop close its own connections
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            return
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.debug(f"Error closing ranking client of a finished loop: {e}")
+
+    def _token_is_fresh(self) -> bool:
+        credentials = self._credentials
+        if credentials is None or not credentials.token:
+            return False
+        if credentials.expiry is None:
+            return True
+        # google-auth reports expiry as a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return credentials.expiry - self.token_refresh_margin > now
+
+    def _refresh_credentials(self) -> None:
+        if self._credentials is None:
+            self._credentials, _ = google.auth.default(
+                quota_project_id=self.project_id
+            )
+        self._credentials.refresh(google.auth.transport.requests.Request())
+        self.token_refreshes += 1
+
+    async def get_token(self) -> str:
+        """Return a cached access token, refreshing it if about to expire"""
+        await self._bind_to_loop()
+        if not self._token_is_fresh():
+            async with self._token_lock:
+                # Another request may have refreshed while we waited
+                if not self._token_is_fresh():
+                    await asyncio.to_thread(self._refresh_credentials)
+        return self._credentials.token
+
+    async def rank(self, query: str, records: list[dict]) -> dict:
+        """Calls the ranking API with the given query and records.
+
+        Args:
+          query: The search query.
+          records: A list of dictionaries, where each dictionary represents a
+            record with "id", "title", and "content" fields.
+
+        Returns:
+          The API response as a dictionary.
+        """
+        await self._bind_to_loop()
+        headers = {
+            "Content-Type": "application/json",
+            "X-Goog-User-Project": self.project_id,
+        }
+        if self.authenticate:
+            headers["Authorization"] = "Bearer " + await self.get_token()
+        data = {"model": self.model_name, "query": query, "records": records}
+        response = await self._client.post(self.rank_url, headers=headers, json=data)
+        response.raise_for_status()  # Raise an error if the request failed
+        return response.json()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+
+_default_ranking_client: RankingClient | None = None
+
+
+def get_ranking_client() -> RankingClient:
+    """Return the process-wide ranking client"""
+    global _default_ranking_client
+    if _default_ranking_client is None:
+        _default_ranking_client = RankingClient()
+    return _default_ranking_client
@@ -0,0 +1,54 @@
+"""Async token-bucket rate limiter for LLM calls"""
+
+import asyncio
+import logging
+import time
+
+logging.basicConfig(level=logging.INFO)  # Set the desired logging level
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for rate limiting"""
+    return max(1, len(text) // 4)
+
+
+class TokenRateLimiter:
+    """
+    Token bucket holding up to tokens_per_minute tokens which refills
+    continuously. acquire(n) waits until n tokens are available, so callers
+    stay under a per-minute token quota without failing requests.
+    A limiter with tokens_per_minute=None never waits.
+    """
+
+    def __init__(self, tokens_per_minute: int | None = None):
+        self.tokens_per_minute = tokens_per_minute
+        self._available = float(tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._lock: asyncio.Lock | None = None
+        self.waited_sec = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._available = min(
+            float(self.tokens_per_minute),
+            self._available + (now - self._last_refill) * self.tokens_per_minute / 60,
+        )
+        self._last_refill = now
+
+    async def acquire(self, tokens: int) -> None:
+        if not self.tokens_per_minute:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Requests larger than the bucket would otherwise never be admitted
+        tokens = min(tokens, self.tokens_per_minute)
+        # Holding the lock while sleeping keeps admission first-come first-served
+        async with self._lock:
+            self._refill()
+            if self._available < tokens:
+                wait_sec = (tokens - self._available) * 60 / self.tokens_per_minute
+                self.waited_sec += wait_sec
+                await asyncio.sleep(wait_sec)
+                self._refill()
+            self._available -= tokens
@@ -0,0 +1,41 @@
+"""Request-scoped latency metrics for the RAG pipeline"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+
+# The dict is created once per request and mutated in place, so values
+# recorded inside tasks spawned by llamaindex (which copy the context)
+# are still visible to the request handler.
+_request_metrics: ContextVar[dict | None] = ContextVar(
+    "request_metrics", default=None
+)
+
+
+def start_request_metrics() -> dict:
+    """Start collecting metrics for the current request and return the dict"""
+    metrics: dict = {}
+    _request_metrics.set(metrics)
+    return metrics
+
+
+def get_request_metrics() -> dict:
+    """Return the metrics recorded for the current request so far"""
+    return _request_metrics.get() or {}
+
+
+def record_metric(name: str, value) -> None:
+    """Record a metric for the current request (no-op outside a request)"""
+    metrics = _request_metrics.get()
+    if metrics is not None:
+        metrics[name] = value
+
+
+@contextmanager
+def timed(name: str):
+    """Record the wall time of the enclosed block in milliseconds"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_metric(name, round((time.perf_counter() - start) * 1000, 2))
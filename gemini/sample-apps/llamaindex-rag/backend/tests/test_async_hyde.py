@@ -0,0 +1,101 @@
+import asyncio
+import logging
+
+from backend.rag.async_extensions import AsyncHyDEQueryTransform
+from llama_index.core.schema import QueryBundle
+
+
+class FakeLLM:
+    """Returns one hypothesis per call, each taking the next delay"""
+
+    def __init__(self, delays):
+        self._delays = iter(delays)
+        self.cancelled = 0
+
+    async def apredict(self, prompt, context_str):
+        delay = next(self._delays)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"hypothesis {delay}"
+
+
+class FailingLLM:
+    async def apredict(self, prompt, context_str):
+        raise RuntimeError("quota exceeded")
+
+
+class FakeEmbedding:
+    def __init__(self):
+        self.batches = []
+        self.queries = []
+
+    async def aget_text_embedding_batch(self, texts):
+        self.batches.append(list(texts))
+        return [[float(i), 1.0] for i in range(len(texts))]
+
+    async def aget_query_embedding(self, query):
+        self.queries.append(query)
+        return [4.0, 1.0]
+
+
+def test_hypotheses_over_budget_are_dropped_and_awaited():
+    llm = FakeLLM([0.0, 0.0, 5.0])
+    transform = AsyncHyDEQueryTransform(
+        llm=llm, num_hypotheses=3, latency_budget_sec=0.2, include_original=False
+    )
+
+    async def run():
+        bundle = await transform._arun(QueryBundle("question"), metadata={})
+        pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        return bundle, pending
+
+    bundle, pending = asyncio.run(run())
+    assert bundle.custom_embedding_strs == ["hypothesis 0.0", "hypothesis 0.0"]
+    assert llm.cancelled == 1
+    assert pending == []
+
+
+def test_falls_back_to_query_when_no_hypothesis_in_budget():
+    transform = AsyncHyDEQueryTransform(
+        llm=FakeLLM([5.0]), latency_budget_sec=0.05, include_original=False
+    )
+    bundle = asyncio.run(transform._arun(QueryBundle("question"), metadata={}))
+    assert bundle.custom_embedding_strs == ["question"]
+
+
+def test_hypotheses_are_embedded_in_one_batch_and_mean_pooled():
+    embed_model = FakeEmbedding()
+    transform = AsyncHyDEQueryTransform(
+        llm=FakeLLM([0.0, 0.0]), embed_model=embed_model, num_hypotheses=2
+    )
+    bundle = asyncio.run(transform._arun(QueryBundle("question"), metadata={}))
+    assert embed_model.batches == [["hypothesis 0.0", "hypothesis 0.0"]]
+    # The original query is embedded in query mode, as get_agg_embedding_from_queries
+    assert embed_model.queries == ["question"]
+    assert bundle.custom_embedding_strs == [
+        "hypothesis 0.0",
+        "hypothesis 0.0",
+        "question",
+    ]
+    assert bundle.embedding == [5 / 3, 1.0]
+
+
+def test_failed_hypotheses_are_logged(caplog):
+    embed_model = FakeEmbedding()
+    transform = AsyncHyDEQueryTransform(
+        llm=FailingLLM(), embed_model=embed_model, include_original=False
+    )
+    with caplog.at_level(logging.WARNING):
+        bundle = asyncio.run(transform._arun(QueryBundle("question"), metadata={}))
+    assert "quota exceeded" in caplog.text
+    assert embed_model.batches == []
+    assert bundle.embedding == [4.0, 1.0]
+
+
+def test_no_hypotheses_requested_uses_query():
+    transform = AsyncHyDEQueryTransform(llm=FakeLLM([]), num_hypotheses=0)
+    bundle = asyncio.run(transform._arun(QueryBundle("question"), metadata={}))
+    assert bundle.custom_embedding_strs == ["question"]
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import threading
+
+from backend.rag.bm25_index import PersistentBM25Index, PersistentBM25Retriever
+from llama_index.core import QueryBundle
+from llama_index.core.schema import TextNode
+
+
+def _nodes(prefix, n):
+    return [
+        TextNode(id_=f"{prefix}-{i}", text=f"{prefix} document about retrieval {i}")
+        for i in range(n)
+    ]
+
+
+def test_reader_survives_compaction(tmp_path):
+    index_dir = str(tmp_path / "bm25")
+    writer = PersistentBM25Index(index_dir, max_segments=100)
+    writer.add_nodes(_nodes("alpha", 3))
+    writer.add_nodes(_nodes("beta", 3))
+
+    reader = PersistentBM25Index(index_dir)
+    results = reader.search("retrieval", top_k=6)
+    assert len(results) == 6
+    old_segments = {segment.path for _, segment, _ in results}
+
+    # Compact twice so the reader's segments are removed from disk
+    writer.compact()
+    writer.add_nodes(_nodes("gamma", 1))
+    writer.compact()
+    assert not any(os.path.exists(path) for path in old_segments)
+
+    loaded = {segment.load_node(idx).node_id for _, segment, idx in results}
+    assert loaded == {f"{p}-{i}" for p in ("alpha", "beta") for i in range(3)}
+
+
+def test_compaction_keeps_retired_segments_until_next_compaction(tmp_path):
+    index_dir = str(tmp_path / "bm25")
+    writer = PersistentBM25Index(index_dir, max_segments=100)
+    writer.add_nodes(_nodes("alpha", 2))
+    writer.add_nodes(_nodes("beta", 2))
+    retired = [segment.path for segment in writer.segments]
+
+    writer.compact()
+    assert all(os.path.exists(path) for path in retired)
+
+    reader = PersistentBM25Index(index_dir)
+    assert reader.num_docs == 4
+    assert len(reader.search("beta", top_k=2)) == 2
+
+
+def test_aretrieve_scores_off_the_event_loop(tmp_path, monkeypatch):
+    index = PersistentBM25Index(str(tmp_path / "bm25"))
+    index.add_nodes(_nodes("alpha", 3))
+    retriever = PersistentBM25Retriever(index, similarity_top_k=2)
+    search_threads = []
+    search = index.search
+
+    def recording_search(*args, **kwargs):
+        search_threads.append(threading.current_thread())
+        return search(*args, **kwargs)
+
+    monkeypatch.setattr(index, "search", recording_search)
+    nodes = asyncio.run(retriever.aretrieve(QueryBundle("retrieval")))
+    assert len(nodes) == 2
+    assert search_threads and search_threads[0] is not threading.main_thread()
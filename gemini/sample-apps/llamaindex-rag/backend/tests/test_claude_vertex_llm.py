@@ -1,3 +1,5 @@
+import asyncio
+
 from backend.rag.claude_vertex import ClaudeVertexLLM
 
 
@@ -11,3 +13,26 @@ def test_claude_vertex_llm():
     )
 
     llm.complete(prompt="Tell me something interesting!")
+
+
+def test_claude_vertex_llm_astream_complete():
+    llm = ClaudeVertexLLM(
+        project_id="sysco-smarter-catalog",
+        region="us-east5",
+        model_name="claude-3-5-sonnet@20240620",
+        max_tokens=1024,
+        system_prompt="",
+    )
+
+    async def stream():
+        responses = []
+        async for response in await llm.astream_complete(
+            prompt="Tell me something interesting!"
+        ):
+            responses.append(response)
+        return responses
+
+    responses = asyncio.run(stream())
+    assert responses
+    assert responses[-1].text == "".join(r.delta for r in responses)
+    assert responses[0].additional_kwargs["time_to_first_token_ms"] > 0
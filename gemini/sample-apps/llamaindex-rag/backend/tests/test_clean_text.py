@@ -0,0 +1,29 @@
+import random
+import re
+import sys
+
+from common.utils import clean_text
+
+
+def reference_clean_text(text):
+    """The original character-by-character implementation"""
+    text = re.sub(r"\s+", " ", text).strip()
+    return "".join(char for char in text if char.isprintable() or char.isspace())
+
+
+def test_clean_text_matches_reference_on_every_code_point():
+    every_char = "".join(chr(c) for c in range(sys.maxunicode + 1))
+    assert clean_text(every_char) == reference_clean_text(every_char)
+
+
+def test_clean_text_matches_reference_on_random_corpus():
+    rng = random.Random(0)
+    alphabet = [chr(c) for c in range(0x3000)] + ["​", "﻿", "\U0001f600"]
+    for _ in range(5000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        assert clean_text(text) == reference_clean_text(text)
+
+
+def test_clean_text_examples():
+    assert clean_text("  Revenue\t\n grew\x00  5%\x0c ") == "Revenue grew 5%"
+    assert clean_text("a \x00 b") == reference_clean_text("a \x00 b") == "a  b"
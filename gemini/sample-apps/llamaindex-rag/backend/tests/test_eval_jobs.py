@@ -0,0 +1,53 @@
+import threading
+
+from backend.app.eval_jobs import CANCELLED, COMPLETED, FAILED, EvalJobManager
+from backend.rag.eval_runner import EvalCancelledError
+
+
+def test_jobs_report_results_and_errors():
+    manager = EvalJobManager(max_concurrent_jobs=2)
+
+    def succeed(job):
+        job.report_progress(1, 1)
+        return {"score": [80]}
+
+    def partial(job):
+        job.report_progress(1, 3)
+        job.failed_rows = {2: "quota exceeded", 0: "timeout"}
+        return {"score": [80]}
+
+    def fail(job):
+        raise RuntimeError("boom")
+
+    ok, broken = manager.submit(succeed), manager.submit(fail)
+    incomplete = manager.submit(partial)
+    for job in (ok, broken, incomplete):
+        job.future.result()
+    assert ok.to_dict(include_result=True)["result"] == {"score": [80]}
+    assert ok.status == COMPLETED and ok.rows_done == 1
+    assert ok.to_dict()["failed_rows"] == {"count": 0, "row_idxs": []}
+    assert broken.status == FAILED and broken.error == "boom"
+    assert incomplete.status == COMPLETED
+    assert incomplete.to_dict(include_result=True)["failed_rows"] == {
+        "count": 2,
+        "row_idxs": [0, 2],
+    }
+
+
+def test_cancel_running_and_queued_jobs():
+    manager = EvalJobManager(max_concurrent_jobs=1)
+    started = threading.Event()
+
+    def wait_for_cancel(job):
+        started.set()
+        job.cancel_event.wait(5)
+        raise EvalCancelledError()
+
+    running = manager.submit(wait_for_cancel)
+    queued = manager.submit(lambda job: {})
+    started.wait(5)
+    assert manager.cancel(queued.job_id).status == CANCELLED
+    manager.cancel(running.job_id)
+    running.future.result()
+    assert running.status == CANCELLED
+    assert manager.get("unknown") is None
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+
+import pandas as pd
+
+from backend.rag.eval_runner import EvalRunner
+
+
+class FakeEvaluator:
+    eval_model = None
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.calls = []
+
+    async def async_eval_question_answer_pair(
+        self, retrieval_qa_func, eval_model, question, ground_truth
+    ):
+        self.calls.append(question)
+        if self.failures.get(question, 0) > 0:
+            self.failures[question] -= 1
+            raise RuntimeError("rate limited")
+        return f"answer to {question}", "80\nlooks right", [ground_truth]
+
+    @staticmethod
+    def extract_score(text):
+        return int(text.splitlines()[0])
+
+
+def make_df(n):
+    return pd.DataFrame(
+        {"question": [f"q{i}" for i in range(n)], "ground_truth": ["gt"] * n}
+    )
+
+
+def test_rows_are_retried_and_failures_skipped():
+    evaluator = FakeEvaluator(failures={"q1": 1, "q2": 5})
+    runner = EvalRunner(
+        evaluator, max_concurrency=2, max_retries=1, retry_backoff_sec=0
+    )
+    result = runner.run(None, make_df(4))
+    assert list(result["question"]) == ["q0", "q1", "q3"]
+    assert list(result["score"]) == [80, 80, 80]
+    assert set(runner.failed_rows) == {2}
+
+
+def test_resume_only_evaluates_missing_rows(tmp_path):
+    batches = []
+    evaluator = FakeEvaluator(failures={"q3": 5})
+    runner = EvalRunner(
+        evaluator,
+        max_retries=0,
+        checkpoint_dir=str(tmp_path),
+        batch_size=2,
+        batch_writer=batches.append,
+    )
+    runner.run(None, make_df(5))
+    assert sum(len(batch) for batch in batches) == 4
+
+    evaluator = FakeEvaluator()
+    result = EvalRunner(evaluator, checkpoint_dir=str(tmp_path)).run(None, make_df(5))
+    assert evaluator.calls == ["q3"]
+    assert list(result["question"]) == [f"q{i}" for i in range(5)]
+    assert result.loc[0, "retrieved_context"] == ["gt"]
+
+
+def test_run_on_server_loop_from_worker_thread():
+    loop = asyncio.new_event_loop()
+    server = threading.Thread(target=loop.run_forever, daemon=True)
+    server.start()
+    loops = []
+
+    class LoopRecordingEvaluator(FakeEvaluator):
+        async def async_eval_question_answer_pair(self, *args):
+            loops.append(asyncio.get_running_loop())
+            return await super().async_eval_question_answer_pair(*args)
+
+    runner = EvalRunner(LoopRecordingEvaluator())
+    result = []
+    worker = threading.Thread(
+        target=lambda: result.append(runner.run(None, make_df(3), loop=loop))
+    )
+    worker.start()
+    worker.join(5)
+    loop.call_soon_threadsafe(loop.stop)
+    assert len(result[0]) == 3
+    assert loops and all(used is loop for used in loops)
@@ -58,3 +58,12 @@ eval_batch_params = [
 def test_eval_batch(client, payload):
     response = client.post("/eval_batch", json=payload)
     assert response.status_code == 200
+
+
+@pytest.mark.parametrize(
+    "override", [{"hyde_num_hypotheses": 0}, {"hyde_latency_budget_sec": 0}]
+)
+def test_query_rag_rejects_invalid_hyde_config(client, override):
+    payload = {**query_rag_params[0], **override}
+    response = client.post("/query_rag", json=payload)
+    assert response.status_code == 422
@@ -0,0 +1,73 @@
+import os
+
+from common import utils
+from common.gcs_sync import GCSSync, local_md5
+import pytest
+
+
+class FakeBlob:
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self.size = len(data)
+        self.md5_hash = None
+        self.downloads = 0
+
+    def download_to_filename(self, path):
+        self.downloads += 1
+        with open(path, "wb") as f:
+            f.write(self.data)
+
+
+class FailingUploadBlob:
+    def upload_from_filename(self, path):
+        raise ConnectionError("upload failed")
+
+
+class FakeBucket:
+    def __init__(self, blobs):
+        self.blobs = blobs
+
+    def blob(self, name):
+        return FailingUploadBlob()
+
+    def list_blobs(self, prefix=None, delimiter=None):
+        return [b for b in self.blobs if b.name.startswith(prefix or "")]
+
+
+class FakeClient:
+    def __init__(self, bucket):
+        self._bucket = bucket
+
+    def bucket(self, name):
+        return self._bucket
+
+
+def test_download_skips_files_with_matching_size_and_md5(tmp_path):
+    blobs = [FakeBlob("raw/a.pdf", b"a" * 10), FakeBlob("raw/b.pdf", b"b" * 20)]
+    sync = GCSSync("bucket", workers=2, client=FakeClient(FakeBucket(blobs)))
+
+    stats = sync.download("raw/", str(tmp_path))
+    assert stats.transferred == 2 and stats.bytes_transferred == 30
+    assert not [f for f in os.listdir(tmp_path / "raw") if f.endswith(".part")]
+
+    for blob in blobs:
+        blob.md5_hash = local_md5(str(tmp_path / blob.name))
+    blobs[1].data = b"c" * 20
+    blobs[1].md5_hash = "changed"
+    stats = sync.download("raw/", str(tmp_path))
+    assert (stats.transferred, stats.skipped) == (1, 1)
+    assert [b.downloads for b in blobs] == [1, 2]
+
+
+def test_upload_directory_raises_on_failed_uploads(tmp_path, monkeypatch, caplog):
+    (tmp_path / "a.json").write_text("{}")
+    client = FakeClient(FakeBucket([]))
+    monkeypatch.setattr(
+        utils,
+        "GCSSync",
+        lambda bucket_name, workers: GCSSync(bucket_name, client=client),
+    )
+    with pytest.raises(RuntimeError, match="prefix/a.json"):
+        utils.upload_directory_to_gcs(str(tmp_path), "bucket", "prefix")
+    assert any(r.levelname == "WARNING" for r in caplog.records)
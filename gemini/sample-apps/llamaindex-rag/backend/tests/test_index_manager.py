@@ -1,6 +1,7 @@
 import os
 
 from backend.rag.index_manager import IndexManager
+from llama_index.core import Settings
 import yaml
 
 # Load configuration from config.yaml
@@ -59,3 +60,29 @@ def test_no_qa_vector_store():
     assert index_manager.qa_index == None
     assert index_manager.qa_endpoint_name == None
     assert index_manager.qa_index_name == None
+
+
+def test_get_vertex_llm_is_request_scoped():
+    index_manager = IndexManager(
+        project_id=PROJECT_ID,
+        location=LOCATION,
+        embeddings_model_name=EMBEDDINGS_MODEL_NAME,
+        base_index_name=VECTOR_INDEX_NAME,
+        base_endpoint_name=INDEX_ENDPOINT_NAME,
+        qa_index_name=None,
+        qa_endpoint_name=None,
+        firestore_db_name=None,
+        firestore_namespace=None,
+        vs_bucket_name=BUCKET_NAME,
+    )
+    global_llm = Settings._llm
+    cold = index_manager.get_vertex_llm(
+        llm_name="gemini-1.5-flash", temperature=0.0, system_prompt="a"
+    )
+    warm = index_manager.get_vertex_llm(
+        llm_name="gemini-1.5-pro", temperature=0.9, system_prompt="b"
+    )
+    assert cold is not warm
+    assert cold.temperature == 0.0
+    assert warm.temperature == 0.9
+    assert Settings._llm is global_llm
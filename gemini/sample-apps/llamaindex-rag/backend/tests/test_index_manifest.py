@@ -0,0 +1,38 @@
+from backend.indexing.index_manifest import IndexManifest, invalidate_manifest
+import pytest
+
+TARGET = {
+    "vector_index": "projects/p/locations/l/indexes/1",
+    "qa_index": "qa",
+    "firestore": "db/namespace",
+    "indexing_method": "hierarchical",
+}
+
+
+def _saved_manifest(path):
+    manifest = IndexManifest(path)
+    manifest.check_target(TARGET, index_is_empty=True)
+    manifest.update("gs://b/a.pdf", "md5", ["s"], ["e"], {"s": ["q"]})
+    manifest.save()
+    return IndexManifest(path)
+
+
+def test_target_is_persisted(tmp_path):
+    manifest = _saved_manifest(str(tmp_path / "manifest.json"))
+    assert manifest.target == TARGET
+    manifest.check_target(TARGET, index_is_empty=False)
+
+
+def test_refuses_manifest_of_other_index(tmp_path):
+    manifest = _saved_manifest(str(tmp_path / "manifest.json"))
+    with pytest.raises(ValueError, match="was written for"):
+        manifest.check_target(TARGET | {"vector_index": "other"}, index_is_empty=False)
+
+
+def test_refuses_empty_manifest_for_populated_index(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    _saved_manifest(path)
+    # A full run invalidates the manifest of the index it writes to
+    invalidate_manifest(path)
+    with pytest.raises(ValueError, match="already contains datapoints"):
+        IndexManifest(path).check_target(TARGET, index_is_empty=False)
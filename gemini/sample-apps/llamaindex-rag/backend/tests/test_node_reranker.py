@@ -0,0 +1,58 @@
+import asyncio
+import re
+
+from backend.rag.node_reranker import CustomLLMRerank
+from llama_index.core import QueryBundle
+from llama_index.core.llms import MockLLM
+from llama_index.core.schema import NodeWithScore, TextNode
+from pydantic import PrivateAttr, ValidationError
+import pytest
+
+
+class RelevanceLLM(MockLLM):
+    """
+    Answers with the relevance written in each node's text. Batches whose
+    first node has a lower index take longer, so they finish last.
+    """
+
+    _in_flight: int = PrivateAttr(default=0)
+    _max_in_flight: int = PrivateAttr(default=0)
+
+    async def apredict(self, prompt, **kwargs) -> str:
+        self._in_flight += 1
+        self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        try:
+            nodes = re.findall(r"node (\d+) relevance (\d+)", kwargs["context_str"])
+            await asyncio.sleep(0.05 / (int(nodes[0][0]) + 1))
+            return "\n".join(
+                f"Doc: {i + 1}, Relevance: {relevance}"
+                for i, (_, relevance) in enumerate(nodes)
+            )
+        finally:
+            self._in_flight -= 1
+
+
+def _nodes(relevances):
+    return [
+        NodeWithScore(node=TextNode(id_=f"n{i}", text=f"node {i} relevance {r}"))
+        for i, r in enumerate(relevances)
+    ]
+
+
+def test_batches_are_scored_concurrently_and_sorted_deterministically():
+    llm = RelevanceLLM()
+    reranker = CustomLLMRerank(llm=llm, choice_batch_size=2, top_n=4, max_concurrency=2)
+    nodes = _nodes([5, 9, 5, 7, 5, 9])
+    reranked = asyncio.run(
+        reranker.postprocess_nodes(nodes, query_bundle=QueryBundle("question"))
+    )
+    # Ties keep the original node order, whichever batch finished first
+    assert [n.node.node_id for n in reranked] == ["n1", "n5", "n3", "n0"]
+    assert [n.score for n in reranked] == [9.0, 9.0, 7.0, 5.0]
+    assert llm._max_in_flight == 2
+
+
+@pytest.mark.parametrize("kwargs", [{"max_concurrency": 0}, {"max_retries": -1}])
+def test_invalid_limits_are_rejected(kwargs):
+    with pytest.raises(ValidationError):
+        CustomLLMRerank(llm=MockLLM(), **kwargs)
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+from backend.rag.postprocessor_pipeline import (
+    PostprocessorPipeline,
+    PostprocessorStage,
+    merge_node_lists,
+)
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+import pytest
+
+
+class TagPostprocessor(BaseNodePostprocessor):
+    """Tags every node in place, optionally dropping some ids"""
+
+    tag: str
+    drop: tuple[str, ...] = ()
+    delay: float = 0.0
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        time.sleep(self.delay)
+        for n in nodes:
+            n.node.metadata["seen_by"] = n.node.metadata.get("seen_by", ()) + (
+                self.tag,
+            )
+            n.node.metadata[self.tag] = True
+        return [n for n in nodes if n.node.node_id not in self.drop]
+
+
+def _nodes(*ids):
+    return [NodeWithScore(node=TextNode(id_=i, text=i), score=1.0) for i in ids]
+
+
+def _run(pipeline, nodes):
+    return asyncio.run(pipeline.run(nodes, QueryBundle("question")))
+
+
+def test_merge_keeps_common_nodes_and_unions_metadata():
+    first = _nodes("a", "b", "c")
+    second = _nodes("c", "a")
+    first[0].node.metadata["x"] = 1
+    second[1].node.metadata["y"] = 2
+    merged = merge_node_lists([first, second])
+    assert [n.node.node_id for n in merged] == ["c", "a"]
+    assert merged[1].node.metadata == {"x": 1, "y": 2}
+    assert first[0].node.metadata == {"x": 1}
+    assert second[1].node.metadata == {"y": 2}
+
+
+def test_dependent_stage_sees_dependency_output():
+    pipeline = PostprocessorPipeline(
+        [
+            PostprocessorStage("second", TagPostprocessor(tag="second"), ("first",)),
+            PostprocessorStage("first", TagPostprocessor(tag="first", drop=("b",))),
+        ]
+    )
+    result = _run(pipeline, _nodes("a", "b"))
+    assert [n.node.node_id for n in result] == ["a"]
+    assert result[0].node.metadata["seen_by"] == ("first", "second")
+
+
+def test_independent_stages_run_concurrently_on_private_copies():
+    nodes = _nodes("a", "b", "c")
+    pipeline = PostprocessorPipeline(
+        [
+            PostprocessorStage(
+                "left", TagPostprocessor(tag="left", drop=("b",), delay=0.3)
+            ),
+            PostprocessorStage(
+                "right", TagPostprocessor(tag="right", drop=("c",), delay=0.3)
+            ),
+        ]
+    )
+    start = time.perf_counter()
+    result = _run(pipeline, nodes)
+    assert time.perf_counter() - start < 0.5
+    assert [n.node.node_id for n in result] == ["a"]
+    assert result[0].node.metadata["left"] and result[0].node.metadata["right"]
+    # Each stage saw only its own tag on its copy of the input
+    assert len(result[0].node.metadata["seen_by"]) == 1
+    assert all(n.node.metadata == {} for n in nodes)
+
+
+def test_chain_runs_in_order():
+    pipeline = PostprocessorPipeline.chain(
+        [TagPostprocessor(tag="one"), TagPostprocessor(tag="two")]
+    )
+    result = _run(pipeline, _nodes("a"))
+    assert result[0].node.metadata["seen_by"] == ("one", "two")
+
+
+def test_invalid_graphs_are_rejected():
+    with pytest.raises(ValueError, match="unknown stage"):
+        PostprocessorPipeline(
+            [PostprocessorStage("a", TagPostprocessor(tag="a"), ("missing",))]
+        )
+    with pytest.raises(ValueError, match="cycle"):
+        PostprocessorPipeline(
+            [
+                PostprocessorStage("a", TagPostprocessor(tag="a"), ("b",)),
+                PostprocessorStage("b", TagPostprocessor(tag="b"), ("a",)),
+            ]
+        )
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+from backend.rag.qa_followup_retriever import QAFollowupRetriever
+from backend.rag.request_metrics import get_request_metrics, start_request_metrics
+from llama_index.core import QueryBundle
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+
+
+class SlowRetriever(BaseRetriever):
+    """Async retriever taking delay seconds, which records its cancellation"""
+
+    def __init__(self, node_id: str, delay: float):
+        self._node_id = node_id
+        self._delay = delay
+        self.cancelled = False
+        super().__init__()
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        raise AssertionError("aretrieve must not use the blocking path")
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        try:
+            await asyncio.sleep(self._delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return [
+            NodeWithScore(
+                node=TextNode(id_=self._node_id, text=self._node_id), score=1.0
+            )
+        ]
+
+
+def _aretrieve(retriever: QAFollowupRetriever):
+    async def run():
+        start_request_metrics()
+        start = time.perf_counter()
+        nodes = await retriever.aretrieve(QueryBundle("question"))
+        return nodes, time.perf_counter() - start, get_request_metrics()
+
+    return asyncio.run(run())
+
+
+def test_branches_overlap():
+    retriever = QAFollowupRetriever(
+        qa_retriever=SlowRetriever("qa", 0.3),
+        base_retriever=SlowRetriever("base", 0.3),
+    )
+    nodes, elapsed, metrics = _aretrieve(retriever)
+    assert {n.node.node_id for n in nodes} == {"qa", "base"}
+    assert elapsed < 0.5
+    assert metrics["base_retriever_ms"] >= 300
+    assert metrics["qa_retriever_ms"] >= 300
+
+
+def test_timed_out_branch_returns_partial_results():
+    qa_retriever = SlowRetriever("qa", 1.0)
+    retriever = QAFollowupRetriever(
+        qa_retriever=qa_retriever,
+        base_retriever=SlowRetriever("base", 0.05),
+        qa_timeout=0.2,
+    )
+    nodes, elapsed, metrics = _aretrieve(retriever)
+    assert [n.node.node_id for n in nodes] == ["base"]
+    # The timed out branch is cancelled rather than left running
+    assert qa_retriever.cancelled
+    assert metrics["qa_retriever_timed_out"] is True
+    assert 200 <= metrics["qa_retriever_ms"] < 900
+    assert "base_retriever_ms" in metrics
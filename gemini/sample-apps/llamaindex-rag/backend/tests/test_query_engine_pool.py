@@ -0,0 +1,41 @@
+from backend.rag.query_engine_pool import QueryEnginePool
+
+
+def test_reuses_engine_on_hit():
+    pool = QueryEnginePool(max_size=2)
+    first = pool.get_or_create(("gemini-1.5-flash", 0.2), object)
+    second = pool.get_or_create(("gemini-1.5-flash", 0.2), object)
+    assert first is second
+    assert pool.stats()["hits"] == 1
+    assert pool.stats()["misses"] == 1
+
+
+def test_evicts_least_recently_used():
+    pool = QueryEnginePool(max_size=2)
+    a = pool.get_or_create("a", object)
+    pool.get_or_create("b", object)
+    pool.get_or_create("a", object)
+    pool.get_or_create("c", object)
+    assert pool.stats()["evictions"] == 1
+    assert pool.get_or_create("a", object) is a
+    assert pool.stats()["size"] == 2
+
+
+def test_clear_invalidates_engines():
+    pool = QueryEnginePool()
+    first = pool.get_or_create("a", object)
+    pool.clear()
+    assert pool.get_or_create("a", object) is not first
+    assert pool.stats()["misses"] == 2
+
+
+def test_clear_during_build_skips_pooling():
+    pool = QueryEnginePool()
+
+    def factory():
+        pool.clear()
+        return object()
+
+    stale = pool.get_or_create("a", factory)
+    assert pool.stats()["size"] == 0
+    assert pool.get_or_create("a", object) is not stale
@@ -0,0 +1,56 @@
+import asyncio
+import sys
+
+from backend.benchmarks.fakes import InMemoryIndexManager, make_queries
+from backend.benchmarks.rag_latency_benchmark import (
+    STUBBED_MODULES,
+    create_app,
+    find_regressions,
+    rag_configs,
+    run_benchmark,
+)
+from backend.rag.prompts import Prompts
+
+
+def test_rag_configs_cover_every_combination():
+    configs = rag_configs("auto_merging", qa_followup=True)
+    assert len(configs) == 8
+    assert configs["baseline"]["use_hyde"] is False
+    assert configs["hyde+rerank+hybrid"]["use_node_rerank"] is True
+
+
+def test_benchmark_runs_offline():
+    index_manager = InMemoryIndexManager(num_docs=3, words_per_doc=300)
+    configs = rag_configs("auto_merging", qa_followup=True)
+    results = asyncio.run(
+        run_benchmark(
+            create_app(index_manager, Prompts()),
+            {label: configs[label] for label in ("baseline", "hyde+rerank+hybrid")},
+            make_queries(5),
+            num_requests=6,
+            concurrency=2,
+            warmup=1,
+        )
+    )
+    for result in results.values():
+        assert result["errors"] == 0
+        assert result["requests"] == 6
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+
+
+def test_create_app_does_not_leak_the_stub():
+    imported = {name for name in STUBBED_MODULES if name in sys.modules}
+    create_app(InMemoryIndexManager(num_docs=1, words_per_doc=10), Prompts())
+    assert {name for name in STUBBED_MODULES if name in sys.modules} == imported
+
+
+def test_find_regressions():
+    baseline = {"hyde": {"p95_ms": 10.0}, "rerank": {"p95_ms": 10.0}}
+    results = {
+        "hyde": {"p95_ms": 11.0},
+        "rerank": {"p95_ms": 13.0},
+        "hybrid": {"p95_ms": 50.0},
+    }
+    assert find_regressions(results, baseline, max_regression=0.2) == [
+        "rerank: p95 10.0 ms -> 13.0 ms"
+    ]
@@ -0,0 +1,102 @@
+import asyncio
+import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import threading
+
+from backend.rag.ranking_client import RankingClient
+import pytest
+
+
+class StubRankingHandler(BaseHTTPRequestHandler):
+    """Scores each record by how often the query appears in its content"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        records = [
+            r | {"score": r["content"].count(body["query"]) / 10}
+            for r in body["records"]
+        ]
+        payload = json.dumps({"records": records}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server_url():
+    server = HTTPServer(("127.0.0.1", 0), StubRankingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_rank_against_stub_server(stub_server_url):
+    client = RankingClient(base_url=stub_server_url, authenticate=False)
+    records = [
+        {"id": "1", "title": "a", "content": "earnings earnings"},
+        {"id": "2", "title": "b", "content": "revenue"},
+    ]
+
+    async def rank_twice():
+        first = await client.rank("earnings", records)
+        second = await client.rank("revenue", records)
+        await client.aclose()
+        return first, second
+
+    first, second = asyncio.run(rank_twice())
+    assert [r["score"] for r in first["records"]] == [0.2, 0.0]
+    assert [r["score"] for r in second["records"]] == [0.0, 0.1]
+    assert client.token_refreshes == 0
+
+
+class FakeCredentials:
+    def __init__(self, expires_in_sec):
+        self.token = None
+        self.expiry = None
+        self.expires_in_sec = expires_in_sec
+
+    def refresh(self, request):
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        self.token = "token"
+        self.expiry = now + datetime.timedelta(seconds=self.expires_in_sec)
+
+
+def _token_refreshes(expires_in_sec, token_refresh_margin_sec):
+    client = RankingClient(token_refresh_margin_sec=token_refresh_margin_sec)
+    client._credentials = FakeCredentials(expires_in_sec)
+
+    async def get_token_twice():
+        await client.get_token()
+        await client.get_token()
+        await client.aclose()
+
+    asyncio.run(get_token_twice())
+    return client.token_refreshes
+
+
+def test_token_cached_outside_refresh_margin():
+    assert _token_refreshes(expires_in_sec=3600, token_refresh_margin_sec=300) == 1
+
+
+def test_token_refreshed_inside_refresh_margin():
+    assert _token_refreshes(expires_in_sec=200, token_refresh_margin_sec=300) == 2
+
+
+def test_rebinding_to_new_loop_closes_old_client(stub_server_url):
+    client = RankingClient(base_url=stub_server_url, authenticate=False)
+    records = [{"id": "1", "title": "a", "content": "earnings"}]
+
+    asyncio.run(client.rank("earnings", records))
+    first_client = client._client
+    asyncio.run(client.rank("earnings", records))
+
+    assert client._client is not first_client
+    assert first_client.is_closed
+    asyncio.run(client.aclose())
@@ -0,0 +1,23 @@
+import asyncio
+import time
+
+from backend.rag.rate_limiter import TokenRateLimiter
+
+
+def test_acquire_waits_once_bucket_is_empty():
+    limiter = TokenRateLimiter(tokens_per_minute=600)  # 10 tokens per second
+
+    async def run():
+        await limiter.acquire(600)
+        start = time.monotonic()
+        await limiter.acquire(2)
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.15
+    assert limiter.waited_sec > 0
+
+
+def test_unlimited_limiter_never_waits():
+    limiter = TokenRateLimiter()
+    asyncio.run(limiter.acquire(10**9))
+    assert limiter.waited_sec == 0
@@ -0,0 +1,27 @@
+import asyncio
+
+from backend.rag.request_metrics import (
+    get_request_metrics,
+    record_metric,
+    start_request_metrics,
+    timed,
+)
+
+
+def test_metrics_recorded_in_child_tasks_are_visible():
+    async def branch(name):
+        with timed(f"{name}_ms"):
+            await asyncio.sleep(0)
+
+    async def handler():
+        start_request_metrics()
+        await asyncio.gather(branch("base"), branch("qa"))
+        return get_request_metrics()
+
+    metrics = asyncio.run(handler())
+    assert set(metrics) == {"base_ms", "qa_ms"}
+
+
+def test_record_metric_outside_request_is_noop():
+    record_metric("ignored", 1)
+    assert get_request_metrics() == {}
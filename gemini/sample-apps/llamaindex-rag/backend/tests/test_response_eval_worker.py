@@ -0,0 +1,32 @@
+from backend.app.response_eval_worker import ResponseEvalWorker
+
+
+def make_record(i, eval_model_name="gemini-1.5-flash"):
+    return {
+        "question": f"q{i}",
+        "answer": f"a{i}",
+        "contexts": ["context"],
+        "eval_model_name": eval_model_name,
+        "embedding_model_name": "text-embedding-004",
+    }
+
+
+def test_queued_responses_are_scored_and_written_in_micro_batches():
+    scored_batches, written = [], []
+
+    def score_fn(records, eval_model_name, embedding_model_name):
+        scored_batches.append((eval_model_name, len(records)))
+        return [{"faithfulness": 1.0} for _ in records]
+
+    worker = ResponseEvalWorker(
+        write_fn=written.append, score_fn=score_fn, batch_size=10, max_wait_sec=0.5
+    )
+    for i in range(4):
+        assert worker.submit(make_record(i))
+    worker.submit(make_record(4, eval_model_name="gemini-1.5-pro"))
+    worker.join()
+
+    assert sorted(scored_batches) == [("gemini-1.5-flash", 4), ("gemini-1.5-pro", 1)]
+    assert sum(len(df) for df in written) == 5 and len(written) == 1
+    assert set(written[0]["faithfulness"]) == {1.0}
+    assert worker.stats()["evaluated"] == 5
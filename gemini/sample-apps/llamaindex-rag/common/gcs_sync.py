@@ -0,0 +1,185 @@
+"""
+Parallel, resumable GCS <-> local directory sync
+"""
+import base64
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from google.cloud import storage
+
+logging.basicConfig(level=logging.INFO)  # Set the desired logging level
+logger = logging.getLogger(__name__)
+
+
+def local_md5(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Base64-encoded MD5 of a local file, in the format GCS reports"""
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode()
+
+
+def is_in_sync(local_path: str, size: int | None, md5_hash: str | None) -> bool:
+    """Whether the local file has the given size and MD5 (size checked first)"""
+    if size is None or md5_hash is None or not os.path.isfile(local_path):
+        return False
+    return os.path.getsize(local_path) == size and local_md5(local_path) == md5_hash
+
+
+@dataclass
+class SyncStats:
+    """Counters of a sync run"""
+
+    transferred: int = 0
+    skipped: int = 0
+    failed: list[str] = field(default_factory=list)
+    bytes_transferred: int = 0
+    elapsed_sec: float = 0.0
+
+    @property
+    def bytes_per_sec(self) -> float:
+        return self.bytes_transferred / self.elapsed_sec if self.elapsed_sec else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.transferred} transferred, {self.skipped} up to date, "
+            f"{len(self.failed)} failed, {self.bytes_transferred} bytes in "
+            f"{self.elapsed_sec:.1f}s ({self.bytes_per_sec / 1e6:.2f} MB/s)"
+        )
+
+
+class GCSSync:
+    """
+    Syncs a GCS prefix and a local directory in either direction.
+    The complete listing is paged through, objects whose size and MD5
+    already match the destination are skipped, and the remaining ones are
+    transferred by a pool of worker threads. Downloads are written to a
+    temporary file and renamed once complete, so after an interruption a
+    re-run only transfers what is missing or changed.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        workers: int = 8,
+        client: storage.Client | None = None,
+        progress_interval_sec: float = 10.0,
+    ):
+        self.bucket = (client or storage.Client()).bucket(bucket_name)
+        self.workers = workers
+        self.progress_interval_sec = progress_interval_sec
+        self._lock = threading.Lock()
+
+    def _run(
+        self, tasks: Iterable[tuple[str, int, Callable[[], bool]]]
+    ) -> SyncStats:
+        """
+        Run (name, size, transfer_fn) tasks on the worker pool. transfer_fn
+        returns False when the object was skipped. At most 2 * workers tasks
+        are queued, so the listing is consumed lazily.
+        """
+        stats = SyncStats()
+        start = last_report = time.monotonic()
+        in_flight: dict[Future, tuple[str, int]] = {}
+
+        def collect(done: set[Future]) -> None:
+            nonlocal last_report
+            for future in done:
+                name, size = in_flight.pop(future)
+                try:
+                    transferred = future.result()
+                except Exception as e:
+                    logger.warning(f"Failed to sync {name} due to exception: {e}")
+                    stats.failed.append(name)
+                    continue
+                if transferred:
+                    stats.transferred += 1
+                    stats.bytes_transferred += size
+                else:
+                    stats.skipped += 1
+            now = time.monotonic()
+            if now - last_report >= self.progress_interval_sec:
+                stats.elapsed_sec = now - start
+                logger.info(f"Sync progress: {stats}")
+                last_report = now
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for name, size, transfer_fn in tasks:
+                if len(in_flight) >= 2 * self.workers:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight[executor.submit(transfer_fn)] = (name, size)
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        stats.elapsed_sec = time.monotonic() - start
+        logger.info(f"Sync finished: {stats}")
+        return stats
+
+    def download(
+        self,
+        prefix: str,
+        destination_directory: str,
+        delimiter: str | None = None,
+    ) -> SyncStats:
+        """Download every object under prefix to destination_directory/<name>"""
+
+        def download_one(blob, local_path: str) -> bool:
+            if is_in_sync(local_path, blob.size, blob.md5_hash):
+                return False
+            with self._lock:
+                os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+            tmp_path = f"{local_path}.part"
+            blob.download_to_filename(tmp_path)
+            os.replace(tmp_path, local_path)
+            return True
+
+        def tasks() -> Iterator[tuple[str, int, Callable[[], bool]]]:
+            # list_blobs pages through the complete listing lazily
+            for blob in self.bucket.list_blobs(prefix=prefix, delimiter=delimiter):
+                if blob.name.endswith("/"):
+                    continue  # "directory" placeholder objects
+                local_path = os.path.join(destination_directory, blob.name)
+                yield (
+                    blob.name,
+                    blob.size or 0,
+                    lambda blob=blob, path=local_path: download_one(blob, path),
+                )
+
+        return self._run(tasks())
+
+    def upload(self, local_dir_path: str, prefix: str) -> SyncStats:
+        """Upload every file under local_dir_path to <prefix>/<relative path>"""
+        remote = {
+            blob.name: (blob.size, blob.md5_hash)
+            for blob in self.bucket.list_blobs(prefix=prefix)
+        }
+
+        def upload_one(local_path: str, blob_name: str) -> bool:
+            size, md5_hash = remote.get(blob_name, (None, None))
+            if is_in_sync(local_path, size, md5_hash):
+                return False
+            self.bucket.blob(blob_name).upload_from_filename(local_path)
+            return True
+
+        def tasks() -> Iterator[tuple[str, int, Callable[[], bool]]]:
+            for root, _, files in os.walk(local_dir_path):
+                for file in files:
+                    local_path = os.path.join(root, file)
+                    relative_path = os.path.relpath(local_path, local_dir_path)
+                    blob_name = f"{prefix}/{relative_path}"
+                    yield (
+                        blob_name,
+                        os.path.getsize(local_path),
+                        lambda p=local_path, n=blob_name: upload_one(p, n),
+                    )
+
+        return self._run(tasks())
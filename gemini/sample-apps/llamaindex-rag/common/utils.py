@@ -19,8 +19,8 @@ GCP Download utilities
 """
 import logging
 import os
-import re
 
+from common.gcs_sync import GCSSync
 from google.cloud import storage
 from llama_index.core.schema import NodeRelationship, RelatedNodeInfo
 import yaml
@@ -43,9 +43,10 @@ DATA_PATH = config["data_path"]
 
 
 class Blob:
-    def __init__(self, path: str, mimetype: str):
+    def __init__(self, path: str, mimetype: str, md5_hash: str | None = None):
         self.path = path
         self.mimetype = mimetype
+        self.md5_hash = md5_hash
 
 
 def download_blob(bucket_name, source_blob_name, destination_file_name):
@@ -82,73 +83,22 @@ def download_bucket_with_transfer_manager(
     delimiter=None,
     destination_directory="",
     workers=8,
-    max_results=1000,
 ):
-    """Download all of the blobs in a bucket, concurrently in a process pool.
+    """Download all of the blobs under a prefix, concurrently in a thread pool.
 
     The filename of each blob once downloaded is derived from the blob name and
-    the `destination_directory `parameter. For complete control of the filename
-    of each blob, use transfer_manager.download_many() instead.
+    the `destination_directory `parameter.
 
     Directories will be created automatically as needed, for instance to
-    accommodate blob names that include slashes.
+    accommodate blob names that include slashes. The complete listing is paged
+    through and files whose size and MD5 already match are skipped, so an
+    interrupted download can be resumed by calling this again. Failed
+    downloads are logged and listed in the failed field of the returned stats.
     """
-
-    # The ID of your GCS bucket
-    # bucket_name = "your-bucket-name"
-
-    # The directory on your computer to which to download all of the files. This
-    # string is prepended (with os.path.join()) to the name of each blob to form
-    # the full path. Relative paths and absolute paths are both accepted. An
-    # empty string means "the current working directory". Note that this
-    # parameter allows accepts directory traversal ("../" etc.) and is not
-    # intended for unsanitized end user input.
-    # destination_directory = ""
-
-    # The maximum number of processes to use for the operation. The performance
-    # impact of this value depends on the use case, but smaller files usually
-    # benefit from a higher number of processes. Each additional process occupies
-    # some CPU and memory resources until finished. Threads can be used instead
-    # of processes by passing `worker_type=transfer_manager.THREAD`.
-    # workers=8
-
-    # The maximum number of results to fetch from bucket.list_blobs(). This
-    # sample code fetches all of the blobs up to max_results and queues them all
-    # for download at once. Though they will still be executed in batches up to
-    # the processes limit, queueing them all at once can be taxing on system
-    # memory if buckets are very large. Adjust max_results as needed for your
-    # system environment, or set it to None if you are sure the bucket is not
-    # too large to hold in memory easily.
-    # max_results=1000
-
-    from google.cloud.storage import transfer_manager
-
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-
-    blob_names = [
-        blob.name
-        for blob in bucket.list_blobs(
-            prefix=prefix, delimiter=delimiter, max_results=max_results
-        )
-    ]
-
-    results = transfer_manager.download_many_to_path(
-        bucket,
-        blob_names,
-        destination_directory=destination_directory,
-        max_workers=workers,
+    return GCSSync(bucket_name, workers=workers).download(
+        prefix, destination_directory, delimiter=delimiter
     )
 
-    for name, result in zip(blob_names, results):
-        # The results list is either `None` or an exception for each blob in
-        # the input list, in order.
-
-        if isinstance(result, Exception):
-            logger.info(f"Failed to download {name} due to exception: {result}")
-        else:
-            logger.info(f"Downloaded {name} to {destination_directory + name}.")
-
 
 def link_nodes(node_list):
     for i, current_node in enumerate(node_list):
@@ -178,25 +128,28 @@ def create_pdf_blob_list(bucket_name, prefix):
         Blob(
             path=f"gs://{bucket_name}/{blob.name}",
             mimetype=blob.content_type or "application/pdf",
+            md5_hash=blob.md5_hash,
         )
         for blob in blobs
         if blob.name.lower().endswith(".pdf")
     ]
 
 
-def upload_directory_to_gcs(local_dir_path: str, bucket_name: str, prefix: str):
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-
-    for root, dirs, files in os.walk(local_dir_path):
-        for file in files:
-            local_file_path = os.path.join(root, file)
-            relative_path = os.path.relpath(local_file_path, local_dir_path)
-            gcs_blob_name = f"{prefix}/{relative_path}"
-
-            blob = bucket.blob(gcs_blob_name)
-            blob.upload_from_filename(local_file_path)
-            print(f"File {local_file_path} uploaded to {gcs_blob_name}")
+def upload_directory_to_gcs(
+    local_dir_path: str, bucket_name: str, prefix: str, workers: int = 8
+):
+    """
+    Upload a local directory concurrently, skipping files whose size and MD5
+    already match the uploaded object. Raises once every file was attempted
+    if any of them failed to upload.
+    """
+    stats = GCSSync(bucket_name, workers=workers).upload(local_dir_path, prefix)
+    if stats.failed:
+        raise RuntimeError(
+            f"Failed to upload {len(stats.failed)} files to gs://{bucket_name}: "
+            f"{', '.join(stats.failed)}"
+        )
+    return stats
 
 
 def clean_text(text):
@@ -204,11 +157,18 @@ def clean_text(text):
     Clean and preprocess the extracted text.
     """
 
-    # Remove extra whitespace
-    text = re.sub(r"\s+", " ", text).strip()
+    # Remove extra whitespace (str.split() splits on the same characters as \s)
+    text = " ".join(text.split())
 
-    # Remove any non-printable characters
-    text = "".join(char for char in text if char.isprintable() or char.isspace())
+    # Remove any non-printable characters. Only " " whitespace is left at this
+    # point, so text that is entirely printable needs no further scan.
+    if not text.isprintable():
+        removed = [char for char in set(text) if not char.isprintable()]
+        if len(removed) <= 32:
+            for char in removed:
+                text = text.replace(char, "")
+        else:
+            text = text.translate(dict.fromkeys(map(ord, removed)))
     print(f"Cleaned text length: {len(text)}")
 
     return text
@@ -74,6 +74,7 @@ def query_fastapi(
     qa_followup,
     hybrid_retrieval,
     evaluate_response,
+    evaluate_in_background,
 ):
     url = f"{config['fastapi_url']}/query_rag"
     payload = {
@@ -89,6 +90,7 @@ def query_fastapi(
         "qa_followup": qa_followup,
         "hybrid_retrieval": hybrid_retrieval,
         "evaluate_response": evaluate_response,
+        "evaluate_in_background": evaluate_in_background,
         "eval_model_name": "gemini-1.5-flash",
         "embedding_model_name": "text-embedding-004",
     }
@@ -315,6 +317,10 @@ use_refine = st.sidebar.checkbox("🔬 Use Refine", value=True)
 use_node_rerank = st.sidebar.checkbox("🔄 Use Node Rerank", value=True)
 use_react = st.sidebar.checkbox("🕵️‍♂️ Use Agent ReAct", value=True)
 evaluate_response = st.sidebar.checkbox("✅ Evaluate Response", value=True)
+# Scores are then written to BigQuery instead of being shown here
+evaluate_in_background = st.sidebar.checkbox(
+    "⏱️ Evaluate in Background", value=False, disabled=not evaluate_response
+)
 
 st.sidebar.markdown("#### Enhancements")
 qa_followup = st.sidebar.checkbox("Query Questions Answered Index", value=True)
@@ -378,6 +384,7 @@ with chat_col:
                             qa_followup,
                             hybrid_retrieval,
                             evaluate_response,
+                            evaluate_in_background,
                         )
 
                         if response is not None:
@@ -386,7 +393,7 @@ with chat_col:
                                 "No response content received from the server.",
                             )
                             st.markdown(assistant_response)
-                            if evaluate_response:
+                            if evaluate_response and not evaluate_in_background:
                                 st.session_state.metrics = {
                                     "Answer Relevancy": response.get(
                                         "answer_relevancy", "N/A"
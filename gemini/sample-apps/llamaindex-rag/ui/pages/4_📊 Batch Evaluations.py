@@ -2,6 +2,7 @@ import json
 import logging
 import os
 from tempfile import NamedTemporaryFile
+import time
 
 import altair as alt
 from google.cloud import storage
@@ -51,28 +52,27 @@ def upload_to_gcs(source_file_name, destination_blob_name):
 
 
 # Function to call the batch evaluation API
-def call_eval_batch_api(payload):
-    url = f"{config['fastapi_url']}/eval_batch"
+def call_eval_batch_api(method, path="", payload=None):
+    url = f"{config['fastapi_url']}/eval_batch{path}"
     headers = {"accept": "application/json", "Content-Type": "application/json"}
 
-    cloud_logger.debug(f"Sending request to {url}")
-    cloud_logger.debug(f"Payload: {json.dumps(payload, indent=2)}")
+    cloud_logger.debug(f"Sending {method} request to {url}")
+    if payload is not None:
+        cloud_logger.debug(f"Payload: {json.dumps(payload, indent=2)}")
     cloud_logger.debug(f"Headers: {headers}")
 
     try:
-        response = requests.post(
-            url, json=payload, headers=headers, timeout=300
-        )  # 5-minute timeout
+        # Jobs run in the background, so every call returns quickly
+        response = requests.request(
+            method, url, json=payload, headers=headers, timeout=30
+        )
         cloud_logger.debug(f"Response Status Code: {response.status_code}")
-        cloud_logger.debug(f"Response Content: {response.text}")
 
         response.raise_for_status()
         return response.json()
     except requests.exceptions.Timeout:
         cloud_logger.error("Request timed out")
-        st.error(
-            "Request timed out. The batch operation might take longer than expected."
-        )
+        st.error("Request timed out.")
     except requests.exceptions.HTTPError as err:
         cloud_logger.error(f"HTTP error occurred: {err}")
         st.error(f"HTTP error occurred: {err}")
@@ -82,6 +82,26 @@ def call_eval_batch_api(payload):
     return None
 
 
+def wait_for_eval_job(job_id, poll_interval_sec=2):
+    """Poll the job, showing its progress, until it has finished"""
+    progress_bar = st.progress(0.0, text="Queued...")
+    while True:
+        job = call_eval_batch_api("GET", f"/{job_id}")
+        if job is None or job["status"] in ("completed", "failed", "cancelled"):
+            progress_bar.empty()
+            return job
+        rows_done = job["progress"]["rows_done"]
+        rows_total = job["progress"]["rows_total"]
+        if job["status"] == "running" and rows_total:
+            progress_bar.progress(
+                rows_done / rows_total,
+                text=f"{job['stage']}: {rows_done}/{rows_total} questions evaluated",
+            )
+        elif job["status"] == "running":
+            progress_bar.progress(0.0, text=f"{job['stage']}...")
+        time.sleep(poll_interval_sec)
+
+
 # Set up Streamlit page configuration
 st.set_page_config(
     layout="wide", page_title="RAG Batch Evaluation", page_icon=":robot_face:"
@@ -130,18 +150,7 @@ st.markdown(
 uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
 if uploaded_file is not None:
     try:
-        # Save the uploaded file to a temporary file
-        with NamedTemporaryFile(delete=False, suffix=".csv") as temp_file:
-            temp_file.write(uploaded_file.getvalue())
-            temp_file_path = temp_file.name
-
-        # Upload the file to GCS
         destination_blob_name = f"batch_eval_{uploaded_file.name}"
-        gcs_uri = upload_to_gcs(temp_file_path, destination_blob_name)
-        st.success(f"File uploaded to {gcs_uri}")
-
-        # Remove the temporary file
-        os.unlink(temp_file_path)
 
         # Prepare the payload for the API call
         payload = {
@@ -154,14 +163,48 @@ if uploaded_file is not None:
             "use_node_rerank": use_node_rerank,
             "eval_model_name": eval_model_name,
             "embedding_model_name": "text-embedding-004",
-            "input_eval_dataset_bucket_uri": gcs_uri,
+            "input_eval_dataset_bucket_uri": f"{BUCKET_NAME}/{destination_blob_name}",
             "bq_eval_results_table_id": "eval_results.eval_results_table",
             "ragas_metrics": ["faithfulness", "answer_relevancy"],
         }
 
-        # Call the API and get the response
-        with st.spinner("Evaluating... This may take a few minutes."):
-            response = call_eval_batch_api(payload)
+        # Streamlit re-runs this script on every interaction, only submit a
+        # new job when the file or the configuration changed
+        job_key = json.dumps(
+            [uploaded_file.name, uploaded_file.size, payload], sort_keys=True
+        )
+        if st.session_state.get("eval_job_key") != job_key:
+            # Save the uploaded file to a temporary file
+            with NamedTemporaryFile(delete=False, suffix=".csv") as temp_file:
+                temp_file.write(uploaded_file.getvalue())
+                temp_file_path = temp_file.name
+
+            # Upload the file to GCS
+            gcs_uri = upload_to_gcs(temp_file_path, destination_blob_name)
+            st.success(f"File uploaded to {gcs_uri}")
+
+            # Remove the temporary file
+            os.unlink(temp_file_path)
+
+            job = call_eval_batch_api("POST", payload=payload)
+            if job is not None:
+                st.session_state["eval_job_key"] = job_key
+                st.session_state["eval_job_id"] = job["job_id"]
+
+        job_id = st.session_state.get("eval_job_id")
+        response = None
+        if job_id is not None:
+            st.caption(f"Evaluation job: {job_id}")
+            if st.button("Cancel evaluation"):
+                call_eval_batch_api("POST", f"/{job_id}/cancel")
+
+            job = wait_for_eval_job(job_id)
+            if job is not None and job["status"] == "completed":
+                response = job["result"]
+            elif job is not None and job["status"] == "failed":
+                st.error(f"Evaluation failed: {job['error']}")
+            elif job is not None and job["status"] == "cancelled":
+                st.warning("Evaluation was cancelled.")
 
         if response:
             st.success("Evaluation completed!")